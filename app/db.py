@@ -1,44 +1,399 @@
-import json
+import atexit
+import logging
 import os
 import sqlite3
 import threading
 import time
+import zlib
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
-_DB_LOCK = threading.Lock()
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_DB_LOCK = threading.RLock()
 _DB_CONN: Optional[sqlite3.Connection] = None
+_TX_OWNER: Optional[int] = None
+_TX_NOW: Optional[float] = None
+_TX_ITEMS_CHANGED = False
+_TX_INVALIDATED: List[Tuple[str, str]] = []
+_TLS = threading.local()
+_READ_CONNS: List[sqlite3.Connection] = []
+_READ_CONNS_LOCK = threading.Lock()
+_GENERATION = 0
+
+_DEDUPE_SEEN: "OrderedDict[str, None]" = OrderedDict()
+_DEDUPE_PENDING: Dict[str, float] = {}
+_DEDUPE_LOCK = threading.Lock()
+_METRIC_COUNTS: Dict[str, Tuple[int, float]] = {}
+_METRIC_LOCK = threading.Lock()
+_FLUSH_LOCK = threading.Lock()
+_FLUSH_WAKE = threading.Event()
+_FLUSH_THREAD: Optional[Tuple[threading.Thread, threading.Event]] = None
+_FLUSH_THREAD_LOCK = threading.Lock()
+_DEDUPE_EXPIRED_AT = 0.0
+_ROW_CACHE: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+_ROW_CACHE_LOCK = threading.Lock()
+_ROW_CACHE_EPOCH = 0
+_ITEMS_VERSION = 0
+_ITEMS_VERSION_LOCK = threading.Lock()
+
+SCHEMA_VERSION = 7
+VECTOR_DTYPE = "float32"
+PAYLOAD_COMPRESSION_LEVEL = 3
+ITER_ARRAYSIZE = 256
+CACHED_STATEMENTS = 512
+SQL_VARIABLE_CHUNK = 999
+DEDUPE_CACHE_SIZE = int(os.getenv("DEDUPE_CACHE_SIZE", "100000"))
+FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "0.2"))
+DEDUPE_RETENTION_SECONDS = float(os.getenv("DEDUPE_RETENTION_SECONDS", "3600"))
+DEDUPE_EXPIRE_INTERVAL = 60.0
+ROW_CACHE_SIZE = 256
+ROW_CACHE_TTL_SECONDS = 300.0
+LABEL_BITS = {"DECISION": 1, "RISK": 2, "BLOCKER": 4, "ACTION": 8, "FYI": 16}
+
+_SQL_INSERT_DEDUPE = "INSERT INTO dedupe_events(event_id, received_at) VALUES (?, ?) ON CONFLICT(event_id) DO NOTHING"
+_SQL_INSERT_RAW_EVENT = "INSERT OR REPLACE INTO raw_events(event_id, received_at, payload) VALUES (?, ?, ?)"
+_SQL_INSERT_MESSAGE = """
+INSERT INTO messages
+(channel, ts, thread_ts, user, text, reactions_json, reaction_count, is_deleted, edited_at, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(channel, ts) DO NOTHING
+"""
+_SQL_INCREMENT_METRIC = """
+INSERT INTO job_metrics(queue_name, processed_count, last_processed_at)
+VALUES (?, ?, ?)
+ON CONFLICT(queue_name) DO UPDATE SET
+    processed_count=processed_count + excluded.processed_count,
+    last_processed_at=excluded.last_processed_at
+"""
+_SQL_UPSERT_ROLE = """
+INSERT INTO roles(role_id, name, description, role_vector_json, role_vector, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(role_id) DO UPDATE SET
+    name=excluded.name,
+    description=excluded.description,
+    role_vector_json=excluded.role_vector_json,
+    role_vector=excluded.role_vector,
+    updated_at=excluded.updated_at
+"""
+
+
+def _adapt_json(value: Any) -> str:
+    return orjson.dumps(value).decode()
+
+
+# Lists and dicts bound as parameters are stored as JSON text. No converter is
+# registered, so *_json columns still read back as str.
+sqlite3.register_adapter(dict, _adapt_json)
+sqlite3.register_adapter(list, _adapt_json)
 
 
 def get_db_path() -> str:
     return os.getenv("DATABASE_PATH", "./app.db")
 
 
-def get_db() -> sqlite3.Connection:
+def _configure_connection(conn: sqlite3.Connection, path: str) -> None:
+    # WAL lets readers proceed during writes and, with synchronous=NORMAL,
+    # only fsyncs on checkpoint instead of on every commit.
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA busy_timeout=5000")
+
+
+def get_write_conn() -> sqlite3.Connection:
     global _DB_CONN
-    if _DB_CONN is None:
-        _DB_CONN = sqlite3.connect(get_db_path(), check_same_thread=False)
-        _DB_CONN.row_factory = sqlite3.Row
-    return _DB_CONN
+    # Autocommit: single statements commit on their own, and multi-statement
+    # work is grouped explicitly by write_transaction.
+    conn = _DB_CONN
+    if conn is not None:
+        return conn
+    with _DB_LOCK:
+        if _DB_CONN is None:
+            path = get_db_path()
+            conn = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None, cached_statements=CACHED_STATEMENTS
+            )
+            conn.row_factory = sqlite3.Row
+            _configure_connection(conn, path)
+            _DB_CONN = conn
+        return _DB_CONN
+
+
+def get_read_conn() -> sqlite3.Connection:
+    conn = getattr(_TLS, "conn", None)
+    if conn is not None and getattr(_TLS, "generation", None) == _GENERATION:
+        return conn
+    path = get_db_path()
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    _configure_connection(conn, path)
+    conn.execute("PRAGMA query_only=1")
+    with _READ_CONNS_LOCK:
+        _READ_CONNS.append(conn)
+    _TLS.conn = conn
+    _TLS.generation = _GENERATION
+    return conn
 
 
 def reset_db() -> None:
-    global _DB_CONN
-    if _DB_CONN is not None:
-        _DB_CONN.close()
-        _DB_CONN = None
+    global _DB_CONN, _GENERATION
+    # The flusher writes through the shared connection, so it is joined
+    # before anything is closed.
+    stop_flusher()
+    with _FLUSH_LOCK:
+        if _DB_CONN is not None:
+            _flush_dedupe_locked()
+            _flush_metrics_locked()
+        with _DEDUPE_LOCK:
+            _DEDUPE_SEEN.clear()
+            _DEDUPE_PENDING.clear()
+        with _METRIC_LOCK:
+            _METRIC_COUNTS.clear()
+    with _ROW_CACHE_LOCK:
+        _ROW_CACHE.clear()
+    _bump_items_version()
+    with _DB_LOCK, _READ_CONNS_LOCK:
+        _GENERATION += 1
+        for conn in _READ_CONNS:
+            conn.close()
+        _READ_CONNS.clear()
+        if _DB_CONN is not None:
+            _DB_CONN.close()
+            _DB_CONN = None
+
+
+def _in_transaction() -> bool:
+    return _TX_OWNER == threading.get_ident()
+
+
+def _now() -> float:
+    # Writes inside one transaction share a single timestamp.
+    if _in_transaction():
+        return _TX_NOW
+    return time.time()
+
+
+@contextmanager
+def read_cursor():
+    # An in-memory database is private to its connection, and an open write
+    # transaction is only visible to the writer, so both read through it.
+    if _use_writer_for_reads():
+        conn = get_write_conn()
+        with _DB_LOCK:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+        return
+    cur = get_read_conn().cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+
+@contextmanager
+def write_cursor():
+    conn = get_write_conn()
+    with _DB_LOCK:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
 
 
 @contextmanager
-def db_cursor():
-    conn = get_db()
+def write_transaction():
+    global _TX_OWNER, _TX_NOW, _TX_ITEMS_CHANGED
+    conn = get_write_conn()
     with _DB_LOCK:
+        if _in_transaction():
+            # Nested blocks become savepoints so a failure can be undone
+            # without discarding the enclosing transaction's earlier work.
+            cur = conn.cursor()
+            cur.execute("SAVEPOINT nested")
+            try:
+                yield cur
+                cur.execute("RELEASE nested")
+            except BaseException:
+                cur.execute("ROLLBACK TO nested")
+                cur.execute("RELEASE nested")
+                raise
+            finally:
+                cur.close()
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        _TX_OWNER = threading.get_ident()
+        _TX_NOW = time.time()
         cur = conn.cursor()
         try:
             yield cur
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
         finally:
+            _TX_OWNER = None
+            _TX_NOW = None
             cur.close()
+            if _TX_INVALIDATED:
+                invalidated = list(_TX_INVALIDATED)
+                _TX_INVALIDATED.clear()
+                for table, key in invalidated:
+                    _invalidate_row(table, key)
+            if _TX_ITEMS_CHANGED:
+                _TX_ITEMS_CHANGED = False
+                _bump_items_version()
+
+
+db_cursor = write_cursor
+
+
+def flush_pending() -> None:
+    global _DEDUPE_EXPIRED_AT
+    with _FLUSH_LOCK:
+        _flush_dedupe_locked()
+        _flush_metrics_locked()
+        now = time.time()
+        if _DB_CONN is not None and now - _DEDUPE_EXPIRED_AT >= DEDUPE_EXPIRE_INTERVAL:
+            _DEDUPE_EXPIRED_AT = now
+            expire_dedupe(now - DEDUPE_RETENTION_SECONDS)
+
+
+def _background_flusher(stop: threading.Event) -> None:
+    while not stop.is_set():
+        _FLUSH_WAKE.wait()
+        if stop.wait(FLUSH_INTERVAL):
+            return
+        _FLUSH_WAKE.clear()
+        try:
+            flush_pending()
+        except Exception:
+            logger.exception("background flush failed")
+
+
+def _schedule_flush() -> None:
+    global _FLUSH_THREAD
+    with _FLUSH_THREAD_LOCK:
+        if _FLUSH_THREAD is None or not _FLUSH_THREAD[0].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(target=_background_flusher, args=(stop,), name="db-flusher", daemon=True)
+            thread.start()
+            _FLUSH_THREAD = (thread, stop)
+    _FLUSH_WAKE.set()
+
+
+def stop_flusher() -> None:
+    # Stops and joins the flusher thread; anything it had not written yet is
+    # left pending for the caller (or the next flush) to persist.
+    global _FLUSH_THREAD
+    with _FLUSH_THREAD_LOCK:
+        flusher = _FLUSH_THREAD
+        _FLUSH_THREAD = None
+        if flusher is None:
+            return
+        flusher[1].set()
+        _FLUSH_WAKE.set()
+    flusher[0].join()
+
+
+atexit.register(flush_pending)
+
+
+def _iter_rows(sql: str, params: Sequence[Any] = ()) -> Iterator[sqlite3.Row]:
+    with read_cursor() as cur:
+        cur.arraysize = ITER_ARRAYSIZE
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+
+def _use_writer_for_reads() -> bool:
+    return _in_transaction() or get_db_path() == ":memory:"
+
+
+def _fetch_one(sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+    if _use_writer_for_reads():
+        with _DB_LOCK:
+            return get_write_conn().execute(sql, params).fetchone()
+    return get_read_conn().execute(sql, params).fetchone()
+
+
+def _fetch_value(sql: str, params: Sequence[Any] = ()) -> Any:
+    # Plain tuple rows: internal lookups that need one column skip sqlite3.Row.
+    if _use_writer_for_reads():
+        with _DB_LOCK:
+            cur = get_write_conn().cursor()
+            cur.row_factory = None
+            row = cur.execute(sql, params).fetchone()
+    else:
+        cur = get_read_conn().cursor()
+        cur.row_factory = None
+        row = cur.execute(sql, params).fetchone()
+    return row[0] if row is not None else None
+
+
+def _fetch_all(sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+    if _use_writer_for_reads():
+        with _DB_LOCK:
+            return get_write_conn().execute(sql, params).fetchall()
+    return get_read_conn().execute(sql, params).fetchall()
+
+
+def _execute(sql: str, params: Union[Sequence[Any], Dict[str, Any]] = ()) -> None:
+    conn = get_write_conn()
+    with _DB_LOCK:
+        conn.execute(sql, params)
+
+
+def _cached_row(table: str, key: str, load: Callable[[], Any]) -> Any:
+    # Roles, phases, projects, project channels and workspaces change rarely
+    # but are read on every retrieval, digest and Slack call. Rows read inside a transaction are not cached because
+    # the transaction may still roll back.
+    now = time.monotonic()
+    with _ROW_CACHE_LOCK:
+        entry = _ROW_CACHE.get((table, key))
+        if entry is not None and entry[0] > now:
+            _ROW_CACHE.move_to_end((table, key))
+            return entry[1]
+        epoch = _ROW_CACHE_EPOCH
+    row = load()
+    if row is not None and not _in_transaction():
+        with _ROW_CACHE_LOCK:
+            # An invalidation while the row was loading means it may already
+            # be stale, so it is returned without being cached.
+            if epoch != _ROW_CACHE_EPOCH:
+                return row
+            _ROW_CACHE[(table, key)] = (now + ROW_CACHE_TTL_SECONDS, row)
+            _ROW_CACHE.move_to_end((table, key))
+            if len(_ROW_CACHE) > ROW_CACHE_SIZE:
+                _ROW_CACHE.popitem(last=False)
+    return row
+
+
+def _invalidate_row(table: str, key: str) -> None:
+    global _ROW_CACHE_EPOCH
+    # Inside a transaction other threads still read the old committed row, so
+    # the entry is dropped again once the outermost transaction ends.
+    if _in_transaction():
+        _TX_INVALIDATED.append((table, key))
+    with _ROW_CACHE_LOCK:
+        _ROW_CACHE_EPOCH += 1
+        _ROW_CACHE.pop((table, key), None)
 
 
 def init_db() -> None:
@@ -53,7 +408,7 @@ def init_db() -> None:
         CREATE TABLE IF NOT EXISTS raw_events (
             event_id TEXT PRIMARY KEY,
             received_at REAL,
-            payload_json TEXT
+            payload BLOB
         )
         """,
         """
@@ -64,9 +419,11 @@ def init_db() -> None:
             user TEXT,
             text TEXT,
             reactions_json TEXT,
+            reaction_count INTEGER NOT NULL DEFAULT 0,
             is_deleted INTEGER DEFAULT 0,
             edited_at REAL,
             created_at REAL,
+            ts_real REAL GENERATED ALWAYS AS (CAST(ts AS REAL)) VIRTUAL,
             PRIMARY KEY (channel, ts)
         )
         """,
@@ -98,7 +455,9 @@ def init_db() -> None:
         CREATE TABLE IF NOT EXISTS embeddings (
             thread_ts TEXT PRIMARY KEY,
             dim INTEGER,
-            vector_json TEXT,
+            dtype TEXT,
+            vector BLOB,
+            text_hash BLOB,
             updated_at REAL
         )
         """,
@@ -115,6 +474,7 @@ def init_db() -> None:
             name TEXT,
             description TEXT,
             role_vector_json TEXT,
+            role_vector BLOB,
             updated_at REAL
         )
         """,
@@ -123,6 +483,7 @@ def init_db() -> None:
             phase_key TEXT PRIMARY KEY,
             description TEXT,
             phase_vector_json TEXT,
+            phase_vector BLOB,
             updated_at REAL
         )
         """,
@@ -143,6 +504,7 @@ def init_db() -> None:
             email TEXT,
             role_id TEXT,
             user_vector_json TEXT,
+            user_vector BLOB,
             created_at REAL,
             updated_at REAL
         )
@@ -216,40 +578,272 @@ def init_db() -> None:
             delivered_at REAL,
             status TEXT,
             slack_ts TEXT,
-            error TEXT
+            error TEXT,
+            project_id TEXT
         )
         """,
+        """
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_threads_last_activity ON threads(last_activity DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_digest_items_updated_at ON digest_items(updated_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_raw_events_received_at ON raw_events(received_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_dedupe_events_received_at ON dedupe_events(received_at)",
+        "CREATE INDEX IF NOT EXISTS idx_digests_project ON digests(project_id, digest_id)",
     ]
-    with db_cursor() as cur:
-        for stmt in schema_statements:
-            cur.execute(stmt)
-        _ensure_messages_columns(cur)
+    conn = get_write_conn()
+    with _DB_LOCK:
+        try:
+            conn.executescript("BEGIN;\n" + ";\n".join(schema_statements) + ";\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with write_transaction() as cur:
+            _ensure_messages_columns(cur)
+            _ensure_embeddings_columns(cur)
+            _ensure_raw_events_columns(cur)
+            _ensure_deliveries_columns(cur)
+            _ensure_profile_vector_columns(cur)
+            _ensure_digest_items_columns(cur)
+            cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
 
 
 def _ensure_messages_columns(cur: sqlite3.Cursor) -> None:
-    cur.execute("PRAGMA table_info(messages)")
+    cur.execute("PRAGMA table_xinfo(messages)")
     existing = {row[1] for row in cur.fetchall()}
     if "is_deleted" not in existing:
         cur.execute("ALTER TABLE messages ADD COLUMN is_deleted INTEGER DEFAULT 0")
     if "edited_at" not in existing:
         cur.execute("ALTER TABLE messages ADD COLUMN edited_at REAL")
+    if "ts_real" not in existing:
+        cur.execute("ALTER TABLE messages ADD COLUMN ts_real REAL GENERATED ALWAYS AS (CAST(ts AS REAL)) VIRTUAL")
+    if "reaction_count" not in existing:
+        cur.execute("ALTER TABLE messages ADD COLUMN reaction_count INTEGER NOT NULL DEFAULT 0")
+        cur.execute(
+            """
+            UPDATE messages SET reaction_count = COALESCE((
+                SELECT SUM(CAST(COALESCE(json_extract(r.value, '$.count'), 1) AS INTEGER))
+                FROM json_each(reactions_json) r
+            ), 0)
+            WHERE json_valid(reactions_json)
+            """
+        )
+    cur.execute("DROP INDEX IF EXISTS idx_messages_thread_ts")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_thread_ts_real ON messages(thread_ts, ts_real)")
 
 
-def insert_raw_event(event_id: str, payload: Dict[str, Any]) -> None:
-    with db_cursor() as cur:
+def _ensure_embeddings_columns(cur: sqlite3.Cursor) -> None:
+    cur.execute("PRAGMA table_info(embeddings)")
+    existing = {row[1] for row in cur.fetchall()}
+    if "text_hash" not in existing:
+        cur.execute("ALTER TABLE embeddings ADD COLUMN text_hash BLOB")
+    if "vector" in existing:
+        return
+    cur.execute("ALTER TABLE embeddings ADD COLUMN dtype TEXT")
+    cur.execute("ALTER TABLE embeddings ADD COLUMN vector BLOB")
+    cur.execute(
+        """
+        SELECT thread_ts, vector_json
+        FROM embeddings WHERE vector_json IS NOT NULL
+        """
+    )
+    # Retrieval scores with a bare dot product, so legacy vectors are
+    # normalized on the way into the packed column.
+    rows = [
+        (VECTOR_DTYPE, pack_vector(_unit(orjson.loads(row["vector_json"]))), row["thread_ts"])
+        for row in cur.fetchall()
+    ]
+    cur.executemany("UPDATE embeddings SET dtype = ?, vector = ?, vector_json = NULL WHERE thread_ts = ?", rows)
+
+
+def _ensure_raw_events_columns(cur: sqlite3.Cursor) -> None:
+    cur.execute("PRAGMA table_info(raw_events)")
+    existing = {row[1] for row in cur.fetchall()}
+    if "payload" in existing:
+        return
+    cur.execute("ALTER TABLE raw_events ADD COLUMN payload BLOB")
+    cur.execute(
+        """
+        SELECT event_id, payload_json
+        FROM raw_events WHERE payload_json IS NOT NULL
+        """
+    )
+    rows = [(pack_payload(orjson.loads(row["payload_json"])), row["event_id"]) for row in cur.fetchall()]
+    cur.executemany("UPDATE raw_events SET payload = ?, payload_json = NULL WHERE event_id = ?", rows)
+
+
+def _ensure_profile_vector_columns(cur: sqlite3.Cursor) -> None:
+    for table, column in (("roles", "role_vector"), ("phases", "phase_vector"), ("users", "user_vector")):
+        cur.execute(f"PRAGMA table_info({table})")
+        if column in {row[1] for row in cur.fetchall()}:
+            continue
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} BLOB")
+        cur.execute(f"SELECT rowid, {column}_json FROM {table} WHERE {column}_json IS NOT NULL")
+        rows = [(_vector_blob(row[1]), row[0]) for row in cur.fetchall()]
+        cur.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", rows)
+
+
+def _ensure_digest_items_columns(cur: sqlite3.Cursor) -> None:
+    cur.execute("PRAGMA table_info(digest_items)")
+    if "labels_mask" in {row[1] for row in cur.fetchall()}:
+        return
+    cur.execute("ALTER TABLE digest_items ADD COLUMN labels_mask INTEGER NOT NULL DEFAULT 0")
+    cur.execute("SELECT thread_ts, labels_json FROM digest_items WHERE labels_json IS NOT NULL")
+    rows = [(labels_mask(orjson.loads(row["labels_json"])), row["thread_ts"]) for row in cur.fetchall()]
+    cur.executemany("UPDATE digest_items SET labels_mask = ? WHERE thread_ts = ?", rows)
+
+
+def _ensure_deliveries_columns(cur: sqlite3.Cursor) -> None:
+    cur.execute("PRAGMA table_info(digest_deliveries)")
+    existing = {row[1] for row in cur.fetchall()}
+    if "project_id" not in existing:
+        cur.execute("ALTER TABLE digest_deliveries ADD COLUMN project_id TEXT")
         cur.execute(
-            "INSERT OR REPLACE INTO raw_events(event_id, received_at, payload_json) VALUES (?, ?, ?)",
-            (event_id, time.time(), json.dumps(payload)),
+            """
+            UPDATE digest_deliveries SET project_id = (
+                SELECT project_id FROM digests WHERE digests.digest_id = digest_deliveries.digest_id
+            )
+            """
         )
+    cur.execute("DROP INDEX IF EXISTS idx_deliveries_lookup")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_del_schedule ON digest_deliveries(team_id, user_id, project_id, delivered_at DESC)"
+    )
+
+
+def labels_mask(labels: Iterable[str]) -> int:
+    mask = 0
+    for label in labels:
+        mask |= LABEL_BITS.get(label, 0)
+    return mask
+
+
+def pack_vector(vector: Union[np.ndarray, Sequence[float]]) -> sqlite3.Binary:
+    # ndarray inputs already in VECTOR_DTYPE are written without an element-wise copy.
+    return sqlite3.Binary(np.ascontiguousarray(vector, dtype=VECTOR_DTYPE).data)
+
+
+def unpack_vector(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=VECTOR_DTYPE)
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    values = np.asarray(vector, dtype=VECTOR_DTYPE)
+    norm = np.linalg.norm(values)
+    return values / norm if norm else values
+
+
+def _vector_blob(vector_json: Optional[str]) -> Optional[sqlite3.Binary]:
+    # Profile vectors keep their JSON column for API readers; the packed copy
+    # is what the query and feedback paths read.
+    return pack_vector(orjson.loads(vector_json)) if vector_json else None
+
+
+def pack_payload(payload: Any) -> sqlite3.Binary:
+    # Bytes are taken to be an already-encoded JSON document, such as a
+    # request body, and are compressed as-is.
+    data = payload if isinstance(payload, bytes) else orjson.dumps(payload)
+    return sqlite3.Binary(zlib.compress(data, PAYLOAD_COMPRESSION_LEVEL))
+
+
+def unpack_payload(blob: bytes) -> Any:
+    return orjson.loads(zlib.decompress(blob))
+
+
+def insert_raw_events_bulk(rows: Iterable[Tuple[str, Union[bytes, Dict[str, Any]]]]) -> None:
+    now = _now()
+    params = [(event_id, now, pack_payload(payload)) for event_id, payload in rows]
+    with write_transaction() as cur:
+        cur.executemany(_SQL_INSERT_RAW_EVENT, params)
+
+
+def insert_raw_event(event_id: str, payload: Union[bytes, Dict[str, Any]]) -> None:
+    insert_raw_events_bulk([(event_id, payload)])
+
+
+def _remember_dedupe(event_id: str) -> None:
+    _DEDUPE_SEEN[event_id] = None
+    if len(_DEDUPE_SEEN) > DEDUPE_CACHE_SIZE:
+        _DEDUPE_SEEN.popitem(last=False)
+
+
+def _dedupe_persisted(event_id: str) -> bool:
+    return _fetch_value("SELECT 1 FROM dedupe_events WHERE event_id = ?", (event_id,)) is not None
+
+
+def _flush_dedupe_locked() -> None:
+    with _DEDUPE_LOCK:
+        batch = list(_DEDUPE_PENDING.items())
+    if not batch:
+        return
+    with write_transaction() as cur:
+        cur.executemany(_SQL_INSERT_DEDUPE, batch)
+    with _DEDUPE_LOCK:
+        for event_id, _ in batch:
+            _DEDUPE_PENDING.pop(event_id, None)
+
+
+def flush_dedupe() -> None:
+    with _FLUSH_LOCK:
+        _flush_dedupe_locked()
+
+
+def expire_dedupe(older_than: float) -> None:
+    # Slack only retries deliveries for a few minutes, so old ids are dropped
+    # to keep the table and its primary key index small.
+    _execute("DELETE FROM dedupe_events WHERE received_at < ?", (older_than,))
 
 
 def insert_dedupe(event_id: str) -> bool:
-    with db_cursor() as cur:
-        cur.execute(
-            "INSERT OR IGNORE INTO dedupe_events(event_id, received_at) VALUES (?, ?)",
-            (event_id, time.time()),
-        )
-        return cur.rowcount == 1
+    # Seen ids are answered from memory; new ids are persisted in batches by
+    # the flusher thread, so SQLite is only read on a cache miss.
+    with _DEDUPE_LOCK:
+        if event_id in _DEDUPE_SEEN:
+            _DEDUPE_SEEN.move_to_end(event_id)
+            return False
+        if event_id in _DEDUPE_PENDING:
+            _remember_dedupe(event_id)
+            return False
+    if _dedupe_persisted(event_id):
+        with _DEDUPE_LOCK:
+            _remember_dedupe(event_id)
+        return False
+    with _DEDUPE_LOCK:
+        if event_id in _DEDUPE_SEEN or event_id in _DEDUPE_PENDING:
+            return False
+        _remember_dedupe(event_id)
+        _DEDUPE_PENDING[event_id] = _now()
+    _schedule_flush()
+    return True
+
+
+def _reaction_total(reactions_json: Optional[str]) -> int:
+    if not reactions_json:
+        return 0
+    try:
+        return sum(int(reaction.get("count", 1)) for reaction in orjson.loads(reactions_json))
+    except (orjson.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return 0
+
+
+def insert_messages_bulk(
+    rows: Iterable[Tuple[str, str, str, Optional[str], Optional[str], Optional[str]]],
+) -> int:
+    now = _now()
+    params = [
+        (channel, ts, thread_ts, user, text, reactions_json, _reaction_total(reactions_json), 0, None, now)
+        for channel, ts, thread_ts, user, text, reactions_json in rows
+    ]
+    with write_transaction() as cur:
+        before = cur.connection.total_changes
+        cur.executemany(_SQL_INSERT_MESSAGE, params)
+        return cur.connection.total_changes - before
 
 
 def insert_message(
@@ -260,99 +854,142 @@ def insert_message(
     text: Optional[str],
     reactions_json: Optional[str],
 ) -> bool:
-    with db_cursor() as cur:
+    with write_cursor() as cur:
         cur.execute(
-            """
-            INSERT OR IGNORE INTO messages
-            (channel, ts, thread_ts, user, text, reactions_json, is_deleted, edited_at, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (channel, ts, thread_ts, user, text, reactions_json, 0, None, time.time()),
+            _SQL_INSERT_MESSAGE + "RETURNING 1",
+            (channel, ts, thread_ts, user, text, reactions_json, _reaction_total(reactions_json), 0, None, _now()),
         )
-        return cur.rowcount == 1
+        return cur.fetchone() is not None
 
 
-def get_messages_for_thread(thread_ts: str) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT * FROM messages WHERE thread_ts = ? ORDER BY CAST(ts AS REAL) ASC",
-            (thread_ts,),
-        )
-        rows = cur.fetchall()
-    return rows
+def iter_messages_for_thread(thread_ts: str) -> Iterator[sqlite3.Row]:
+    return _iter_rows(
+        """
+        SELECT channel, ts, thread_ts, user, text, reactions_json, is_deleted, edited_at, created_at
+        FROM messages WHERE thread_ts = ? ORDER BY ts_real ASC
+        """,
+        (thread_ts,),
+    )
+
+
+def get_messages_for_thread(thread_ts: str) -> List[sqlite3.Row]:
+    return list(iter_messages_for_thread(thread_ts))
+
+
+def get_messages_for_threads(thread_tss: Sequence[str]) -> Dict[str, List[sqlite3.Row]]:
+    keys = list(dict.fromkeys(thread_tss))
+    grouped: Dict[str, List[sqlite3.Row]] = {key: [] for key in keys}
+    for start in range(0, len(keys), SQL_VARIABLE_CHUNK):
+        chunk = keys[start : start + SQL_VARIABLE_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        for row in _iter_rows(
+            f"SELECT thread_ts, user, text FROM messages WHERE thread_ts IN ({placeholders}) ORDER BY ts_real ASC",
+            chunk,
+        ):
+            grouped[row["thread_ts"]].append(row)
+    return grouped
 
 
 def fetch_message(channel: str, ts: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM messages WHERE channel = ? AND ts = ?", (channel, ts))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT channel, ts, thread_ts, user, text, reactions_json, is_deleted, edited_at, created_at
+        FROM messages WHERE channel = ? AND ts = ?
+        """,
+        (channel, ts),
+    )
 
 
 def update_message_text(channel: str, ts: str, text: Optional[str]) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            UPDATE messages SET text = ?, edited_at = ?, is_deleted = 0 WHERE channel = ? AND ts = ?
-            """,
-            (text, time.time(), channel, ts),
-        )
+    _execute(
+        """
+        UPDATE messages SET text = ?, edited_at = ?, is_deleted = 0 WHERE channel = ? AND ts = ?
+        """,
+        (text, _now(), channel, ts),
+    )
 
 
 def mark_message_deleted(channel: str, ts: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            UPDATE messages SET is_deleted = 1, edited_at = ? WHERE channel = ? AND ts = ?
-            """,
-            (time.time(), channel, ts),
-        )
+    _execute(
+        """
+        UPDATE messages SET is_deleted = 1, edited_at = ? WHERE channel = ? AND ts = ?
+        """,
+        (_now(), channel, ts),
+    )
 
 
-def update_message_reactions(channel: str, ts: str, reaction: str, delta: int) -> None:
-    row = fetch_message(channel, ts)
-    if row is None:
-        return
-    reactions_json = row["reactions_json"] or "[]"
-    try:
-        reactions = json.loads(reactions_json)
-    except json.JSONDecodeError:
-        reactions = []
-    updated = False
-    for entry in reactions:
-        if entry.get("name") == reaction:
-            entry["count"] = max(0, int(entry.get("count", 0)) + delta)
-            updated = True
-            break
-    if not updated and delta > 0:
-        reactions.append({"name": reaction, "count": 1})
-    reactions = [r for r in reactions if int(r.get("count", 0)) > 0]
-    with db_cursor() as cur:
+def update_message_reactions(channel: str, ts: str, reaction: str, delta: int) -> Optional[str]:
+    # Applied in one statement with JSON1 so concurrent reaction events
+    # cannot interleave a read-modify-write of the same row. Returns the
+    # message's thread_ts, or None when the message is unknown.
+    with write_cursor() as cur:
         cur.execute(
             """
-            UPDATE messages SET reactions_json = ? WHERE channel = ? AND ts = ?
+            WITH current AS (
+                SELECT key, value FROM json_each(
+                    (SELECT CASE WHEN json_valid(reactions_json) THEN reactions_json ELSE '[]' END
+                     FROM messages WHERE channel = :channel AND ts = :ts)
+                )
+            ),
+            updated AS (
+                SELECT key, json_set(
+                    value,
+                    '$.count',
+                    MAX(0, COALESCE(json_extract(value, '$.count'), 0)
+                        + CASE WHEN json_extract(value, '$.name') = :name THEN :delta ELSE 0 END)
+                ) AS value
+                FROM current
+                UNION ALL
+                SELECT (SELECT COUNT(*) FROM current), json_object('name', :name, 'count', 1)
+                WHERE :delta > 0 AND NOT EXISTS (
+                    SELECT 1 FROM current WHERE json_extract(value, '$.name') = :name
+                )
+            )
+            UPDATE messages SET reactions_json = (
+                SELECT json_group_array(json(value))
+                FROM (SELECT value FROM updated ORDER BY key)
+                WHERE json_extract(value, '$.count') > 0
+            ), reaction_count = (
+                SELECT COALESCE(SUM(json_extract(value, '$.count')), 0)
+                FROM updated WHERE json_extract(value, '$.count') > 0
+            )
+            WHERE channel = :channel AND ts = :ts
+            RETURNING thread_ts
             """,
-            (json.dumps(reactions), channel, ts),
+            {"channel": channel, "ts": ts, "name": reaction, "delta": delta},
         )
+        row = cur.fetchone()
+    return row[0] if row else None
 
 
 def get_thread(thread_ts: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM threads WHERE thread_ts = ?", (thread_ts,))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants_json
+        FROM threads WHERE thread_ts = ?
+        """,
+        (thread_ts,),
+    )
 
 
-def upsert_thread(
-    thread_ts: str,
-    channel: str,
-    root_ts: str,
-    created_at: float,
-    last_activity: float,
-    reply_count: int,
-    reaction_count: int,
-    participants: Iterable[str],
+def upsert_threads_bulk(
+    rows: Iterable[Tuple[str, str, str, float, float, int, int, Iterable[str]]],
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
+    params = [
+        (
+            thread_ts,
+            channel,
+            root_ts,
+            created_at,
+            last_activity,
+            reply_count,
+            reaction_count,
+            sorted(set(participants)),
+        )
+        for thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants in rows
+    ]
+    with write_transaction() as cur:
+        cur.executemany(
             """
             INSERT INTO threads
             (thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants_json)
@@ -363,19 +1000,74 @@ def upsert_thread(
                 reaction_count=excluded.reaction_count,
                 participants_json=excluded.participants_json
             """,
-            (
-                thread_ts,
-                channel,
-                root_ts,
-                created_at,
-                last_activity,
-                reply_count,
-                reaction_count,
-                json.dumps(sorted(set(participants))),
-            ),
+            params,
         )
 
 
+def upsert_thread(
+    thread_ts: str,
+    channel: str,
+    root_ts: str,
+    created_at: float,
+    last_activity: float,
+    reply_count: int,
+    reaction_count: int,
+    participants: Iterable[str],
+) -> None:
+    upsert_threads_bulk(
+        [(thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants)]
+    )
+
+
+def refresh_thread_stats(thread_ts: str, channel: str, root_ts: str, created_at: float) -> None:
+    # Aggregates the thread's messages and upserts the row in one statement,
+    # so the stats never round-trip through Python. Threads without messages
+    # produce no row and are left untouched.
+    _execute(
+        """
+        INSERT INTO threads
+        (thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants_json)
+        SELECT
+            ?, ?, ?, ?,
+            COALESCE(MAX(ts_real), 0.0),
+            COALESCE(SUM(COALESCE(is_deleted, 0) = 0 AND ts != thread_ts), 0),
+            COALESCE(SUM(CASE WHEN COALESCE(is_deleted, 0) = 0 THEN reaction_count END), 0),
+            (
+                SELECT json_group_array(user) FROM (
+                    SELECT DISTINCT user FROM messages
+                    WHERE thread_ts = ? AND COALESCE(is_deleted, 0) = 0 AND user IS NOT NULL AND user != ''
+                    ORDER BY user
+                )
+            )
+        FROM messages WHERE thread_ts = ?
+        HAVING COUNT(*) > 0
+        ON CONFLICT(thread_ts) DO UPDATE SET
+            last_activity=excluded.last_activity,
+            reply_count=excluded.reply_count,
+            reaction_count=excluded.reaction_count,
+            participants_json=excluded.participants_json
+        """,
+        (thread_ts, channel, root_ts, created_at, thread_ts, thread_ts),
+    )
+
+
+def items_version() -> int:
+    # Bumped whenever digest items or embeddings change (and on reset), so
+    # callers can key derived rankings on it.
+    return _ITEMS_VERSION
+
+
+def _bump_items_version() -> None:
+    global _ITEMS_VERSION, _TX_ITEMS_CHANGED
+    # Inside a transaction the bump waits for the commit, so a reader never
+    # caches uncommitted state under the new version.
+    if _in_transaction():
+        _TX_ITEMS_CHANGED = True
+        return
+    with _ITEMS_VERSION_LOCK:
+        _ITEMS_VERSION += 1
+
+
 def upsert_digest_item(
     thread_ts: str,
     channel: str,
@@ -385,249 +1077,405 @@ def upsert_digest_item(
     urgency: float,
     summary: str,
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO digest_items
-            (thread_ts, channel, title, labels_json, entities_json, urgency, summary, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(thread_ts) DO UPDATE SET
-                title=excluded.title,
-                labels_json=excluded.labels_json,
-                entities_json=excluded.entities_json,
-                urgency=excluded.urgency,
-                summary=excluded.summary,
-                updated_at=excluded.updated_at
-            """,
-            (
-                thread_ts,
-                channel,
-                title,
-                json.dumps(sorted(set(labels))),
-                json.dumps(entities),
-                urgency,
-                summary,
-                time.time(),
-            ),
-        )
+    labels = sorted(set(labels))
+    _execute(
+        """
+        INSERT INTO digest_items
+        (thread_ts, channel, title, labels_json, labels_mask, entities_json, urgency, summary, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(thread_ts) DO UPDATE SET
+            title=excluded.title,
+            labels_json=excluded.labels_json,
+            labels_mask=excluded.labels_mask,
+            entities_json=excluded.entities_json,
+            urgency=excluded.urgency,
+            summary=excluded.summary,
+            updated_at=excluded.updated_at
+        """,
+        (thread_ts, channel, title, labels, labels_mask(labels), dict(entities), urgency, summary, _now()),
+    )
+    _bump_items_version()
 
 
-def upsert_embedding(thread_ts: str, dim: int, vector: Iterable[float]) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO embeddings(thread_ts, dim, vector_json, updated_at)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(thread_ts) DO UPDATE SET
-                dim=excluded.dim,
-                vector_json=excluded.vector_json,
-                updated_at=excluded.updated_at
-            """,
-            (thread_ts, dim, json.dumps(list(vector)), time.time()),
-        )
+def upsert_embedding(
+    thread_ts: str,
+    dim: int,
+    vector: Union[np.ndarray, Sequence[float]],
+    text_hash: Optional[bytes] = None,
+) -> None:
+    blob = pack_vector(vector)
+    _execute(
+        """
+        INSERT INTO embeddings(thread_ts, dim, dtype, vector, text_hash, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(thread_ts) DO UPDATE SET
+            dim=excluded.dim,
+            dtype=excluded.dtype,
+            vector=excluded.vector,
+            text_hash=excluded.text_hash,
+            updated_at=excluded.updated_at
+        """,
+        (thread_ts, dim, VECTOR_DTYPE, blob, text_hash, _now()),
+    )
+    _bump_items_version()
+
+
+def fetch_embedding_thread_ts() -> List[str]:
+    return [row[0] for row in _fetch_all("SELECT thread_ts FROM embeddings")]
+
+
+def fetch_embedding_version() -> int:
+    # Databases written before the version was recorded hold vectors from an
+    # older bucketing, so a missing value reads as 0.
+    value = _fetch_value("SELECT value FROM app_meta WHERE key = 'embedding_version'")
+    return int(value) if value is not None else 0
+
+
+def set_embedding_version(version: int) -> None:
+    _execute(
+        """
+        INSERT INTO app_meta(key, value) VALUES ('embedding_version', ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """,
+        (str(version),),
+    )
+
+
+def fetch_embedding_text_hash(thread_ts: str) -> Optional[bytes]:
+    return _fetch_value("SELECT text_hash FROM embeddings WHERE thread_ts = ?", (thread_ts,))
+
+
+def _flush_metrics_locked() -> None:
+    with _METRIC_LOCK:
+        batch = [(name, count, last_at) for name, (count, last_at) in _METRIC_COUNTS.items()]
+        _METRIC_COUNTS.clear()
+    if not batch:
+        return
+    try:
+        with write_transaction() as cur:
+            cur.executemany(_SQL_INCREMENT_METRIC, batch)
+    except BaseException:
+        with _METRIC_LOCK:
+            for name, count, last_at in batch:
+                pending, pending_at = _METRIC_COUNTS.get(name, (0, last_at))
+                _METRIC_COUNTS[name] = (pending + count, max(pending_at, last_at))
+        raise
+
+
+def flush_metrics() -> None:
+    with _FLUSH_LOCK:
+        _flush_metrics_locked()
 
 
 def increment_metric(queue_name: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO job_metrics(queue_name, processed_count, last_processed_at)
-            VALUES (?, ?, ?)
-            ON CONFLICT(queue_name) DO UPDATE SET
-                processed_count=processed_count + 1,
-                last_processed_at=excluded.last_processed_at
-            """,
-            (queue_name, 1, time.time()),
-        )
+    # Counts accumulate in memory and are folded into job_metrics by the
+    # background flusher; fetch_metrics flushes first so reads stay exact.
+    now = _now()
+    with _METRIC_LOCK:
+        count, _ = _METRIC_COUNTS.get(queue_name, (0, now))
+        _METRIC_COUNTS[queue_name] = (count + 1, now)
+    _schedule_flush()
 
 
-def fetch_raw_events(limit: int) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT * FROM raw_events ORDER BY received_at DESC LIMIT ?",
-            (limit,),
-        )
-        return cur.fetchall()
+def iter_raw_events(limit: int) -> Iterator[sqlite3.Row]:
+    return _iter_rows(
+        """
+        SELECT event_id, received_at, payload
+        FROM raw_events ORDER BY received_at DESC LIMIT ?
+        """,
+        (limit,),
+    )
 
 
-def fetch_threads(limit: int) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT * FROM threads ORDER BY last_activity DESC LIMIT ?",
-            (limit,),
-        )
-        return cur.fetchall()
+def fetch_raw_events(limit: int) -> List[sqlite3.Row]:
+    return list(iter_raw_events(limit))
 
 
-def fetch_items(limit: int) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT * FROM digest_items ORDER BY updated_at DESC LIMIT ?",
-            (limit,),
-        )
-        return cur.fetchall()
+def fetch_raw_event_ids(limit: int) -> Iterable[sqlite3.Row]:
+    return _fetch_all(
+        """
+        SELECT event_id, received_at
+        FROM raw_events ORDER BY received_at DESC LIMIT ?
+        """,
+        (limit,),
+    )
+
+
+def fetch_raw_event_payload(event_id: str) -> Optional[sqlite3.Row]:
+    return _fetch_one(
+        """
+        SELECT event_id, received_at, payload
+        FROM raw_events WHERE event_id = ?
+        """,
+        (event_id,),
+    )
+
+
+def iter_threads(limit: int) -> Iterator[sqlite3.Row]:
+    return _iter_rows(
+        """
+        SELECT thread_ts, channel, root_ts, created_at, last_activity, reply_count, reaction_count, participants_json
+        FROM threads ORDER BY last_activity DESC LIMIT ?
+        """,
+        (limit,),
+    )
+
+
+def fetch_threads(limit: int) -> List[sqlite3.Row]:
+    return list(iter_threads(limit))
+
+
+def fetch_thread_summaries(limit: int) -> Iterable[sqlite3.Row]:
+    return _fetch_all(
+        """
+        SELECT thread_ts, channel, last_activity, reply_count, reaction_count
+        FROM threads ORDER BY last_activity DESC LIMIT ?
+        """,
+        (limit,),
+    )
+
+
+def iter_items(limit: int) -> Iterator[sqlite3.Row]:
+    return _iter_rows(
+        """
+        SELECT thread_ts, channel, title, labels_json, entities_json, urgency, summary, updated_at
+        FROM digest_items ORDER BY updated_at DESC LIMIT ?
+        """,
+        (limit,),
+    )
+
+
+def fetch_items(limit: int) -> List[sqlite3.Row]:
+    return list(iter_items(limit))
+
+
+def fetch_items_matching(limit: int, summary_contains: str) -> List[sqlite3.Row]:
+    # instr() keeps Python's case-sensitive `in` semantics, unlike LIKE.
+    return _fetch_all(
+        """
+        SELECT thread_ts, channel, title, labels_json, entities_json, urgency, summary, updated_at
+        FROM digest_items WHERE instr(summary, ?) > 0
+        ORDER BY updated_at DESC LIMIT ?
+        """,
+        (summary_contains, limit),
+    )
+
+
+def fetch_latest_item() -> Optional[sqlite3.Row]:
+    return _fetch_one(
+        """
+        SELECT thread_ts, channel, title, labels_json, entities_json, urgency, summary, updated_at
+        FROM digest_items ORDER BY updated_at DESC LIMIT 1
+        """
+    )
 
 
 def fetch_embedding(thread_ts: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM embeddings WHERE thread_ts = ?", (thread_ts,))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT thread_ts, dim, dtype, vector, updated_at
+        FROM embeddings WHERE thread_ts = ?
+        """,
+        (thread_ts,),
+    )
 
 
 def fetch_metrics() -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM job_metrics")
-        return cur.fetchall()
+    flush_metrics()
+    return _fetch_all(
+        """
+        SELECT queue_name, processed_count, last_processed_at
+        FROM job_metrics
+        """,
+    )
 
 
 def upsert_role(role_id: str, name: str, description: str, role_vector: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
+    _execute(_SQL_UPSERT_ROLE, (role_id, name, description, role_vector, _vector_blob(role_vector), _now()))
+    _invalidate_row("roles", role_id)
+
+
+def upsert_roles_bulk(rows: Iterable[Tuple[str, str, str, str]]) -> None:
+    with write_transaction() as cur:
+        now = _now()
+        params = [
+            (role_id, name, description, role_vector, _vector_blob(role_vector), now)
+            for role_id, name, description, role_vector in rows
+        ]
+        cur.executemany(_SQL_UPSERT_ROLE, params)
+    for role_id, *_ in params:
+        _invalidate_row("roles", role_id)
+
+
+def fetch_role(role_id: str) -> Optional[sqlite3.Row]:
+    return _cached_row(
+        "roles",
+        role_id,
+        lambda: _fetch_one(
             """
-            INSERT INTO roles(role_id, name, description, role_vector_json, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(role_id) DO UPDATE SET
-                name=excluded.name,
-                description=excluded.description,
-                role_vector_json=excluded.role_vector_json,
-                updated_at=excluded.updated_at
+            SELECT role_id, name, description, role_vector_json, role_vector, updated_at
+            FROM roles WHERE role_id = ?
             """,
-            (role_id, name, description, role_vector, time.time()),
-        )
+            (role_id,),
+        ),
+    )
 
 
-def fetch_role(role_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM roles WHERE role_id = ?", (role_id,))
-        return cur.fetchone()
+def fetch_roles() -> List[sqlite3.Row]:
+    return _fetch_all("SELECT role_id, name, description FROM roles")
 
 
 def upsert_phase(phase_key: str, description: str, phase_vector: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
+    _execute(
+        """
+        INSERT INTO phases(phase_key, description, phase_vector_json, phase_vector, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(phase_key) DO UPDATE SET
+            description=excluded.description,
+            phase_vector_json=excluded.phase_vector_json,
+            phase_vector=excluded.phase_vector,
+            updated_at=excluded.updated_at
+        """,
+        (phase_key, description, phase_vector, _vector_blob(phase_vector), _now()),
+    )
+    _invalidate_row("phases", phase_key)
+
+
+def fetch_phase(phase_key: str) -> Optional[sqlite3.Row]:
+    return _cached_row(
+        "phases",
+        phase_key,
+        lambda: _fetch_one(
             """
-            INSERT INTO phases(phase_key, description, phase_vector_json, updated_at)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(phase_key) DO UPDATE SET
-                description=excluded.description,
-                phase_vector_json=excluded.phase_vector_json,
-                updated_at=excluded.updated_at
+            SELECT phase_key, description, phase_vector_json, phase_vector, updated_at
+            FROM phases WHERE phase_key = ?
             """,
-            (phase_key, description, phase_vector, time.time()),
-        )
+            (phase_key,),
+        ),
+    )
 
 
-def fetch_phase(phase_key: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM phases WHERE phase_key = ?", (phase_key,))
-        return cur.fetchone()
+def fetch_phases() -> List[sqlite3.Row]:
+    return _fetch_all("SELECT phase_key, description FROM phases")
 
 
 def upsert_project(project_id: str, name: str, current_phase: str, channels_json: str) -> None:
-    now = time.time()
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO projects(project_id, name, current_phase, channels_json, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(project_id) DO UPDATE SET
-                name=excluded.name,
-                current_phase=excluded.current_phase,
-                channels_json=excluded.channels_json,
-                updated_at=excluded.updated_at
-            """,
-            (project_id, name, current_phase, channels_json, now, now),
-        )
+    now = _now()
+    _execute(
+        """
+        INSERT INTO projects(project_id, name, current_phase, channels_json, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(project_id) DO UPDATE SET
+            name=excluded.name,
+            current_phase=excluded.current_phase,
+            channels_json=excluded.channels_json,
+            updated_at=excluded.updated_at
+        """,
+        (project_id, name, current_phase, channels_json, now, now),
+    )
+    _invalidate_row("projects", project_id)
 
 
 def update_project_phase(project_id: str, phase_key: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            UPDATE projects SET current_phase = ?, updated_at = ? WHERE project_id = ?
-            """,
-            (phase_key, time.time(), project_id),
-        )
+    _execute(
+        """
+        UPDATE projects SET current_phase = ?, updated_at = ? WHERE project_id = ?
+        """,
+        (phase_key, _now(), project_id),
+    )
+    _invalidate_row("projects", project_id)
 
 
 def fetch_project(project_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,))
-        return cur.fetchone()
+    return _cached_row(
+        "projects",
+        project_id,
+        lambda: _fetch_one(
+            """
+            SELECT project_id, name, current_phase, channels_json, created_at, updated_at
+            FROM projects WHERE project_id = ?
+            """,
+            (project_id,),
+        ),
+    )
 
 
 def upsert_user(user_id: str, name: str, email: Optional[str], role_id: Optional[str], user_vector: Optional[str]) -> None:
-    now = time.time()
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO users(user_id, name, email, role_id, user_vector_json, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                name=excluded.name,
-                email=excluded.email,
-                role_id=excluded.role_id,
-                user_vector_json=excluded.user_vector_json,
-                updated_at=excluded.updated_at
-            """,
-            (user_id, name, email, role_id, user_vector, now, now),
-        )
+    now = _now()
+    _execute(
+        """
+        INSERT INTO users(user_id, name, email, role_id, user_vector_json, user_vector, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            name=excluded.name,
+            email=excluded.email,
+            role_id=excluded.role_id,
+            user_vector_json=excluded.user_vector_json,
+            user_vector=excluded.user_vector,
+            updated_at=excluded.updated_at
+        """,
+        (user_id, name, email, role_id, user_vector, _vector_blob(user_vector), now, now),
+    )
 
 
 def update_user_role(user_id: str, role_id: str, user_vector: Optional[str]) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            UPDATE users SET role_id = ?, user_vector_json = ?, updated_at = ? WHERE user_id = ?
-            """,
-            (role_id, user_vector, time.time(), user_id),
-        )
+    _execute(
+        """
+        UPDATE users SET role_id = ?, user_vector_json = ?, user_vector = ?, updated_at = ? WHERE user_id = ?
+        """,
+        (role_id, user_vector, _vector_blob(user_vector), _now(), user_id),
+    )
 
 
 def fetch_user(user_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT user_id, name, email, role_id, user_vector_json, user_vector, created_at, updated_at
+        FROM users WHERE user_id = ?
+        """,
+        (user_id,),
+    )
 
 
 def add_user_project(user_id: str, project_id: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO user_project(user_id, project_id) VALUES (?, ?)
-            """,
-            (user_id, project_id),
-        )
+    _execute(
+        """
+        INSERT OR IGNORE INTO user_project(user_id, project_id) VALUES (?, ?)
+        """,
+        (user_id, project_id),
+    )
 
 
 def fetch_user_projects(user_id: str) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT p.* FROM projects p
-            JOIN user_project up ON up.project_id = p.project_id
-            WHERE up.user_id = ?
-            """,
-            (user_id,),
-        )
-        return cur.fetchall()
+    return _fetch_all(
+        """
+        SELECT p.project_id, p.name, p.current_phase, p.channels_json, p.created_at, p.updated_at
+        FROM projects p
+        JOIN user_project up ON up.project_id = p.project_id
+        WHERE up.user_id = ?
+        """,
+        (user_id,),
+    )
 
 
 def insert_digest(digest_id: str, user_id: str, project_id: str, items_json: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO digests(digest_id, user_id, project_id, created_at, items_json)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (digest_id, user_id, project_id, time.time(), items_json),
-        )
+    _execute(
+        """
+        INSERT INTO digests(digest_id, user_id, project_id, created_at, items_json)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (digest_id, user_id, project_id, _now(), items_json),
+    )
 
 
 def fetch_digest(digest_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM digests WHERE digest_id = ?", (digest_id,))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT digest_id, user_id, project_id, created_at, items_json
+        FROM digests WHERE digest_id = ?
+        """,
+        (digest_id,),
+    )
 
 
 def insert_interaction(
@@ -637,24 +1485,37 @@ def insert_interaction(
     thread_ts: str,
     action: str,
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO interactions(interaction_id, user_id, project_id, thread_ts, action, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (interaction_id, user_id, project_id, thread_ts, action, time.time()),
-        )
+    _execute(
+        """
+        INSERT INTO interactions(interaction_id, user_id, project_id, thread_ts, action, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (interaction_id, user_id, project_id, thread_ts, action, _now()),
+    )
+
+
+def fetch_user_roles() -> List[sqlite3.Row]:
+    return _fetch_all("SELECT user_id, role_id FROM users")
+
+
+def fetch_interactions_for_user(user_id: str) -> List[sqlite3.Row]:
+    return _fetch_all(
+        """
+        SELECT thread_ts, action, created_at
+        FROM interactions WHERE user_id = ?
+        ORDER BY created_at, rowid
+        """,
+        (user_id,),
+    )
 
 
 def update_user_vector(user_id: str, user_vector_json: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            UPDATE users SET user_vector_json = ?, updated_at = ? WHERE user_id = ?
-            """,
-            (user_vector_json, time.time(), user_id),
-        )
+    _execute(
+        """
+        UPDATE users SET user_vector_json = ?, user_vector = ?, updated_at = ? WHERE user_id = ?
+        """,
+        (user_vector_json, _vector_blob(user_vector_json), _now(), user_id),
+    )
 
 
 def upsert_slack_workspace(
@@ -663,67 +1524,76 @@ def upsert_slack_workspace(
     bot_user_id: str,
     scopes_json: str,
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO slack_workspaces(team_id, access_token, bot_user_id, installed_at, scopes_json)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(team_id) DO UPDATE SET
-                access_token=excluded.access_token,
-                bot_user_id=excluded.bot_user_id,
-                installed_at=excluded.installed_at,
-                scopes_json=excluded.scopes_json
-            """,
-            (team_id, access_token, bot_user_id, time.time(), scopes_json),
-        )
+    _execute(
+        """
+        INSERT INTO slack_workspaces(team_id, access_token, bot_user_id, installed_at, scopes_json)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(team_id) DO UPDATE SET
+            access_token=excluded.access_token,
+            bot_user_id=excluded.bot_user_id,
+            installed_at=excluded.installed_at,
+            scopes_json=excluded.scopes_json
+        """,
+        (team_id, access_token, bot_user_id, _now(), scopes_json),
+    )
+    _invalidate_row("slack_workspaces", team_id)
 
 
 def fetch_slack_workspace(team_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM slack_workspaces WHERE team_id = ?", (team_id,))
-        return cur.fetchone()
+    return _cached_row(
+        "slack_workspaces",
+        team_id,
+        lambda: _fetch_one(
+            """
+            SELECT team_id, access_token, bot_user_id, installed_at, scopes_json
+            FROM slack_workspaces WHERE team_id = ?
+            """,
+            (team_id,),
+        ),
+    )
 
 
 def add_project_channel(project_id: str, channel_id: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO project_channels(project_id, channel_id) VALUES (?, ?)
-            """,
-            (project_id, channel_id),
-        )
+    _execute(
+        """
+        INSERT OR IGNORE INTO project_channels(project_id, channel_id) VALUES (?, ?)
+        """,
+        (project_id, channel_id),
+    )
+    _invalidate_row("project_channels", project_id)
 
 
 def add_user_channel(user_id: str, channel_id: str) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO user_channels(user_id, channel_id) VALUES (?, ?)
-            """,
-            (user_id, channel_id),
-        )
+    _execute(
+        """
+        INSERT OR IGNORE INTO user_channels(user_id, channel_id) VALUES (?, ?)
+        """,
+        (user_id, channel_id),
+    )
 
 
 def fetch_project_channels(project_id: str) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT channel_id FROM project_channels WHERE project_id = ?
-            """,
-            (project_id,),
-        )
-        return cur.fetchall()
+    return _cached_row(
+        "project_channels",
+        project_id,
+        lambda: tuple(
+            _fetch_all(
+                """
+                SELECT channel_id FROM project_channels WHERE project_id = ?
+                """,
+                (project_id,),
+            )
+        ),
+    )
 
 
 def fetch_user_channels(user_id: str) -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT channel_id FROM user_channels WHERE user_id = ?
-            """,
-            (user_id,),
-        )
-        return cur.fetchall()
+    return _fetch_all(
+        """
+        SELECT channel_id FROM user_channels WHERE user_id = ?
+        """,
+        (user_id,),
+    )
 
 
 def insert_schedule(
@@ -734,26 +1604,42 @@ def insert_schedule(
     cron_json: str,
     is_enabled: int,
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO digest_schedules(schedule_id, team_id, project_id, user_id, cron_json, is_enabled, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (schedule_id, team_id, project_id, user_id, cron_json, is_enabled, time.time()),
-        )
+    _execute(
+        """
+        INSERT INTO digest_schedules(schedule_id, team_id, project_id, user_id, cron_json, is_enabled, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (schedule_id, team_id, project_id, user_id, cron_json, is_enabled, _now()),
+    )
 
 
 def fetch_schedules() -> Iterable[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM digest_schedules")
-        return cur.fetchall()
+    return _fetch_all(
+        """
+        SELECT schedule_id, team_id, project_id, user_id, cron_json, is_enabled, created_at
+        FROM digest_schedules
+        """,
+    )
+
+
+def fetch_schedule(schedule_id: str) -> Optional[sqlite3.Row]:
+    return _fetch_one(
+        """
+        SELECT schedule_id, team_id, project_id, user_id, cron_json, is_enabled, created_at
+        FROM digest_schedules WHERE schedule_id = ?
+        """,
+        (schedule_id,),
+    )
 
 
 def fetch_delivery_by_digest(digest_id: str) -> Optional[sqlite3.Row]:
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM digest_deliveries WHERE digest_id = ?", (digest_id,))
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT delivery_id, digest_id, team_id, user_id, delivered_at, status, slack_ts, error, project_id
+        FROM digest_deliveries WHERE digest_id = ?
+        """,
+        (digest_id,),
+    )
 
 
 def insert_delivery(
@@ -765,27 +1651,24 @@ def insert_delivery(
     slack_ts: Optional[str],
     error: Optional[str],
 ) -> None:
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO digest_deliveries(delivery_id, digest_id, team_id, user_id, delivered_at, status, slack_ts, error)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (delivery_id, digest_id, team_id, user_id, time.time(), status, slack_ts, error),
-        )
+    _execute(
+        """
+        INSERT INTO digest_deliveries
+        (delivery_id, digest_id, team_id, user_id, delivered_at, status, slack_ts, error, project_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT project_id FROM digests WHERE digest_id = ?))
+        """,
+        (delivery_id, digest_id, team_id, user_id, _now(), status, slack_ts, error, digest_id),
+    )
 
 
 def fetch_latest_delivery_for_schedule(team_id: str, project_id: str, user_id: str, now_utc: float, tz_name: str) -> Optional[sqlite3.Row]:
-    # Find latest delivery for user/project/team by digest join on digests table
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT dd.* FROM digest_deliveries dd
-            JOIN digests d ON d.digest_id = dd.digest_id
-            WHERE dd.team_id = ? AND dd.user_id = ? AND d.project_id = ?
-            ORDER BY dd.delivered_at DESC
-            LIMIT 1
-            """,
-            (team_id, user_id, project_id),
-        )
-        return cur.fetchone()
+    return _fetch_one(
+        """
+        SELECT delivery_id, digest_id, team_id, user_id, delivered_at, status, slack_ts, error, project_id
+        FROM digest_deliveries
+        WHERE team_id = ? AND user_id = ? AND project_id = ?
+        ORDER BY delivered_at DESC
+        LIMIT 1
+        """,
+        (team_id, user_id, project_id),
+    )
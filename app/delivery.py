@@ -1,10 +1,18 @@
-import json
-import uuid
-from typing import Any, Dict, List
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
 
 from app import db
+from app.ids import new_id
 from app.slack import slack_api_call
 
+DELIVERY_CONCURRENCY = 20
+DM_CHANNEL_TTL_SECONDS = 24 * 60 * 60
+
+_DM_CHANNELS: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
 
 def _format_message(items: List[Dict[str, Any]]) -> str:
     lines = ["Daily Digest"]
@@ -15,13 +23,14 @@ def _format_message(items: List[Dict[str, Any]]) -> str:
     return "\n".join(lines)
 
 
+_HEADER_BLOCK = {
+    "type": "section",
+    "text": {"type": "mrkdwn", "text": "*Daily Digest*"},
+}
+
+
 def _format_blocks(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    blocks = [
-        {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": "*Daily Digest*"},
-        }
-    ]
+    blocks = [_HEADER_BLOCK]
     for item in items:
         title = item.get("title") or "Untitled"
         why = item.get("why_shown", "")
@@ -34,6 +43,19 @@ def _format_blocks(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return blocks
 
 
+async def _open_dm_channel(team_id: str, user_id: str) -> Optional[str]:
+    key = (team_id, user_id)
+    now = time.time()
+    cached = _DM_CHANNELS.get(key)
+    if cached is not None and now - cached[1] < DM_CHANNEL_TTL_SECONDS:
+        return cached[0]
+    open_resp = await slack_api_call(team_id, "conversations.open", {"users": user_id})
+    channel_id = open_resp.get("channel", {}).get("id")
+    if channel_id:
+        _DM_CHANNELS[key] = (channel_id, now)
+    return channel_id
+
+
 async def deliver_digest(digest_id: str, team_id: str, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
     existing = db.fetch_delivery_by_digest(digest_id)
     if existing is not None:
@@ -41,19 +63,35 @@ async def deliver_digest(digest_id: str, team_id: str, user_id: str, items: List
 
     message = _format_message(items)
     blocks = _format_blocks(items)
-    delivery_id = f"del-{uuid.uuid4().hex}"
+    delivery_id = new_id("del")
+    params = {"text": message, "blocks": orjson.dumps(blocks).decode()}
     try:
         # Open or fetch DM channel
-        open_resp = await slack_api_call(team_id, "conversations.open", {"users": user_id})
-        channel_id = open_resp.get("channel", {}).get("id")
-        resp = await slack_api_call(
-            team_id,
-            "chat.postMessage",
-            {"channel": channel_id, "text": message, "blocks": json.dumps(blocks)},
-        )
+        channel_id = await _open_dm_channel(team_id, user_id)
+        resp = await slack_api_call(team_id, "chat.postMessage", {"channel": channel_id, **params})
+        if resp.get("error") == "channel_not_found":
+            # The cached DM channel went away; open a fresh one and retry once.
+            _DM_CHANNELS.pop((team_id, user_id), None)
+            channel_id = await _open_dm_channel(team_id, user_id)
+            resp = await slack_api_call(team_id, "chat.postMessage", {"channel": channel_id, **params})
+        if resp.get("error"):
+            db.insert_delivery(delivery_id, digest_id, team_id, user_id, "failed", None, resp["error"])
+            return {"status": "failed", "delivery_id": delivery_id}
         slack_ts = resp.get("ts")
         db.insert_delivery(delivery_id, digest_id, team_id, user_id, "delivered", slack_ts, None)
         return {"status": "delivered", "delivery_id": delivery_id, "slack_ts": slack_ts}
     except Exception as exc:
         db.insert_delivery(delivery_id, digest_id, team_id, user_id, "failed", None, str(exc))
         return {"status": "failed", "delivery_id": delivery_id}
+
+
+async def deliver_digests_bulk(
+    requests: Iterable[Tuple[str, str, str, List[Dict[str, Any]]]],
+) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+
+    async def _deliver(digest_id: str, team_id: str, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        async with semaphore:
+            return await deliver_digest(digest_id, team_id, user_id, items)
+
+    return await asyncio.gather(*(_deliver(*request) for request in requests))
@@ -1,48 +1,61 @@
-import json
-import uuid
-from typing import Any, Dict, List
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
+import orjson
 
 from app import db
+from app.ids import new_id
 from app.profiles import get_query_vector
 from app.retrieval import load_candidate_items, retrieve_top_k
 from app.rerank import rerank_candidates
 
 ROLE_SIGNAL_KEYWORDS = ["supply", "procure", "vendor", "lead time"]
+DIGEST_CACHE_SIZE = int(os.getenv("DIGEST_CACHE_SIZE", "1024"))
+DIGEST_CACHE_TTL_SECONDS = float(os.getenv("DIGEST_CACHE_TTL_SECONDS", "30"))
 
+_DIGEST_CACHE: "OrderedDict[Tuple[Any, ...], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+_DIGEST_CACHE_LOCK = threading.Lock()
 
-def _why_shown(item: Dict[str, Any], role_description: str, phase_key: str | None) -> str:
+
+def _why_shown(item: Dict[str, Any], role_matches_supply: bool, phase_upper: str | None) -> str:
     reasons = []
     if item["urgency"] >= 0.8:
         reasons.append("High urgency")
     entities = item.get("entities", {})
-    if role_description:
-        role_desc_lower = role_description.lower()
-        if any(word in role_desc_lower for word in ROLE_SIGNAL_KEYWORDS):
-            if entities.get("vendors") or entities.get("lead_times"):
-                reasons.append("Role match: vendor/lead time")
-    phases = [p.upper() for p in entities.get("phases", [])]
-    if phase_key and phase_key.upper() in phases:
-        reasons.append(f"Phase match: {phase_key.upper()}")
+    if role_matches_supply and (entities.get("vendors") or entities.get("lead_times")):
+        reasons.append("Role match: vendor/lead time")
+    if phase_upper and any(p.upper() == phase_upper for p in entities.get("phases", ())):
+        reasons.append(f"Phase match: {phase_upper}")
     if not reasons:
         reasons.append("Semantic similarity")
     return "; ".join(reasons)
 
 
-def build_digest(user_id: str, project_id: str, n: int = 10) -> Dict[str, Any]:
-    project_channels = [row["channel_id"] for row in db.fetch_project_channels(project_id)]
-    if not project_channels:
-        raise ValueError("access_denied")
-    if db.fetch_user(user_id) is None:
-        raise ValueError("user_not_found")
-    if db.fetch_project(project_id) is None:
-        raise ValueError("project_not_found")
-    user_channels = {row["channel_id"] for row in db.fetch_user_channels(user_id)}
-    if not user_channels.issuperset(project_channels):
-        raise ValueError("access_denied")
-    q_result = get_query_vector(user_id, project_id)
-    q_vector = np.array(q_result["q_vector"], dtype=float)
+def _cached_items(key: Tuple[Any, ...]):
+    now = time.monotonic()
+    with _DIGEST_CACHE_LOCK:
+        entry = _DIGEST_CACHE.get(key)
+        if entry is None or entry[0] <= now:
+            return None
+        _DIGEST_CACHE.move_to_end(key)
+        return entry[1]
+
+
+def _store_items(key: Tuple[Any, ...], items: List[Dict[str, Any]]) -> None:
+    with _DIGEST_CACHE_LOCK:
+        _DIGEST_CACHE[key] = (time.monotonic() + DIGEST_CACHE_TTL_SECONDS, items)
+        _DIGEST_CACHE.move_to_end(key)
+        if len(_DIGEST_CACHE) > DIGEST_CACHE_SIZE:
+            _DIGEST_CACHE.popitem(last=False)
+
+
+def _rank_items(user_id: str, project_id: str, n: int, q_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    q_vector = np.asarray(q_result["q_vector"], dtype=np.float32)
     candidates = load_candidate_items(project_id=project_id)
     top_k = retrieve_top_k(q_vector, candidates, k=50)
     ranked = rerank_candidates(top_k, user_id, n=n)
@@ -50,6 +63,9 @@ def build_digest(user_id: str, project_id: str, n: int = 10) -> Dict[str, Any]:
     role = db.fetch_role(q_result["role_id"]) if q_result.get("role_id") else None
     role_description = role["description"] if role else ""
     phase_key = q_result.get("phase_key")
+    role_description_lower = role_description.lower() if role_description else ""
+    role_matches_supply = any(word in role_description_lower for word in ROLE_SIGNAL_KEYWORDS)
+    phase_upper = phase_key.upper() if phase_key else None
 
     items = []
     for item in ranked:
@@ -61,7 +77,7 @@ def build_digest(user_id: str, project_id: str, n: int = 10) -> Dict[str, Any]:
                 "labels": item.get("labels"),
                 "entities": item.get("entities"),
                 "urgency": item.get("urgency"),
-                "why_shown": _why_shown(item, role_description, phase_key),
+                "why_shown": _why_shown(item, role_matches_supply, phase_upper),
                 "score_breakdown": {
                     "final_score": item["final_score"],
                     "sim": item["sim_score"],
@@ -72,7 +88,42 @@ def build_digest(user_id: str, project_id: str, n: int = 10) -> Dict[str, Any]:
                 },
             }
         )
+    return items
+
+
+def build_digest(user_id: str, project_id: str, n: int = 10) -> Dict[str, Any]:
+    project_channels = [row["channel_id"] for row in db.fetch_project_channels(project_id)]
+    if not project_channels:
+        raise ValueError("access_denied")
+    if db.fetch_user(user_id) is None:
+        raise ValueError("user_not_found")
+    if db.fetch_project(project_id) is None:
+        raise ValueError("project_not_found")
+    user_channels = {row["channel_id"] for row in db.fetch_user_channels(user_id)}
+    if not user_channels.issuperset(project_channels):
+        raise ValueError("access_denied")
+    q_result = get_query_vector(user_id, project_id)
+    # The ranking only changes with the query vector (role, phase, feedback),
+    # the project's channels or the stored items; the TTL bounds how stale the
+    # recency component can get. Every call still records its own digest.
+    key = (
+        user_id,
+        project_id,
+        n,
+        q_result.get("role_id"),
+        q_result.get("phase_key"),
+        tuple(q_result["q_vector"]),
+        tuple(project_channels),
+        db.items_version(),
+    )
+    items = _cached_items(key)
+    if items is None:
+        items = _rank_items(user_id, project_id, n, q_result)
+        _store_items(key, items)
+    # Cached items are shared across calls, so callers get their own copies
+    # down to the nested labels, entities and score breakdown.
+    items = copy.deepcopy(items)
 
-    digest_id = f"dig-{uuid.uuid4().hex}"
-    db.insert_digest(digest_id, user_id, project_id, json.dumps(items))
+    digest_id = new_id("dig")
+    db.insert_digest(digest_id, user_id, project_id, orjson.dumps(items, option=orjson.OPT_SERIALIZE_NUMPY).decode())
     return {"digest_id": digest_id, "items": items}
@@ -1,37 +1,59 @@
 import hashlib
-import math
-from typing import Iterable, List
+import itertools
+import zlib
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 DEFAULT_DIM = 64
+# Stored role, phase, user and thread vectors are only comparable when built
+# with the same tokenization and bucketing; bump this whenever either changes
+# so app.reembed rebuilds them on the next startup.
+EMBEDDING_VERSION = 1
 
 
 def _tokenize(text: str) -> List[str]:
     return [token for token in text.lower().split() if token]
 
 
-def compute_embedding(text: str, dim: int = DEFAULT_DIM) -> List[float]:
-    vector = [0.0] * dim
-    tokens = _tokenize(text)
-    if not tokens:
-        return vector
-    for token in tokens:
-        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
-        idx = int(digest, 16) % dim
-        vector[idx] += 1.0
-    norm = math.sqrt(sum(v * v for v in vector))
-    if norm == 0:
-        return vector
-    return [v / norm for v in vector]
+def compute_embedding(text: str, dim: int = DEFAULT_DIM) -> np.ndarray:
+    return compute_embeddings([text], dim)[0]
+
+
+def compute_embeddings(texts: Sequence[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    # Tokens never contain whitespace, so each text is encoded once and split
+    # back into byte tokens; crc32 then runs through map() without a Python frame.
+    encoded = []
+    for text in texts:
+        tokens = _tokenize(text)
+        encoded.append(" ".join(tokens).encode("utf-8").split(b" ") if tokens else [])
+    counts = [len(tokens) for tokens in encoded]
+    hashes = np.fromiter(
+        map(zlib.crc32, itertools.chain.from_iterable(encoded)), dtype=np.uint32, count=sum(counts)
+    )
+    rows = np.repeat(np.arange(len(encoded), dtype=np.int64), counts)
+    matrix = np.bincount(rows * dim + hashes % dim, minlength=len(encoded) * dim)
+    matrix = matrix.reshape(len(encoded), dim).astype(np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=matrix, where=norms > 0)
 
 
-def normalize(vector: Iterable[float]) -> List[float]:
-    values = list(vector)
-    norm = math.sqrt(sum(v * v for v in values))
+def normalize(vector: Iterable[float]) -> np.ndarray:
+    return normalize_with_norm(vector)[0]
+
+
+def normalize_with_norm(vector: Iterable[float]) -> Tuple[np.ndarray, float]:
+    values = np.asarray(vector, dtype=np.float64)
+    norm = float(np.linalg.norm(values))
     if norm == 0:
-        return values
-    return [v / norm for v in values]
+        return values, norm
+    return values / norm, norm
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
 
 
-def embed_and_store(thread_ts: str, text: str, store_fn) -> None:
+def embed_and_store(thread_ts: str, text: str, store_fn, digest: Optional[bytes] = None) -> None:
     vector = compute_embedding(text)
-    store_fn(thread_ts, len(vector), vector)
+    store_fn(thread_ts, len(vector), vector, digest if digest is not None else text_hash(text))
@@ -1,5 +1,7 @@
 import re
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Mapping, Set, Tuple
 
 from app.threading import get_thread_text
 
@@ -15,37 +17,58 @@ MATERIALS = ["carbon fiber", "aluminum", "aluminium"]
 PHASE_HINTS = ["evt", "dvt", "pvt"]
 VENDORS = ["vendor a", "vendor b"]
 DEADLINES = ["by friday", "by eod", "by end of day", "by monday", "by tuesday"]
-LEAD_TIME_PATTERN = re.compile(r"\b(\d+)\s+weeks\b", re.IGNORECASE)
-
-
-def classify_labels(text: str) -> List[str]:
-    labels = []
-    lowered = text.lower()
-    for label, keywords in LABEL_KEYWORDS.items():
-        if any(keyword in lowered for keyword in keywords):
-            labels.append(label)
-    return labels
-
-
-def extract_entities(text: str) -> Dict[str, List[str]]:
-    lowered = text.lower()
-    materials = []
-    for mat in MATERIALS:
-        if mat in lowered:
-            materials.append(mat)
-    phases = []
-    for phase in PHASE_HINTS:
-        if re.search(rf"\b{phase}\b", lowered):
-            phases.append(phase.upper())
-    vendors = []
-    for vendor in VENDORS:
-        if vendor in lowered:
-            vendors.append(vendor.title())
-    deadlines = []
-    for deadline in DEADLINES:
-        if deadline in lowered:
-            deadlines.append(deadline)
-    lead_times = [match.group(0) for match in LEAD_TIME_PATTERN.finditer(text)]
+URGENT_KEYWORDS = ["urgent", "blocker", "blocked"]
+
+_KEYWORDS = sorted(
+    {keyword for keywords in LABEL_KEYWORDS.values() for keyword in keywords}
+    | set(MATERIALS + PHASE_HINTS + VENDORS + DEADLINES + URGENT_KEYWORDS + ["decision"]),
+    key=len,
+    reverse=True,
+)
+# One pass finds lead times, word-bounded phases and substring keywords. The
+# lookahead matches at every start position, so overlapping keywords keep the
+# semantics of `keyword in text.lower()`.
+SCAN_PATTERN = re.compile(
+    r"(?=(?P<lead>\b\d+\s+weeks\b)|\b(?P<phase>evt|dvt|pvt)\b|(?P<kw>"
+    + "|".join(map(re.escape, _KEYWORDS))
+    + "))",
+    re.IGNORECASE,
+)
+
+
+def _scan_text(text: str) -> Tuple[Set[str], Set[str], List[str]]:
+    found: Set[str] = set()
+    phases: Set[str] = set()
+    lead_times: List[str] = []
+    for match in SCAN_PATTERN.finditer(text):
+        lead, phase, keyword = match.group("lead", "phase", "kw")
+        if lead:
+            lead_times.append(lead)
+        elif phase:
+            phase = phase.lower()
+            phases.add(phase)
+            found.add(phase)
+        else:
+            found.add(keyword.lower())
+    return found, phases, lead_times
+
+
+@dataclass
+class ScanResult:
+    labels: List[str]
+    entities: Dict[str, List[str]]
+    keyword_urgency: float
+
+
+def _labels(found: Set[str]) -> List[str]:
+    return [label for label, keywords in LABEL_KEYWORDS.items() if not found.isdisjoint(keywords)]
+
+
+def _entities(found: Set[str], matched_phases: Set[str], lead_times: List[str]) -> Dict[str, List[str]]:
+    materials = [mat for mat in MATERIALS if mat in found]
+    phases = [phase.upper() for phase in PHASE_HINTS if phase in matched_phases]
+    vendors = [vendor.title() for vendor in VENDORS if vendor in found]
+    deadlines = [deadline for deadline in DEADLINES if deadline in found]
     return {
         "materials": materials,
         "phases": phases,
@@ -55,22 +78,47 @@ def extract_entities(text: str) -> Dict[str, List[str]]:
     }
 
 
-def compute_urgency(text: str, reactions_json_list: List[str]) -> float:
-    lowered = text.lower()
+def _keyword_urgency(found: Set[str]) -> float:
     score = 0.0
-    if any(deadline in lowered for deadline in DEADLINES):
+    if not found.isdisjoint(DEADLINES):
         score += 0.35
-    if "urgent" in lowered or "blocker" in lowered or "blocked" in lowered:
+    if not found.isdisjoint(URGENT_KEYWORDS):
         score += 0.25
-    if "decision needed" in lowered or "decision" in lowered:
+    if "decision" in found:
         score += 0.1
-    if any(phase.lower() in lowered for phase in PHASE_HINTS):
+    if not found.isdisjoint(PHASE_HINTS):
         score += 0.15
+    return score
+
+
+def _urgency(keyword_urgency: float, reactions_json_list: List[str]) -> float:
+    score = keyword_urgency
     if any("rotating_light" in r for r in reactions_json_list if r):
         score += 0.2
     return min(score, 1.0)
 
 
+def scan(text: str) -> ScanResult:
+    found, phases, lead_times = _scan_text(text)
+    return ScanResult(
+        labels=_labels(found),
+        entities=_entities(found, phases, lead_times),
+        keyword_urgency=_keyword_urgency(found),
+    )
+
+
+def classify_labels(text: str) -> List[str]:
+    return scan(text).labels
+
+
+def extract_entities(text: str) -> Dict[str, List[str]]:
+    return scan(text).entities
+
+
+def compute_urgency(text: str, reactions_json_list: List[str]) -> float:
+    return _urgency(scan(text).keyword_urgency, reactions_json_list)
+
+
 def build_title(entities: Dict[str, List[str]], thread_text: str) -> str:
     materials = [m.lower() for m in entities.get("materials", [])]
     lowered = thread_text.lower()
@@ -95,29 +143,16 @@ def build_title(entities: Dict[str, List[str]], thread_text: str) -> str:
     return "Thread update"
 
 
-def build_summary(messages: List[Dict]) -> str:
-    if not messages:
-        return ""
-    visible = [m for m in messages if not m.get("is_deleted")]
-    if not visible:
-        return ""
-    root = visible[0]
-    replies = visible[1:6]
-    lines = []
-    if root.get("text"):
-        lines.append(f"- {root['text']}")
-    for reply in replies:
-        if reply.get("text"):
-            lines.append(f"- {reply['text']}")
-    return "\n".join(lines)
+def build_summary(messages: Iterable[Mapping[str, Any]]) -> str:
+    visible = (m for m in messages if not m["is_deleted"])
+    return "\n".join(f"- {m['text']}" for m in islice(visible, 6) if m["text"])
 
 
 def enrich_thread(thread_ts: str) -> Tuple[str, List[str], Dict[str, List[str]], float, str]:
     thread_text, messages = get_thread_text(thread_ts)
-    labels = classify_labels(thread_text)
-    entities = extract_entities(thread_text)
-    reactions_json_list = [msg.get("reactions_json") for msg in messages]
-    urgency = compute_urgency(thread_text, reactions_json_list)
-    title = build_title(entities, thread_text)
+    result = scan(thread_text)
+    reactions_json_list = [msg["reactions_json"] for msg in messages]
+    urgency = _urgency(result.keyword_urgency, reactions_json_list)
+    title = build_title(result.entities, thread_text)
     summary = build_summary(messages)
-    return title, labels, entities, urgency, summary
+    return title, result.labels, result.entities, urgency, summary
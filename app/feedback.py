@@ -1,31 +1,35 @@
-import json
 import os
 import time
-import uuid
-from typing import Dict, List
+from typing import Dict, Tuple
+
+import numpy as np
+import orjson
 
 from app import db
-from app.embedding import normalize
+from app.embedding import normalize, normalize_with_norm
+from app.ids import new_id
+from app.profiles import stored_vector
 
 POSITIVE_ACTIONS = {"click", "save", "thumbs_up"}
 NEGATIVE_ACTIONS = {"thumbs_down", "dismiss"}
 ALL_ACTIONS = POSITIVE_ACTIONS | NEGATIVE_ACTIONS
+USER_DECAY_DAYS = float(os.getenv("USER_DECAY_DAYS", "14"))
+USER_DECAY_SECONDS = USER_DECAY_DAYS * 86400
+USER_DECAY_BLEND = float(os.getenv("USER_DECAY_BLEND", "0.05"))
+USER_EMBED_ALPHA = float(os.getenv("USER_EMBED_ALPHA", "0.90"))
 
 
-def _parse_vector(raw: str) -> List[float]:
-    return json.loads(raw)
+def _decay_user_vector(user_vec: np.ndarray, role_vec: np.ndarray, last_updated: float) -> np.ndarray:
+    if time.time() - last_updated <= USER_DECAY_SECONDS:
+        return user_vec
+    return normalize(user_vec + USER_DECAY_BLEND * (role_vec - user_vec))
 
 
-def _decay_user_vector(user_vec: List[float], role_vec: List[float], last_updated: float) -> List[float]:
-    decay_days = float(os.getenv("USER_DECAY_DAYS", "14"))
-    if time.time() - last_updated <= decay_days * 86400:
-        return user_vec
-    decay_blend = float(os.getenv("USER_DECAY_BLEND", "0.05"))
-    blended = [
-        (1.0 - decay_blend) * u + decay_blend * r
-        for u, r in zip(user_vec, role_vec)
-    ]
-    return normalize(blended)
+def blend_user_vector(user_vec: np.ndarray, item_vec: np.ndarray, action: str) -> Tuple[np.ndarray, float]:
+    step = 1.0 - USER_EMBED_ALPHA if action in POSITIVE_ACTIONS else USER_EMBED_ALPHA - 1.0
+    updated = item_vec * step
+    updated += USER_EMBED_ALPHA * user_vec
+    return normalize_with_norm(updated)
 
 
 def apply_feedback(user_id: str, project_id: str, thread_ts: str, action: str) -> Dict:
@@ -41,25 +45,25 @@ def apply_feedback(user_id: str, project_id: str, thread_ts: str, action: str) -
     if embedding is None:
         raise ValueError("embedding_not_found")
 
-    role_vec = _parse_vector(role["role_vector_json"])
-    user_vec_raw = user["user_vector_json"] or role["role_vector_json"]
-    user_vec = _parse_vector(user_vec_raw)
-    user_vec = normalize(user_vec)
+    role_vec = stored_vector(role["role_vector"], role["role_vector_json"])
+    user_vec = stored_vector(user["user_vector"], user["user_vector_json"])
+    # Stored user vectors are written normalized (and start as the unit role
+    # vector), so they are only re-normalized after being changed.
+    if user_vec is None:
+        user_vec = role_vec
     user_vec = _decay_user_vector(user_vec, role_vec, user["updated_at"] or time.time())
-    item_vec = normalize(_parse_vector(embedding["vector_json"]))
+    # Embeddings are stored as unit vectors (compute_embeddings normalizes
+    # each row), so only the dtype is widened here.
+    item_vec = np.asarray(db.unpack_vector(embedding["vector"]), dtype=np.float64)
 
-    alpha = float(os.getenv("USER_EMBED_ALPHA", "0.90"))
-    if action in POSITIVE_ACTIONS:
-        updated = [alpha * u + (1.0 - alpha) * v for u, v in zip(user_vec, item_vec)]
-        direction = "toward"
-    else:
-        updated = [alpha * u - (1.0 - alpha) * v for u, v in zip(user_vec, item_vec)]
-        direction = "away"
-    updated = normalize(updated)
+    direction = "toward" if action in POSITIVE_ACTIONS else "away"
+    updated, norm = blend_user_vector(user_vec, item_vec, action)
 
-    interaction_id = f"int-{uuid.uuid4().hex}"
-    db.insert_interaction(interaction_id, user_id, project_id, thread_ts, action)
-    db.update_user_vector(user_id, json.dumps(updated))
+    interaction_id = new_id("int")
+    user_vector_json = orjson.dumps(updated, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    with db.write_transaction():
+        db.insert_interaction(interaction_id, user_id, project_id, thread_ts, action)
+        db.update_user_vector(user_id, user_vector_json)
 
     return {
         "interaction_id": interaction_id,
@@ -68,5 +72,5 @@ def apply_feedback(user_id: str, project_id: str, thread_ts: str, action: str) -
         "thread_ts": thread_ts,
         "action": action,
         "direction": direction,
-        "new_norm": sum(v * v for v in updated) ** 0.5,
+        "new_norm": 1.0 if norm else 0.0,
     }
@@ -1,8 +1,9 @@
+import functools
 import hashlib
 import hmac
 import os
 import time
-from typing import Tuple
+from typing import Iterable, List, Optional, Tuple
 
 from fastapi import HTTPException, Request
 
@@ -11,6 +12,15 @@ from app.models import SlackEventPayload
 from app.queueing import route_job
 
 
+SIGNATURE_LENGTH = len("v0=") + hashlib.sha256().digest_size * 2
+
+
+@functools.lru_cache(maxsize=4)
+def _signing_key(secret: str) -> hmac.HMAC:
+    # The padded key state depends only on the secret; each request copies it.
+    return hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+
 def verify_slack_signature(
     body: bytes,
     timestamp: str,
@@ -19,15 +29,24 @@ def verify_slack_signature(
 ) -> bool:
     if not timestamp or not signature:
         return False
+    # Shape checks only look at public data, so they can reject malformed
+    # signatures before hashing without leaking anything about the secret.
+    if len(signature) != SIGNATURE_LENGTH or not signature.startswith("v0="):
+        return False
     try:
         ts_int = int(timestamp)
     except ValueError:
         return False
     if abs(time.time() - ts_int) > 60 * 5:
         return False
-    base = f"v0:{timestamp}:{body.decode('utf-8')}".encode("utf-8")
-    expected = "v0=" + hmac.new(secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
-    return hmac.compare_digest(expected, signature)
+    try:
+        expected = bytes.fromhex(signature[3:])
+    except ValueError:
+        return False
+    mac = _signing_key(secret).copy()
+    mac.update(f"v0:{timestamp}:".encode("utf-8"))
+    mac.update(body)
+    return hmac.compare_digest(mac.digest(), expected)
 
 
 def signature_verification_enabled() -> bool:
@@ -35,17 +54,31 @@ def signature_verification_enabled() -> bool:
     return value not in {"0", "false", "no"}
 
 
-def ingest_payload(payload: SlackEventPayload) -> Tuple[bool, str]:
+def ingest_payload(payload: SlackEventPayload, raw_body: Optional[bytes] = None) -> Tuple[bool, str]:
     if not db.insert_dedupe(payload.event_id):
         return False, payload.event_id
-    db.insert_raw_event(payload.event_id, payload.model_dump())
+    db.insert_raw_event(payload.event_id, raw_body or payload.model_dump_json().encode())
     route_job(payload)
     return True, payload.event_id
 
 
-def handle_slack_event(request: Request, payload: SlackEventPayload) -> Tuple[bool, str]:
+def ingest_payloads(payloads: Iterable[SlackEventPayload]) -> List[Tuple[bool, str]]:
+    results = []
+    accepted = []
+    with db.write_transaction():
+        for payload in payloads:
+            inserted = db.insert_dedupe(payload.event_id)
+            results.append((inserted, payload.event_id))
+            if inserted:
+                accepted.append(payload)
+        db.insert_raw_events_bulk((payload.event_id, payload.model_dump_json().encode()) for payload in accepted)
+    for payload in accepted:
+        route_job(payload)
+    return results
+
+
+def handle_slack_event(request: Request, payload: SlackEventPayload, raw_body: Optional[bytes]) -> Tuple[bool, str]:
     if signature_verification_enabled():
-        raw_body = request.scope.get("raw_body")
         if raw_body is None:
             raise HTTPException(status_code=400, detail="Missing raw body")
         signature = request.headers.get("X-Slack-Signature", "")
@@ -55,4 +88,4 @@ def handle_slack_event(request: Request, payload: SlackEventPayload) -> Tuple[bo
             raise HTTPException(status_code=500, detail="Signing secret not configured")
         if not verify_slack_signature(raw_body, timestamp, signature, secret):
             raise HTTPException(status_code=401, detail="Invalid signature")
-    return ingest_payload(payload)
+    return ingest_payload(payload, raw_body)
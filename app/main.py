@@ -1,13 +1,14 @@
 import asyncio
-import json
 import time
-import uuid
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI
+import orjson
+from fastapi import FastAPI, Header
+from fastapi.responses import ORJSONResponse, Response
 
 from app import db
-from app.ingest import ingest_payload
+from app.ids import new_id
+from app.ingest import ingest_payloads
 from app.models import (
     DigestItemView,
     EmbeddingView,
@@ -17,14 +18,16 @@ from app.models import (
     SlackEventPayload,
     ThreadView,
 )
+from app.reembed import reembed_stale_vectors
 from app.queueing import QUEUES, enqueue_backfill, queue_sizes
 from app.routes_profiles import router as profiles_router
 from app.routes_sim import router as sim_router
 from app.routes_slack import router as slack_router
 from app.workers import start_all_workers
 from app.scheduling import scheduler_loop
+from app.slack import close_http_client
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 app.include_router(profiles_router)
 app.include_router(slack_router)
 app.include_router(sim_router)
@@ -33,12 +36,20 @@ app.include_router(sim_router)
 @app.on_event("startup")
 async def startup() -> None:
     db.init_db()
+    reembed_stale_vectors()
     loop = app.state.loop = asyncio.get_event_loop()
     start_all_workers(loop, QUEUES)
     app.state.scheduler_stop = asyncio.Event()
     app.state.scheduler_task = loop.create_task(scheduler_loop(app.state.scheduler_stop))
 
 
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await close_http_client()
+    db.stop_flusher()
+    db.flush_pending()
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health() -> HealthResponse:
     return HealthResponse(status="ok")
@@ -71,7 +82,7 @@ async def seed_mock() -> Dict[str, Any]:
     for idx, msg in enumerate(messages):
         ts = str(float(base_ts) + idx * 0.001)
         event_payload = SlackEventPayload(
-            event_id=f"mock-{uuid.uuid4().hex}",
+            event_id=new_id("mock"),
             event_time=int(time.time()),
             event_ts=ts,
             team_id="T001",
@@ -88,10 +99,10 @@ async def seed_mock() -> Dict[str, Any]:
         )
         events.append(event_payload)
 
-    results = []
-    for payload in events:
-        inserted, event_id = ingest_payload(payload)
-        results.append({"event_id": event_id, "status": "queued" if inserted else "duplicate"})
+    results = [
+        {"event_id": event_id, "status": "queued" if inserted else "duplicate"}
+        for inserted, event_id in ingest_payloads(events)
+    ]
     return {"status": "seeded", "results": results}
 
 
@@ -99,7 +110,7 @@ async def seed_mock() -> Dict[str, Any]:
 async def backfill(payload: SlackEventPayload) -> IngestResult:
     if not db.insert_dedupe(payload.event_id):
         return IngestResult(status="duplicate", event_id=payload.event_id)
-    db.insert_raw_event(payload.event_id, payload.model_dump())
+    db.insert_raw_event(payload.event_id, payload.model_dump_json().encode())
     enqueue_backfill(payload)
     return IngestResult(status="queued", event_id=payload.event_id)
 
@@ -122,68 +133,83 @@ async def queues_status() -> List[QueueStatus]:
     return statuses
 
 
-@app.get("/raw_events")
-async def raw_events(limit: int = 50) -> List[Dict[str, Any]]:
-    rows = db.fetch_raw_events(limit)
+def _raw_event_views(limit: int) -> List[Dict[str, Any]]:
     return [
         {
             "event_id": row["event_id"],
             "received_at": row["received_at"],
-            "payload": json.loads(row["payload_json"]),
+            "payload": db.unpack_payload(row["payload"]),
         }
-        for row in rows
+        for row in db.iter_raw_events(limit)
     ]
 
 
+def _thread_views(limit: int) -> List[ThreadView]:
+    return [
+        ThreadView(
+            thread_ts=row["thread_ts"],
+            channel=row["channel"],
+            root_ts=row["root_ts"],
+            created_at=row["created_at"],
+            last_activity=row["last_activity"],
+            reply_count=row["reply_count"],
+            reaction_count=row["reaction_count"],
+            participants=orjson.loads(row["participants_json"] or "[]"),
+        )
+        for row in db.iter_threads(limit)
+    ]
+
+
+def _item_views(limit: int) -> List[DigestItemView]:
+    return [
+        DigestItemView(
+            thread_ts=row["thread_ts"],
+            channel=row["channel"],
+            title=row["title"],
+            labels=orjson.loads(row["labels_json"] or "[]"),
+            entities=orjson.loads(row["entities_json"] or "{}"),
+            urgency=row["urgency"],
+            summary=row["summary"],
+            updated_at=row["updated_at"],
+        )
+        for row in db.iter_items(limit)
+    ]
+
+
+# Row decoding runs in a worker thread so large listings do not stall the event
+# loop; the iterators are opened there too because reader connections are per-thread.
+@app.get("/raw_events")
+async def raw_events(limit: int = 50) -> List[Dict[str, Any]]:
+    return await asyncio.to_thread(_raw_event_views, limit)
+
+
 @app.get("/threads", response_model=List[ThreadView])
 async def threads(limit: int = 50) -> List[ThreadView]:
-    rows = db.fetch_threads(limit)
-    result = []
-    for row in rows:
-        participants = json.loads(row["participants_json"] or "[]")
-        result.append(
-            ThreadView(
-                thread_ts=row["thread_ts"],
-                channel=row["channel"],
-                root_ts=row["root_ts"],
-                created_at=row["created_at"],
-                last_activity=row["last_activity"],
-                reply_count=row["reply_count"],
-                reaction_count=row["reaction_count"],
-                participants=participants,
-            )
-        )
-    return result
+    return await asyncio.to_thread(_thread_views, limit)
 
 
 @app.get("/items", response_model=List[DigestItemView])
 async def items(limit: int = 50) -> List[DigestItemView]:
-    rows = db.fetch_items(limit)
-    result = []
-    for row in rows:
-        result.append(
-            DigestItemView(
-                thread_ts=row["thread_ts"],
-                channel=row["channel"],
-                title=row["title"],
-                labels=json.loads(row["labels_json"] or "[]"),
-                entities=json.loads(row["entities_json"] or "{}"),
-                urgency=row["urgency"],
-                summary=row["summary"],
-                updated_at=row["updated_at"],
-            )
-        )
-    return result
+    return await asyncio.to_thread(_item_views, limit)
+
+
+def _accepts_octet_stream(accept: Optional[str]) -> bool:
+    if not accept:
+        return False
+    return any(part.split(";", 1)[0].strip() == "application/octet-stream" for part in accept.split(","))
 
 
 @app.get("/embeddings/{thread_ts}", response_model=EmbeddingView)
-async def embeddings(thread_ts: str) -> EmbeddingView:
-    row = db.fetch_embedding(thread_ts)
+async def embeddings(thread_ts: str, accept: Optional[str] = Header(None)):
+    row = await asyncio.to_thread(db.fetch_embedding, thread_ts)
+    if _accepts_octet_stream(accept):
+        vector = row["vector"] if row is not None else b""
+        return Response(content=bytes(vector), media_type="application/octet-stream")
     if row is None:
         return EmbeddingView(thread_ts=thread_ts, dim=0, vector=[], updated_at=0.0)
     return EmbeddingView(
         thread_ts=row["thread_ts"],
         dim=row["dim"],
-        vector=json.loads(row["vector_json"]),
+        vector=db.unpack_vector(row["vector"]).tolist(),
         updated_at=row["updated_at"],
     )
@@ -1,6 +1,6 @@
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 
 
 class SlackReaction(BaseModel):
@@ -34,6 +34,9 @@ class SlackEventPayload(BaseModel):
     event: SlackInnerEvent
 
 
+SLACK_EVENT_PAYLOADS = TypeAdapter(List[SlackEventPayload])
+
+
 class IngestResult(BaseModel):
     status: str
     event_id: str
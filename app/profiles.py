@@ -1,26 +1,41 @@
-import json
-import math
+import functools
 import os
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import orjson
+
 from app import db
-from app.embedding import compute_embedding, normalize
+from app.embedding import compute_embedding, compute_embeddings, normalize
+
+QUERY_WEIGHT_ROLE = float(os.getenv("QUERY_WEIGHT_ROLE", "0.45"))
+QUERY_WEIGHT_USER = float(os.getenv("QUERY_WEIGHT_USER", "0.35"))
+QUERY_WEIGHT_PHASE = float(os.getenv("QUERY_WEIGHT_PHASE", "0.20"))
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "1024"))
 
 
 def _normalized_vector(text: str) -> List[float]:
-    vector = compute_embedding(text)
-    return normalize(vector)
+    return normalize(compute_embedding(text)).tolist()
 
 
 def create_role(role_id: str, name: str, description: str) -> List[float]:
     vector = _normalized_vector(description)
-    db.upsert_role(role_id, name, description, json.dumps(vector))
+    db.upsert_role(role_id, name, description, orjson.dumps(vector).decode())
     return vector
 
 
+def bulk_create_roles(rows: List[Tuple[str, str, str]]) -> List[List[float]]:
+    vectors = compute_embeddings([description for _, _, description in rows]).tolist()
+    db.upsert_roles_bulk(
+        (role_id, name, description, orjson.dumps(vector).decode())
+        for (role_id, name, description), vector in zip(rows, vectors)
+    )
+    return vectors
+
+
 def create_phase(phase_key: str, description: str) -> List[float]:
     vector = _normalized_vector(description)
-    db.upsert_phase(phase_key, description, json.dumps(vector))
+    db.upsert_phase(phase_key, description, orjson.dumps(vector).decode())
     return vector
 
 
@@ -28,7 +43,7 @@ def create_project(project_id: str, name: str, current_phase: str, channels: Opt
     phase = db.fetch_phase(current_phase)
     if phase is None:
         raise ValueError("phase_not_found")
-    channels_json = json.dumps(channels or [])
+    channels_json = orjson.dumps(channels or []).decode()
     db.upsert_project(project_id, name, current_phase, channels_json)
 
 
@@ -48,7 +63,7 @@ def create_user(user_id: str, name: str, role_id: Optional[str]) -> Tuple[Option
         role_vector_json = role["role_vector_json"]
     db.upsert_user(user_id, name, None, role_id, role_vector_json)
     if role_vector_json:
-        return json.loads(role_vector_json), role_id
+        return orjson.loads(role_vector_json), role_id
     return None, role_id
 
 
@@ -58,7 +73,7 @@ def update_user_role(user_id: str, role_id: str) -> List[float]:
         raise ValueError("role_not_found")
     role_vector_json = role["role_vector_json"]
     db.update_user_role(user_id, role_id, role_vector_json)
-    return json.loads(role_vector_json)
+    return orjson.loads(role_vector_json)
 
 
 def add_user_to_project(user_id: str, project_id: str) -> None:
@@ -77,7 +92,7 @@ def get_user_profile(user_id: str) -> Dict:
         raise ValueError("user_not_found")
     projects = db.fetch_user_projects(user_id)
     project_ids = [row["project_id"] for row in projects]
-    vector = json.loads(user["user_vector_json"]) if user["user_vector_json"] else []
+    vector = orjson.loads(user["user_vector_json"]) if user["user_vector_json"] else []
     return {
         "user_id": user["user_id"],
         "role_id": user["role_id"],
@@ -91,7 +106,7 @@ def get_project_profile(project_id: str) -> Dict:
     if project is None:
         raise ValueError("project_not_found")
     phase = db.fetch_phase(project["current_phase"]) if project["current_phase"] else None
-    vector = json.loads(phase["phase_vector_json"]) if phase and phase["phase_vector_json"] else []
+    vector = orjson.loads(phase["phase_vector_json"]) if phase and phase["phase_vector_json"] else []
     return {
         "project_id": project["project_id"],
         "current_phase": project["current_phase"],
@@ -100,56 +115,90 @@ def get_project_profile(project_id: str) -> Dict:
     }
 
 
-def _parse_vector(raw: Optional[str]) -> Optional[List[float]]:
-    if not raw:
-        return None
-    return json.loads(raw)
+# Role and phase vectors are re-read on every query and feedback call but
+# rarely change; the parsed array is shared, so it is made read-only.
+@functools.lru_cache(maxsize=512)
+def cached_vector(raw: str) -> np.ndarray:
+    vector = np.asarray(orjson.loads(raw), dtype=np.float64)
+    vector.flags.writeable = False
+    return vector
+
+
+def stored_vector(blob: Optional[bytes], raw: Optional[str]) -> Optional[np.ndarray]:
+    if blob is not None:
+        return db.unpack_vector(blob)
+    if raw:
+        return cached_vector(raw)
+    return None
 
 
-def _top_indices(vector: List[float], top_k: int = 5) -> List[int]:
-    indexed = list(enumerate(vector))
-    indexed.sort(key=lambda pair: abs(pair[1]), reverse=True)
-    return [idx for idx, _ in indexed[:top_k]]
+def _top_indices(vector: np.ndarray, top_k: int = 5) -> List[int]:
+    magnitudes = np.abs(vector)
+    if len(magnitudes) > top_k:
+        # Partition down to the entries tied with or above the k-th magnitude;
+        # the stable sort keeps lower indices first among ties.
+        threshold = np.partition(magnitudes, -top_k)[-top_k]
+        candidates = np.flatnonzero(magnitudes >= threshold)
+    else:
+        candidates = np.arange(len(magnitudes))
+    order = np.argsort(-magnitudes[candidates], kind="stable")
+    return candidates[order][:top_k].tolist()
 
 
 def weighted_query_vector(
-    role_vec: List[float],
-    user_vec: Optional[List[float]],
-    phase_vec: Optional[List[float]],
+    role_vec: np.ndarray,
+    user_vec: Optional[np.ndarray],
+    phase_vec: Optional[np.ndarray],
     w_role: float,
     w_user: float,
     w_phase: float,
 ) -> Dict:
-    effective_user = user_vec or role_vec
+    effective_user = user_vec if user_vec is not None and len(user_vec) else role_vec
     weights = {"role": w_role, "user": w_user, "phase": w_phase}
     if phase_vec is None:
         total = w_role + w_user
         weights["role"] = w_role / total
         weights["user"] = w_user / total
         weights["phase"] = 0.0
-    contrib_role = [weights["role"] * v for v in role_vec]
-    contrib_user = [weights["user"] * v for v in effective_user]
-    contrib_phase = [weights["phase"] * v for v in phase_vec] if phase_vec else [0.0] * len(role_vec)
-    combined = [a + b + c for a, b, c in zip(contrib_role, contrib_user, contrib_phase)]
-    q_vector = normalize(combined)
-    component_norms = {
-        "role": math.sqrt(sum(v * v for v in contrib_role)),
-        "user": math.sqrt(sum(v * v for v in contrib_user)),
-        "phase": math.sqrt(sum(v * v for v in contrib_phase)),
-    }
-    component_top_indices = {
-        "role": _top_indices(contrib_role),
-        "user": _top_indices(contrib_user),
-        "phase": _top_indices(contrib_phase),
+    contribs = {
+        "role": weights["role"] * role_vec,
+        "user": weights["user"] * effective_user,
+        "phase": weights["phase"] * phase_vec if phase_vec is not None and len(phase_vec) else np.zeros_like(role_vec),
     }
+    q_vector = normalize(contribs["role"] + contribs["user"] + contribs["phase"])
+    component_norms = {name: float(np.linalg.norm(contrib)) for name, contrib in contribs.items()}
+    component_top_indices = {name: _top_indices(contrib) for name, contrib in contribs.items()}
     return {
-        "q_vector": q_vector,
+        "q_vector": q_vector.tolist(),
         "weights": weights,
         "component_norms": component_norms,
         "component_top_indices": component_top_indices,
     }
 
 
+@functools.lru_cache(maxsize=QUERY_VECTOR_CACHE_SIZE)
+def _query_vector_for(
+    role_blob: Optional[bytes],
+    role_raw: Optional[str],
+    user_blob: Optional[bytes],
+    user_raw: Optional[str],
+    phase_blob: Optional[bytes],
+    phase_raw: Optional[str],
+    has_phase: bool,
+    w_role: float,
+    w_user: float,
+    w_phase: float,
+) -> Dict:
+    # Keyed on the stored vectors and weights themselves, so a feedback,
+    # phase or weight change is a cache miss without explicit invalidation.
+    role_vec = stored_vector(role_blob, role_raw)
+    if role_vec is None:
+        raise ValueError("role_vector_missing")
+    user_vec = stored_vector(user_blob, user_raw)
+    phase_vec = stored_vector(phase_blob, phase_raw) if has_phase else None
+    return weighted_query_vector(role_vec, user_vec, phase_vec, w_role, w_user, w_phase)
+
+
 def get_query_vector(user_id: str, project_id: str) -> Dict:
     user = db.fetch_user(user_id)
     if user is None:
@@ -161,16 +210,27 @@ def get_query_vector(user_id: str, project_id: str) -> Dict:
     role = db.fetch_role(role_id) if role_id else None
     if role is None:
         raise ValueError("role_not_found")
-    role_vec = _parse_vector(role["role_vector_json"])
-    if role_vec is None:
-        raise ValueError("role_vector_missing")
-    user_vec = _parse_vector(user["user_vector_json"])
     phase_key = project["current_phase"]
     phase = db.fetch_phase(phase_key) if phase_key else None
-    phase_vec = _parse_vector(phase["phase_vector_json"]) if phase else None
-    w_role = float(os.getenv("QUERY_WEIGHT_ROLE", "0.45"))
-    w_user = float(os.getenv("QUERY_WEIGHT_USER", "0.35"))
-    w_phase = float(os.getenv("QUERY_WEIGHT_PHASE", "0.20"))
-    result = weighted_query_vector(role_vec, user_vec, phase_vec, w_role, w_user, w_phase)
-    result.update({"role_id": role_id, "phase_key": phase_key})
-    return result
+    result = _query_vector_for(
+        role["role_vector"],
+        role["role_vector_json"],
+        user["user_vector"],
+        user["user_vector_json"],
+        phase["phase_vector"] if phase else None,
+        phase["phase_vector_json"] if phase else None,
+        phase is not None,
+        QUERY_WEIGHT_ROLE,
+        QUERY_WEIGHT_USER,
+        QUERY_WEIGHT_PHASE,
+    )
+    # The cached result is shared between callers, so every container handed
+    # out is a fresh copy.
+    return {
+        "q_vector": list(result["q_vector"]),
+        "weights": dict(result["weights"]),
+        "component_norms": dict(result["component_norms"]),
+        "component_top_indices": {name: list(indices) for name, indices in result["component_top_indices"].items()},
+        "role_id": role_id,
+        "phase_key": phase_key,
+    }
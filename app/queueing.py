@@ -1,9 +1,11 @@
 import asyncio
+import re
 from typing import Dict
 
 from app.models import SlackEventPayload
 
 HOT_SIGNALS = ["decision needed", "by friday", "blocker", "urgent", "evt"]
+HOT_SIGNAL_PATTERN = re.compile("|".join(map(re.escape, HOT_SIGNALS)), re.IGNORECASE)
 
 
 class QueueManager:
@@ -23,9 +25,7 @@ def _has_rotating_light(reactions) -> bool:
 
 
 def route_job(payload: SlackEventPayload) -> str:
-    text = (payload.event.text or "").lower()
-    reactions = payload.event.reactions or []
-    if any(signal in text for signal in HOT_SIGNALS) or _has_rotating_light(reactions):
+    if HOT_SIGNAL_PATTERN.search(payload.event.text or "") or _has_rotating_light(payload.event.reactions):
         QUEUES.hot.put_nowait(payload)
         return "hot"
     QUEUES.standard.put_nowait(payload)
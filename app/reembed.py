@@ -0,0 +1,51 @@
+from typing import Dict
+
+import numpy as np
+import orjson
+
+from app import db
+from app.embedding import EMBEDDING_VERSION, compute_embeddings, text_hash
+from app.feedback import blend_user_vector
+from app.threading import get_thread_text
+
+
+def _vector_json(vector: np.ndarray) -> str:
+    return orjson.dumps(vector, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def reembed_stale_vectors() -> bool:
+    # Runs once per EMBEDDING_VERSION: roles, phases and threads are embedded
+    # again from their text, and each user vector is rebuilt from the new role
+    # vector by replaying that user's feedback in order.
+    if db.fetch_embedding_version() == EMBEDDING_VERSION:
+        return False
+    with db.write_transaction():
+        roles = db.fetch_roles()
+        role_vectors = compute_embeddings([role["description"] or "" for role in roles])
+        db.upsert_roles_bulk(
+            (role["role_id"], role["name"], role["description"], _vector_json(vector))
+            for role, vector in zip(roles, role_vectors)
+        )
+        phases = db.fetch_phases()
+        for phase, vector in zip(phases, compute_embeddings([phase["description"] or "" for phase in phases])):
+            db.upsert_phase(phase["phase_key"], phase["description"], _vector_json(vector))
+
+        thread_tss = db.fetch_embedding_thread_ts()
+        texts = [get_thread_text(thread_ts)[0] for thread_ts in thread_tss]
+        item_vectors: Dict[str, np.ndarray] = {}
+        for thread_ts, text, vector in zip(thread_tss, texts, compute_embeddings(texts)):
+            db.upsert_embedding(thread_ts, len(vector), vector, text_hash(text))
+            item_vectors[thread_ts] = vector
+
+        by_role = {role["role_id"]: vector for role, vector in zip(roles, role_vectors)}
+        for user in db.fetch_user_roles():
+            vector = by_role.get(user["role_id"])
+            if vector is None:
+                continue
+            for interaction in db.fetch_interactions_for_user(user["user_id"]):
+                item_vec = item_vectors.get(interaction["thread_ts"])
+                if item_vec is not None:
+                    vector = blend_user_vector(vector, item_vec, interaction["action"])[0]
+            db.update_user_vector(user["user_id"], _vector_json(vector))
+        db.set_embedding_version(EMBEDDING_VERSION)
+    return True
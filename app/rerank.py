@@ -5,22 +5,20 @@ from typing import Any, Dict, Iterable, List
 import numpy as np
 
 from app import db
-from app.retrieval import cosine_sim
+from app.retrieval import stack_vectors
 
+TIE_EPSILON = 1e-12
+MUST_INCLUDE_LABELS = db.LABEL_BITS["BLOCKER"] | db.LABEL_BITS["DECISION"]
+MUST_INCLUDE_URGENCY = 0.8
 
-def _recency_score(updated_at: float, now: float, window_seconds: float) -> float:
+
+def _recency_scores(updated_at: np.ndarray, now: float, window_seconds: float) -> np.ndarray:
     if window_seconds <= 0:
-        return 0.0
-    age = now - updated_at
-    if age <= 0:
-        return 1.0
-    if age >= window_seconds:
-        return 0.0
-    return 1.0 - (age / window_seconds)
+        return np.zeros(len(updated_at))
+    return np.clip(1.0 - (now - updated_at) / window_seconds, 0.0, 1.0)
 
 
-def _ownership_score(thread_ts: str, user_id: str) -> float:
-    messages = db.get_messages_for_thread(thread_ts)
+def _ownership_score(messages: Iterable[Any], user_id: str) -> float:
     mention = f"<@{user_id}>"
     for msg in messages:
         if msg["user"] == user_id:
@@ -31,7 +29,7 @@ def _ownership_score(thread_ts: str, user_id: str) -> float:
     return 0.0
 
 
-def _base_score(sim: float, urgency: float, ownership: float, recency: float) -> float:
+def _base_scores(sim: np.ndarray, urgency: np.ndarray, ownership: np.ndarray, recency: np.ndarray) -> np.ndarray:
     return 0.55 * sim + 0.20 * urgency + 0.15 * ownership + 0.10 * recency
 
 
@@ -45,64 +43,93 @@ def rerank_candidates(
     window_seconds = window_hours * 3600
     now = time.time()
 
-    enriched = []
-    for candidate in candidates:
-        recency = _recency_score(candidate["updated_at"], now, window_seconds)
-        ownership = _ownership_score(candidate["thread_ts"], user_id)
-        base_score = _base_score(candidate["sim_score"], candidate["urgency"], ownership, recency)
-        enriched.append(
-            {
-                **candidate,
-                "recency": recency,
-                "ownership": ownership,
-                "base_score": base_score,
-                "force_included": False,
-                "diversity_penalty": 0.0,
-                "final_score": base_score,
-            }
+    candidates = list(candidates)
+    thread_messages = db.get_messages_for_threads([c["thread_ts"] for c in candidates])
+    ownership = np.array([_ownership_score(thread_messages[c["thread_ts"]], user_id) for c in candidates])
+    urgencies = np.array([c["urgency"] for c in candidates], dtype=np.float64)
+    recency = _recency_scores(np.array([c["updated_at"] for c in candidates], dtype=np.float64), now, window_seconds)
+    base_scores = _base_scores(
+        np.array([c["sim_score"] for c in candidates], dtype=np.float64), urgencies, ownership, recency
+    )
+    enriched = [
+        {
+            **candidate,
+            "recency": c_recency,
+            "ownership": c_ownership,
+            "base_score": c_base,
+            "force_included": False,
+            "diversity_penalty": 0.0,
+            "final_score": c_base,
+        }
+        for candidate, c_recency, c_ownership, c_base in zip(
+            candidates, recency.tolist(), ownership.tolist(), base_scores.tolist()
         )
-
-    must_include = [
-        c
-        for c in enriched
-        if ("BLOCKER" in c["labels"] or "DECISION" in c["labels"]) and c["urgency"] >= 0.8
     ]
 
+    # Candidates loaded from digest_items carry the stored mask; others are
+    # masked from their labels.
+    masks = np.array(
+        [c["labels_mask"] if "labels_mask" in c else db.labels_mask(c.get("labels", ())) for c in candidates],
+        dtype=np.int64,
+    )
+    must_flags = ((masks & MUST_INCLUDE_LABELS) != 0) & (urgencies >= MUST_INCLUDE_URGENCY)
+    must_include = [enriched[idx] for idx in np.flatnonzero(must_flags).tolist()]
+
     selected: List[Dict[str, Any]] = []
     if must_include:
-        must_include.sort(
+        forced = min(
+            must_include,
             key=lambda item: (
                 -item["base_score"],
                 -item["urgency"],
                 -item["updated_at"],
                 item["thread_ts"],
-            )
+            ),
         )
-        forced = must_include[0]
         forced["force_included"] = True
         selected.append(forced)
 
-    remaining = [c for c in enriched if c["thread_ts"] not in {s["thread_ts"] for s in selected}]
-
-    while remaining and len(selected) < n:
-        for candidate in remaining:
-            if not selected:
-                max_sim = 0.0
-            else:
-                sims = [cosine_sim(candidate["vector"], sel["vector"]) for sel in selected]
-                max_sim = max(sims)
-            penalty = lambda_diversity * max_sim
-            candidate["diversity_penalty"] = penalty
-            candidate["final_score"] = candidate["base_score"] - penalty
-        remaining.sort(
-            key=lambda item: (
-                -item["final_score"],
-                -item["base_score"],
-                -item["urgency"],
-                -item["updated_at"],
-                item["thread_ts"],
+    forced_ids = {s["thread_ts"] for s in selected}
+    keep = np.array([c["thread_ts"] not in forced_ids for c in enriched], dtype=bool)
+    remaining = [c for c, kept in zip(enriched, keep.tolist()) if kept]
+    if not remaining:
+        return selected
+
+    # Each candidate's max similarity to the selected set is kept as a running
+    # maximum, updated with one matrix-vector product per selection.
+    vectors = stack_vectors(remaining)
+    base_scores = base_scores[keep]
+    max_sim = np.full(len(remaining), -np.inf)
+    for sel in selected:
+        max_sim = np.maximum(max_sim, vectors @ sel["vector"])
+    alive = np.ones(len(remaining), dtype=bool)
+    alive_count = len(remaining)
+    masked_scores = np.empty(len(remaining))
+
+    while len(selected) < n and alive_count:
+        penalties = lambda_diversity * max_sim if selected else np.zeros(len(remaining))
+        final_scores = base_scores - penalties
+        masked_scores.fill(-np.inf)
+        np.copyto(masked_scores, final_scores, where=alive)
+        pick = int(np.argmax(masked_scores))
+        # Only near-ties with the argmax need the tuple tiebreakers.
+        tied = np.flatnonzero(masked_scores >= masked_scores[pick] - TIE_EPSILON)
+        if len(tied) > 1:
+            pick = min(
+                tied.tolist(),
+                key=lambda idx: (
+                    -remaining[idx]["base_score"],
+                    -remaining[idx]["urgency"],
+                    -remaining[idx]["updated_at"],
+                    remaining[idx]["thread_ts"],
+                ),
             )
-        )
-        selected.append(remaining.pop(0))
+        chosen = remaining[pick]
+        chosen["diversity_penalty"] = float(penalties[pick])
+        chosen["final_score"] = float(final_scores[pick])
+        selected.append(chosen)
+        alive[pick] = False
+        alive_count -= 1
+        max_sim = np.maximum(max_sim, vectors @ chosen["vector"])
 
     return selected
@@ -1,9 +1,10 @@
-import json
 import os
 import time
+from functools import lru_cache
 from typing import Any, Dict, Iterable, List, Optional
 
 import numpy as np
+import orjson
 
 from app import db
 
@@ -32,56 +33,87 @@ def load_candidate_items(
         since_ts = time.time() - window_hours * 3600
     label_filter = [label.upper() for label in (label_filter or [])]
     params: List[Any] = [since_ts]
+    params.extend(channels or [])
+    if label_filter:
+        params.append(db.labels_mask(label_filter))
+    candidates = []
+    with db.read_cursor() as cur:
+        cur.execute(_candidate_query(len(channels or []), bool(label_filter)), params)
+        for row in cur:
+            candidates.append(
+                {
+                    "thread_ts": row["thread_ts"],
+                    "vector": db.unpack_vector(row["vector"]),
+                    "urgency": row["urgency"] or 0.0,
+                    "labels": orjson.loads(row["labels_json"] or "[]"),
+                    "labels_mask": row["labels_mask"],
+                    "entities": orjson.loads(row["entities_json"] or "{}"),
+                    "updated_at": row["updated_at"],
+                    "title": row["title"],
+                    "summary": row["summary"],
+                }
+            )
+    return candidates
+
+
+@lru_cache(maxsize=128)
+def _candidate_query(n_channels: int, has_label_filter: bool) -> str:
+    # The SQL text only depends on the placeholder counts, so repeated calls
+    # hand sqlite3 the same string and hit its prepared statement cache.
     where_clauses = ["di.updated_at >= ?"]
-    if channels:
-        placeholders = ",".join(["?"] * len(channels))
-        where_clauses.append(f"di.channel IN ({placeholders})")
-        params.extend(channels)
-    query = f"""
-        SELECT di.thread_ts, di.channel, di.labels_json, di.entities_json, di.urgency,
-               di.updated_at, di.title, di.summary, e.vector_json
+    if n_channels:
+        where_clauses.append(f"di.channel IN ({','.join('?' * n_channels)})")
+    if has_label_filter:
+        where_clauses.append("di.labels_mask & ? != 0")
+    return f"""
+        SELECT di.thread_ts, di.channel, di.labels_json, di.labels_mask, di.entities_json, di.urgency,
+               di.updated_at, di.title, di.summary, e.vector
         FROM digest_items di
         JOIN embeddings e ON e.thread_ts = di.thread_ts
         WHERE {' AND '.join(where_clauses)}
     """
-    with db.db_cursor() as cur:
-        cur.execute(query, params)
-        rows = cur.fetchall()
-    candidates = []
-    for row in rows:
-        labels = json.loads(row["labels_json"] or "[]")
-        if label_filter and not any(label in labels for label in label_filter):
-            continue
-        vector = np.array(json.loads(row["vector_json"]), dtype=float)
-        candidates.append(
-            {
-                "thread_ts": row["thread_ts"],
-                "vector": vector,
-                "urgency": row["urgency"] or 0.0,
-                "labels": labels,
-                "entities": json.loads(row["entities_json"] or "{}"),
-                "updated_at": row["updated_at"],
-                "title": row["title"],
-                "summary": row["summary"],
-            }
-        )
-    return candidates
 
 
 def cosine_sim(q: np.ndarray, v: np.ndarray) -> float:
     return float(np.dot(q, v))
 
 
+def stack_vectors(candidates: List[Dict[str, Any]]) -> np.ndarray:
+    if not candidates:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([candidate["vector"] for candidate in candidates]).astype(np.float32, copy=False)
+
+
+def score_candidates(q: np.ndarray, candidates: List[Dict[str, Any]], matrix: Optional[np.ndarray] = None) -> np.ndarray:
+    if not candidates:
+        return np.empty(0, dtype=np.float32)
+    if matrix is None:
+        matrix = stack_vectors(candidates)
+    return matrix @ np.asarray(q, dtype=np.float32)
+
+
 def retrieve_top_k(
     q: np.ndarray,
     candidates: Iterable[Dict[str, Any]],
     k: int,
     label_filter: Optional[List[str]] = None,
+    matrix: Optional[np.ndarray] = None,
 ) -> List[Dict[str, Any]]:
+    candidates = list(candidates)
+    if not candidates or k <= 0:
+        return []
+    scores = score_candidates(q, candidates, matrix)
+    if k < len(scores):
+        # Everything tied with the k-th best score stays in play so the
+        # tiebreakers below decide the cut, not the partition order.
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        indices = np.flatnonzero(scores >= threshold).tolist()
+    else:
+        indices = range(len(scores))
     scored = []
-    for candidate in candidates:
-        score = cosine_sim(q, candidate["vector"])
-        scored_candidate = dict(candidate)
+    for idx in indices:
+        score = float(scores[idx])
+        scored_candidate = dict(candidates[idx])
         scored_candidate["sim_score"] = score
         scored_candidate["score"] = score
         scored.append(scored_candidate)
@@ -1,12 +1,12 @@
-import json
 import time
-import uuid
 
 from fastapi import APIRouter, HTTPException
 import numpy as np
-from pydantic import BaseModel
+import orjson
+from pydantic import BaseModel, Field
 
 from app import db
+from app.ids import new_id
 from app.profiles import (
     add_user_to_project,
     create_phase,
@@ -19,11 +19,12 @@ from app.profiles import (
     update_project_phase,
     update_user_role,
 )
-from app.retrieval import load_candidate_items, retrieve_top_k, cosine_sim
+from app.retrieval import load_candidate_items, retrieve_top_k, score_candidates
 from app.rerank import rerank_candidates
 from app.digest import build_digest
 from app.feedback import apply_feedback, ALL_ACTIONS
 from app.delivery import deliver_digest
+from app.scheduling import notify_schedule_changed
 
 router = APIRouter()
 
@@ -203,7 +204,7 @@ async def debug_retrieve(user_id: str, project_id: str, k: int = 50, labels: str
             raise HTTPException(status_code=404, detail="Unknown project")
         raise HTTPException(status_code=400, detail="Missing role or phase data")
     candidates = load_candidate_items(project_id=project_id, label_filter=label_filter)
-    q_vector = np.array(q_result["q_vector"], dtype=float)
+    q_vector = np.asarray(q_result["q_vector"], dtype=np.float32)
     raw_results = retrieve_top_k(q_vector, candidates, k, label_filter=label_filter)
     results = [
         {
@@ -236,11 +237,9 @@ async def debug_rerank(user_id: str, project_id: str, n: int = 10, labels: str |
             raise HTTPException(status_code=404, detail="Unknown project")
         raise HTTPException(status_code=400, detail="Missing role or phase data")
     candidates = load_candidate_items(project_id=project_id, label_filter=label_filter)
-    q_vector = np.array(q_result["q_vector"], dtype=float)
-    scored_candidates = []
-    for candidate in candidates:
-        sim = cosine_sim(q_vector, candidate["vector"])
-        scored_candidates.append({**candidate, "sim_score": sim})
+    q_vector = np.asarray(q_result["q_vector"], dtype=np.float32)
+    scores = score_candidates(q_vector, candidates)
+    scored_candidates = [{**candidate, "sim_score": float(sim)} for candidate, sim in zip(candidates, scores)]
     reranked = rerank_candidates(scored_candidates, user_id, n=n)
     results = []
     for item in reranked:
@@ -308,15 +307,16 @@ class ScheduleCreate(BaseModel):
     team_id: str
     project_id: str
     user_id: str
-    time_of_day: str
+    time_of_day: str = Field(pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
     timezone: str
 
 
 @router.post("/schedules")
 async def create_schedule_endpoint(payload: ScheduleCreate):
-    schedule_id = f"sched-{uuid.uuid4().hex}"
-    cron_json = json.dumps({"time_of_day": payload.time_of_day, "timezone": payload.timezone})
+    schedule_id = new_id("sched")
+    cron_json = orjson.dumps({"time_of_day": payload.time_of_day, "timezone": payload.timezone}).decode()
     db.insert_schedule(schedule_id, payload.team_id, payload.project_id, payload.user_id, cron_json, 1)
+    notify_schedule_changed(schedule_id)
     return {"schedule_id": schedule_id}
 
 
@@ -331,7 +331,7 @@ async def list_schedules_endpoint():
                 "team_id": row["team_id"],
                 "project_id": row["project_id"],
                 "user_id": row["user_id"],
-                "cron": json.loads(row["cron_json"]),
+                "cron": orjson.loads(row["cron_json"]),
                 "is_enabled": bool(row["is_enabled"]),
             }
         )
@@ -340,8 +340,7 @@ async def list_schedules_endpoint():
 
 @router.post("/schedules/{schedule_id}/run_now")
 async def run_schedule_now(schedule_id: str):
-    schedules = db.fetch_schedules()
-    schedule = next((row for row in schedules if row["schedule_id"] == schedule_id), None)
+    schedule = db.fetch_schedule(schedule_id)
     if schedule is None:
         raise HTTPException(status_code=404, detail="Unknown schedule")
     last_delivery = db.fetch_latest_delivery_for_schedule(
@@ -1,22 +1,26 @@
 from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import ValidationError
 
 from app.ingest import ingest_payload
 from app.models import IngestResult, SlackEventPayload
 from app.queueing import queue_sizes
-from app.sim.streamer import STATE, reset_state, start_streaming, stop_streaming
+from app.sim.streamer import STATE, reset_state, start_streaming, stop_streaming, wait_until_idle
 
 router = APIRouter()
 
 
 @router.post("/sim/events")
-async def sim_events(payload: Dict[str, Any]) -> IngestResult:
+async def sim_events(request: Request) -> IngestResult:
+    # Validated straight from the body bytes, which are also stored as the
+    # raw event, instead of decoding to a dict first.
+    raw_body = await request.body()
     try:
-        event_payload = SlackEventPayload.model_validate(payload)
-    except Exception:
+        event_payload = SlackEventPayload.model_validate_json(raw_body)
+    except ValidationError:
         raise HTTPException(status_code=400, detail="Invalid event payload")
-    inserted, event_id = ingest_payload(event_payload)
+    inserted, event_id = ingest_payload(event_payload, raw_body)
     return IngestResult(status="queued" if inserted else "duplicate", event_id=event_id)
 
 
@@ -45,8 +49,7 @@ async def simulate_stop():
     return {"status": "stopped"}
 
 
-@router.get("/simulate/status")
-async def simulate_status():
+def _status() -> Dict[str, Any]:
     return {
         "running": STATE.running,
         "scenario_id": STATE.scenario_id,
@@ -56,6 +59,17 @@ async def simulate_status():
     }
 
 
+@router.get("/simulate/status")
+async def simulate_status():
+    return _status()
+
+
+@router.get("/simulate/wait-until-idle")
+async def simulate_wait_until_idle(timeout: float = 60.0):
+    idle = await wait_until_idle(timeout)
+    return {**_status(), "idle": idle}
+
+
 @router.post("/simulate/reset")
 async def simulate_reset():
     reset_state()
@@ -1,8 +1,10 @@
 import os
 from typing import Any, Dict
 
+import orjson
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import RedirectResponse
+from pydantic import ValidationError
 
 from app.ingest import ingest_payload, signature_verification_enabled, verify_slack_signature
 from app.models import IngestResult, SlackEventPayload
@@ -33,7 +35,6 @@ async def slack_oauth_redirect(code: str):
 @router.post("/events")
 async def slack_events(request: Request):
     raw_body = await request.body()
-    request.scope["raw_body"] = raw_body
     if signature_verification_enabled():
         signature = request.headers.get("X-Slack-Signature", "")
         timestamp = request.headers.get("X-Slack-Request-Timestamp", "")
@@ -42,12 +43,17 @@ async def slack_events(request: Request):
             raise HTTPException(status_code=500, detail="Signing secret not configured")
         if not verify_slack_signature(raw_body, timestamp, signature, secret):
             raise HTTPException(status_code=401, detail="Invalid signature")
-    payload: Dict[str, Any] = await request.json()
-    if payload.get("type") == "url_verification":
-        return {"challenge": payload.get("challenge", "")}
     try:
-        event_payload = SlackEventPayload.model_validate(payload)
-    except Exception:
+        event_payload = SlackEventPayload.model_validate_json(raw_body)
+    except ValidationError:
+        # The url_verification handshake is not an event callback; it is rare
+        # enough to pay for a second parse.
+        try:
+            payload: Dict[str, Any] = orjson.loads(raw_body)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid event payload")
+        if isinstance(payload, dict) and payload.get("type") == "url_verification":
+            return {"challenge": payload.get("challenge", "")}
         raise HTTPException(status_code=400, detail="Invalid event payload")
-    inserted, event_id = ingest_payload(event_payload)
+    inserted, event_id = ingest_payload(event_payload, raw_body)
     return IngestResult(status="queued" if inserted else "duplicate", event_id=event_id)
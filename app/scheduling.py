@@ -1,48 +1,156 @@
 import asyncio
-import json
+import heapq
+import logging
+import threading
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
 from zoneinfo import ZoneInfo
 
+import orjson
+
 from app import db
 from app.digest import build_digest
-from app.delivery import deliver_digest
+from app.delivery import deliver_digests_bulk
 
-CHECK_INTERVAL_SECONDS = 60
+logger = logging.getLogger(__name__)
 
+FIRE_WINDOW_SECONDS = 60
 
-def _is_due(schedule_row, now_utc: float) -> bool:
-    cron = json.loads(schedule_row["cron_json"])
-    time_of_day = cron.get("time_of_day", "09:00")
-    tz_name = cron.get("timezone", "UTC")
+_CHANGES_LOCK = threading.Lock()
+_CHANGED_SCHEDULES: Set[str] = set()
+_WAKE: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+
+
+@lru_cache(maxsize=256)
+def _tz(name: str) -> ZoneInfo:
     try:
-        tz = ZoneInfo(tz_name)
+        return ZoneInfo(name)
     except Exception:
-        tz = ZoneInfo("UTC")
-    dt = datetime.fromtimestamp(now_utc, tz=timezone.utc).astimezone(tz)
-    now = dt.strftime("%H:%M")
-    if now != time_of_day:
-        return False
+        return ZoneInfo("UTC")
+
+
+@lru_cache(maxsize=1024)
+def _parse_cron(cron_json: str) -> Tuple[ZoneInfo, str, int, int]:
+    cron = orjson.loads(cron_json)
+    tz_name = cron.get("timezone", "UTC")
+    hour, minute = map(int, cron.get("time_of_day", "09:00").split(":"))
+    return _tz(tz_name), tz_name, hour, minute
+
+
+def _next_fire(schedule_row, after_utc: float) -> float:
+    # The schedule is due for the whole local minute `time_of_day`, so a fire
+    # time still counts while `after_utc` falls inside that minute.
+    tz, _, hour, minute = _parse_cron(schedule_row["cron_json"])
+    local = datetime.fromtimestamp(after_utc, tz=timezone.utc).astimezone(tz)
+    fire = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if fire.timestamp() + FIRE_WINDOW_SECONDS <= after_utc:
+        fire = datetime.combine(local.date() + timedelta(days=1), fire.timetz())
+    return fire.timestamp()
+
+
+def _delivered_today(schedule_row, now_utc: float) -> bool:
+    tz, tz_name, _, _ = _parse_cron(schedule_row["cron_json"])
     last_delivery = db.fetch_latest_delivery_for_schedule(
         schedule_row["team_id"], schedule_row["project_id"], schedule_row["user_id"], now_utc, tz_name
     )
     if last_delivery is None:
-        return True
+        return False
+    now = datetime.fromtimestamp(now_utc, tz=timezone.utc).astimezone(tz)
     last_dt = datetime.fromtimestamp(last_delivery["delivered_at"], tz=timezone.utc).astimezone(tz)
-    return last_dt.date() != dt.date()
+    return last_dt.date() == now.date()
 
 
-async def scheduler_loop(stop_event: asyncio.Event) -> None:
-    while not stop_event.is_set():
-        schedules = db.fetch_schedules()
-        now_utc = time.time()
-        for schedule in schedules:
-            if not schedule["is_enabled"]:
-                continue
-            if _is_due(schedule, now_utc):
-                digest = build_digest(schedule["user_id"], schedule["project_id"], n=10)
-                await deliver_digest(digest["digest_id"], schedule["team_id"], schedule["user_id"], digest["items"])
+def notify_schedule_changed(schedule_id: str) -> None:
+    with _CHANGES_LOCK:
+        _CHANGED_SCHEDULES.add(schedule_id)
+        wake = _WAKE
+    if wake is not None:
+        loop, event = wake
         try:
-            await asyncio.wait_for(stop_event.wait(), timeout=CHECK_INTERVAL_SECONDS)
-        except asyncio.TimeoutError:
-            continue
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass
+
+
+def _drain_changes() -> List[str]:
+    with _CHANGES_LOCK:
+        changed = list(_CHANGED_SCHEDULES)
+        _CHANGED_SCHEDULES.clear()
+    return changed
+
+
+def _push(heap: List[Tuple[float, str]], next_fires: Dict[str, float], schedule_row, after_utc: float) -> None:
+    if not schedule_row["is_enabled"]:
+        next_fires.pop(schedule_row["schedule_id"], None)
+        return
+    try:
+        fire_at = _next_fire(schedule_row, after_utc)
+    except Exception:
+        # A schedule whose cron cannot be parsed never fires, but must not
+        # stop the loop for every other schedule.
+        logger.exception("skipping schedule %s with invalid cron", schedule_row["schedule_id"])
+        next_fires.pop(schedule_row["schedule_id"], None)
+        return
+    next_fires[schedule_row["schedule_id"]] = fire_at
+    heapq.heappush(heap, (fire_at, schedule_row["schedule_id"]))
+
+
+async def scheduler_loop(stop_event: asyncio.Event) -> None:
+    global _WAKE
+    wake = asyncio.Event()
+    with _CHANGES_LOCK:
+        _WAKE = (asyncio.get_running_loop(), wake)
+        _CHANGED_SCHEDULES.clear()
+    # Min-heap of (next fire, schedule_id). Entries superseded by a schedule
+    # change are skipped lazily when their timestamp no longer matches.
+    heap: List[Tuple[float, str]] = []
+    next_fires: Dict[str, float] = {}
+    now_utc = time.time()
+    for schedule in db.fetch_schedules():
+        _push(heap, next_fires, schedule, now_utc)
+    stop_waiter = asyncio.ensure_future(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            wake.clear()
+            now_utc = time.time()
+            for schedule_id in _drain_changes():
+                next_fires.pop(schedule_id, None)
+                schedule = db.fetch_schedule(schedule_id)
+                if schedule is not None:
+                    _push(heap, next_fires, schedule, now_utc)
+
+            due = []
+            # Deliveries are only written after the fan-out, so schedules for
+            # the same user and project due in this tick are skipped here.
+            queued: Set[Tuple[str, str, str]] = set()
+            while heap and heap[0][0] <= now_utc:
+                fire_at, schedule_id = heapq.heappop(heap)
+                if next_fires.get(schedule_id) != fire_at:
+                    continue
+                del next_fires[schedule_id]
+                schedule = db.fetch_schedule(schedule_id)
+                if schedule is None or not schedule["is_enabled"]:
+                    continue
+                key = (schedule["team_id"], schedule["user_id"], schedule["project_id"])
+                try:
+                    if key not in queued and not _delivered_today(schedule, now_utc):
+                        digest = build_digest(schedule["user_id"], schedule["project_id"], n=10)
+                        due.append((digest["digest_id"], schedule["team_id"], schedule["user_id"], digest["items"]))
+                        queued.add(key)
+                except Exception:
+                    logger.exception("failed to build digest for schedule %s", schedule_id)
+                _push(heap, next_fires, schedule, fire_at + FIRE_WINDOW_SECONDS)
+            if due:
+                await deliver_digests_bulk(due)
+
+            timeout = max(heap[0][0] - time.time(), 0.0) if heap else None
+            wake_waiter = asyncio.ensure_future(wake.wait())
+            await asyncio.wait({stop_waiter, wake_waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            wake_waiter.cancel()
+    finally:
+        stop_waiter.cancel()
+        with _CHANGES_LOCK:
+            if _WAKE is not None and _WAKE[1] is wake:
+                _WAKE = None
@@ -1,5 +1,4 @@
-import json
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 import httpx
 
@@ -7,27 +6,39 @@ import httpx
 class SimClient:
     def __init__(self, base_url: str = "http://localhost:8000") -> None:
         self.base_url = base_url.rstrip("/")
+        # One pooled client for the simulator's lifetime so bursts of events
+        # reuse keep-alive connections instead of reconnecting per call.
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=64),
+        )
+
+    async def __aenter__(self) -> "SimClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
 
     async def send_event(self, event: Dict) -> Dict:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(f"{self.base_url}/sim/events", json=event)
-            response.raise_for_status()
-            return response.json()
+        response = await self._client.post("/sim/events", json=event)
+        response.raise_for_status()
+        return response.json()
 
     async def post(self, path: str, payload: Dict) -> Dict:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(f"{self.base_url}{path}", json=payload)
-            response.raise_for_status()
-            return response.json()
+        response = await self._client.post(path, json=payload)
+        response.raise_for_status()
+        return response.json()
 
     async def patch(self, path: str, payload: Dict) -> Dict:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.patch(f"{self.base_url}{path}", json=payload)
-            response.raise_for_status()
-            return response.json()
-
-    async def get(self, path: str, params: Optional[Dict] = None) -> Dict:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(f"{self.base_url}{path}", params=params)
-            response.raise_for_status()
-            return response.json()
+        response = await self._client.patch(path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def get(self, path: str, params: Optional[Dict] = None, timeout: Any = httpx.USE_CLIENT_DEFAULT) -> Dict:
+        response = await self._client.get(path, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
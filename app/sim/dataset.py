@@ -25,15 +25,17 @@ def carbon_fiber_demo(clock: SimClock, run_id: str) -> List[Dict]:
     events: List[Dict] = []
     idx = 0
 
-    def emit_message(channel: str, user: str, text: str, thread_ts: float | None) -> float:
+    # Timestamps are formatted once per tick and passed around as strings.
+    def emit_message(channel: str, user: str, text: str, thread_ts: str | None) -> str:
         nonlocal idx
-        ts = clock.tick()
+        now = clock.tick()
+        ts = f"{now:.3f}"
         if thread_ts is None:
             thread_ts = ts
         events.append(
             {
                 "event_id": _event_id(f"{run_id}M", idx),
-                "event_time": int(ts),
+                "event_time": int(now),
                 "team_id": "T_DEMO",
                 "type": "event_callback",
                 "event": {
@@ -41,34 +43,34 @@ def carbon_fiber_demo(clock: SimClock, run_id: str) -> List[Dict]:
                     "channel": channel,
                     "user": user,
                     "text": text,
-                    "ts": f"{ts:.3f}",
-                    "thread_ts": f"{thread_ts:.3f}",
+                    "ts": ts,
+                    "thread_ts": thread_ts,
                 },
             }
         )
         idx += 1
         return thread_ts
 
-    def emit_reaction(channel: str, reaction: str, item_ts: float) -> None:
+    def emit_reaction(channel: str, reaction: str, item_ts: str) -> None:
         nonlocal idx
-        ts = clock.tick()
+        now = clock.tick()
         events.append(
             {
                 "event_id": _event_id(f"{run_id}R", idx),
-                "event_time": int(ts),
+                "event_time": int(now),
                 "team_id": "T_DEMO",
                 "type": "event_callback",
                 "event": {
                     "type": "reaction_added",
-                    "item": {"channel": channel, "ts": f"{item_ts:.3f}"},
+                    "item": {"channel": channel, "ts": item_ts},
                     "reaction": reaction,
-                    "event_ts": f"{ts:.3f}",
+                    "event_ts": f"{now:.3f}",
                 },
             }
         )
         idx += 1
 
-    def emit_edit(channel: str, ts: float, thread_ts: float, text: str) -> None:
+    def emit_edit(channel: str, ts: str, thread_ts: str, text: str) -> None:
         nonlocal idx
         now = clock.tick()
         events.append(
@@ -82,9 +84,9 @@ def carbon_fiber_demo(clock: SimClock, run_id: str) -> List[Dict]:
                     "subtype": "message_changed",
                     "channel": channel,
                     "message": {
-                        "ts": f"{ts:.3f}",
+                        "ts": ts,
                         "text": text,
-                        "thread_ts": f"{thread_ts:.3f}",
+                        "thread_ts": thread_ts,
                         "channel": channel,
                     },
                 },
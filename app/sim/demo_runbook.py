@@ -1,15 +1,10 @@
 import asyncio
-import json
 import os
 from typing import Dict, List
 
 from app import db
+from app.profiles import stored_vector
 from app.sim.client import SimClient
-from app.sim.dataset import SimClock, get_scenario_events
-
-
-def _dot(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
 
 
 def _format_digest(items: List[Dict]) -> str:
@@ -23,93 +18,108 @@ def _format_digest(items: List[Dict]) -> str:
 
 def _diff(before: List[Dict], after: List[Dict]) -> List[str]:
     before_rank = {item["title"]: idx for idx, item in enumerate(before, start=1)}
-    after_rank = {item["title"]: idx for idx, item in enumerate(after, start=1)}
-    titles = [item["title"] for item in after]
-    diffs = []
-    for title in titles:
-        if title in before_rank:
-            diffs.append(f"- {title} (rank {before_rank[title]} -> {after_rank[title]})")
-    return diffs
-
-
-def _find_thread(items: List[Dict], contains: str) -> str:
+    return [
+        f"- {item['title']} (rank {before_rank[item['title']]} -> {idx})"
+        for idx, item in enumerate(after, start=1)
+        if item["title"] in before_rank
+    ]
+
+
+def _find_threads(items: List[Dict], needles: List[str]) -> Dict[str, str]:
+    # One pass over the items, lowercasing each summary once, maps every
+    # needle to the first thread whose summary contains it.
+    lowered = {needle: needle.lower() for needle in needles}
+    found: Dict[str, str] = {}
     for item in items:
-        summary = item.get("summary") or ""
-        if contains.lower() in summary.lower():
-            return item["thread_ts"]
-    raise RuntimeError("thread not found")
+        summary = (item.get("summary") or "").lower()
+        for needle, needle_lower in lowered.items():
+            if needle not in found and needle_lower in summary:
+                found[needle] = item["thread_ts"]
+    missing = [needle for needle in needles if needle not in found]
+    if missing:
+        raise RuntimeError(f"thread not found: {', '.join(missing)}")
+    return found
 
 
 async def main() -> None:
     base_url = os.getenv("SIM_BASE_URL", "http://localhost:8000")
-    client = SimClient(base_url)
-
-    # Setup roles, phases, project, users, channels
-    await client.post(
-        "/roles",
-        {"role_id": "role-me", "name": "ME", "description": "materials structures weight manufacturability"},
-    )
-    await client.post(
-        "/roles",
-        {"role_id": "role-supply", "name": "Supply", "description": "vendors lead times MOQ sourcing risk"},
-    )
-    await client.post(
-        "/roles",
-        {"role_id": "role-pm", "name": "PM", "description": "timeline decisions owners milestones"},
-    )
-
-    await client.post(
-        "/phases",
-        {"phase_key": "EVT", "description": "early prototype build, unblock near-term decisions"},
-    )
-    await client.post(
-        "/phases",
-        {"phase_key": "DVT", "description": "validation testing focus, reliability risks"},
+    async with SimClient(base_url) as client:
+        await _run(client)
+
+
+async def _run(client: SimClient) -> None:
+    # Setup in dependency layers; the calls within a layer are independent.
+    await asyncio.gather(
+        client.post(
+            "/roles",
+            {"role_id": "role-me", "name": "ME", "description": "materials structures weight manufacturability"},
+        ),
+        client.post(
+            "/roles",
+            {"role_id": "role-supply", "name": "Supply", "description": "vendors lead times MOQ sourcing risk"},
+        ),
+        client.post(
+            "/roles",
+            {"role_id": "role-pm", "name": "PM", "description": "timeline decisions owners milestones"},
+        ),
+        client.post(
+            "/phases",
+            {"phase_key": "EVT", "description": "early prototype build, unblock near-term decisions"},
+        ),
+        client.post(
+            "/phases",
+            {"phase_key": "DVT", "description": "validation testing focus, reliability risks"},
+        ),
     )
 
-    await client.post(
-        "/projects",
-        {"project_id": "proj-drone", "name": "DroneV2", "current_phase": "EVT"},
+    await asyncio.gather(
+        client.post(
+            "/projects",
+            {"project_id": "proj-drone", "name": "DroneV2", "current_phase": "EVT"},
+        ),
+        client.post(
+            "/users",
+            {"user_id": "U_MAYA", "name": "Maya", "role_id": "role-me"},
+        ),
+        client.post(
+            "/users",
+            {"user_id": "U_SAM", "name": "Sam", "role_id": "role-supply"},
+        ),
+        client.post(
+            "/users",
+            {"user_id": "U_PRIYA", "name": "Priya", "role_id": "role-pm"},
+        ),
     )
-    await client.post("/projects/proj-drone/channels", {"channel_id": "C_DRONE_STRUCT"})
-    await client.post("/projects/proj-drone/channels", {"channel_id": "C_DRONE_SUPPLY"})
 
-    await client.post(
-        "/users",
-        {"user_id": "U_MAYA", "name": "Maya", "role_id": "role-me"},
-    )
-    await client.post(
-        "/users",
-        {"user_id": "U_SAM", "name": "Sam", "role_id": "role-supply"},
-    )
-    await client.post(
-        "/users",
-        {"user_id": "U_PRIYA", "name": "Priya", "role_id": "role-pm"},
+    channels = ["C_DRONE_STRUCT", "C_DRONE_SUPPLY"]
+    await asyncio.gather(
+        *(client.post("/projects/proj-drone/channels", {"channel_id": channel}) for channel in channels),
+        *(
+            client.post(f"/users/{user_id}/channels", {"channel_id": channel})
+            for user_id in ["U_MAYA", "U_SAM", "U_PRIYA"]
+            for channel in channels
+        ),
     )
 
-    for user_id in ["U_MAYA", "U_SAM", "U_PRIYA"]:
-        await client.post(f"/users/{user_id}/channels", {"channel_id": "C_DRONE_STRUCT"})
-        await client.post(f"/users/{user_id}/channels", {"channel_id": "C_DRONE_SUPPLY"})
-
     # Start simulator
     await client.post(
         "/simulate/start",
         {"scenario_id": "carbon_fiber_demo", "speed_multiplier": 5},
     )
 
-    target_events = len(get_scenario_events("carbon_fiber_demo", SimClock(), "run"))
-    while True:
-        status = await client.get("/simulate/status")
-        if status["emitted_count"] >= target_events and sum(status["queue_sizes"].values()) == 0:
-            break
-        await asyncio.sleep(0.5)
+    idle_timeout = float(os.getenv("SIM_IDLE_TIMEOUT", "300"))
+    status = await client.get("/simulate/wait-until-idle", {"timeout": idle_timeout}, timeout=idle_timeout + 10)
+    if not status["idle"]:
+        raise RuntimeError("simulation did not drain before SIM_IDLE_TIMEOUT")
 
     await client.post("/simulate/stop", {})
 
     # Digests per user
-    digest_me = await client.get("/digest", {"user_id": "U_MAYA", "project_id": "proj-drone", "n": 5})
-    digest_supply = await client.get("/digest", {"user_id": "U_SAM", "project_id": "proj-drone", "n": 5})
-    digest_pm = await client.get("/digest", {"user_id": "U_PRIYA", "project_id": "proj-drone", "n": 5})
+    digest_me, digest_supply, digest_pm = await asyncio.gather(
+        client.get("/digest", {"user_id": "U_MAYA", "project_id": "proj-drone", "n": 5}),
+        client.get("/digest", {"user_id": "U_SAM", "project_id": "proj-drone", "n": 5}),
+        client.get("/digest", {"user_id": "U_PRIYA", "project_id": "proj-drone", "n": 5}),
+    )
 
     print("=== Digest: EVT (U_MAYA) ===")
     print(_format_digest(digest_me["items"]))
@@ -120,8 +130,10 @@ async def main() -> None:
 
     # Phase change
     await client.patch("/projects/proj-drone/phase", {"phase_key": "DVT"})
-    digest_me_dvt = await client.get("/digest", {"user_id": "U_MAYA", "project_id": "proj-drone", "n": 5})
-    digest_supply_dvt = await client.get("/digest", {"user_id": "U_SAM", "project_id": "proj-drone", "n": 5})
+    digest_me_dvt, digest_supply_dvt = await asyncio.gather(
+        client.get("/digest", {"user_id": "U_MAYA", "project_id": "proj-drone", "n": 5}),
+        client.get("/digest", {"user_id": "U_SAM", "project_id": "proj-drone", "n": 5}),
+    )
     print("\n=== Phase Change: EVT -> DVT ===")
     print("U_MAYA")
     print("\n".join(_diff(digest_me["items"], digest_me_dvt["items"])))
@@ -130,31 +142,36 @@ async def main() -> None:
 
     # Feedback learning for U_SAM
     items = await client.get("/items", {"limit": 20})
-    supply_thread = _find_thread(items, "Vendor A lead time")
-    rf_thread = _find_thread(items, "RF test risk")
+    threads = _find_threads(items, ["Vendor A lead time", "RF test risk"])
+    supply_thread = threads["Vendor A lead time"]
+    rf_thread = threads["RF test risk"]
 
     db.init_db()
     user_before = db.fetch_user("U_SAM")
     v_pos = db.fetch_embedding(supply_thread)
     v_neg = db.fetch_embedding(rf_thread)
 
-    u_before = json.loads(user_before["user_vector_json"])
-    dot_pos_before = _dot(u_before, json.loads(v_pos["vector_json"]))
-    dot_neg_before = _dot(u_before, json.loads(v_neg["vector_json"]))
+    pos_vec = db.unpack_vector(v_pos["vector"])
+    neg_vec = db.unpack_vector(v_neg["vector"])
+    u_before = stored_vector(user_before["user_vector"], user_before["user_vector_json"])
+    dot_pos_before = float(u_before @ pos_vec)
+    dot_neg_before = float(u_before @ neg_vec)
 
     await client.post(
         "/feedback",
         {"user_id": "U_SAM", "project_id": "proj-drone", "thread_ts": supply_thread, "action": "thumbs_up"},
     )
+    # Each feedback update starts from the vector the previous one wrote, so
+    # these two stay sequential.
     await client.post(
         "/feedback",
         {"user_id": "U_SAM", "project_id": "proj-drone", "thread_ts": rf_thread, "action": "dismiss"},
     )
 
     user_after = db.fetch_user("U_SAM")
-    u_after = json.loads(user_after["user_vector_json"])
-    dot_pos_after = _dot(u_after, json.loads(v_pos["vector_json"]))
-    dot_neg_after = _dot(u_after, json.loads(v_neg["vector_json"]))
+    u_after = stored_vector(user_after["user_vector"], user_after["user_vector_json"])
+    dot_pos_after = float(u_after @ pos_vec)
+    dot_neg_after = float(u_after @ neg_vec)
 
     print("\n=== Feedback Learning ===")
     print(f"U_SAM dot(v_pos) before: {dot_pos_before:.3f} after: {dot_pos_after:.3f} ({dot_pos_after - dot_pos_before:+.3f})")
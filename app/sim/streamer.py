@@ -4,7 +4,8 @@ from dataclasses import dataclass, field
 from typing import Dict, Optional
 
 from app.ingest import ingest_payload
-from app.models import SlackEventPayload
+from app.models import SLACK_EVENT_PAYLOADS
+from app.queueing import QUEUES
 from app.sim.dataset import SimClock, get_scenario_events
 
 
@@ -39,16 +40,17 @@ def reset_state() -> None:
 
 async def _emit_events(scenario_id: str) -> None:
     try:
+        # Replays reuse the same event ids, which dedupe drops on ingest, so
+        # the scenario is built and validated once rather than per cycle.
+        events = get_scenario_events(scenario_id, STATE.clock, STATE.run_id or "run")
+        payloads = SLACK_EVENT_PAYLOADS.validate_python(events)
         while STATE.running:
-            run_id = STATE.run_id or "run"
-            events = get_scenario_events(scenario_id, STATE.clock, run_id)
-            for event in events:
+            for payload in payloads:
                 if not STATE.running:
                     break
-                payload = SlackEventPayload.model_validate(event)
                 ingest_payload(payload)
                 STATE.emitted_count += 1
-                STATE.last_event_id = event.get("event_id")
+                STATE.last_event_id = payload.event_id
                 if STATE.max_events and STATE.emitted_count >= STATE.max_events:
                     STATE.running = False
                     break
@@ -60,6 +62,22 @@ async def _emit_events(scenario_id: str) -> None:
         STATE.task = None
 
 
+async def wait_until_idle(timeout: float) -> bool:
+    # Idle means the stream has finished and every queued event has been
+    # processed by a worker (task_done), not merely dequeued.
+    async def _idle() -> None:
+        task = STATE.task
+        if task is not None:
+            await asyncio.wait({task})
+        await asyncio.gather(QUEUES.hot.join(), QUEUES.standard.join(), QUEUES.backfill.join())
+
+    try:
+        await asyncio.wait_for(_idle(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
 def start_streaming(
     scenario_id: str,
     speed_multiplier: float = 1.0,
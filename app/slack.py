@@ -1,14 +1,31 @@
-import json
 import os
 from typing import Dict, Optional
 
 import httpx
+import orjson
 
 from app import db
 
 SLACK_OAUTH_URL = "https://slack.com/oauth/v2/authorize"
 SLACK_TOKEN_URL = "https://slack.com/api/oauth.v2.access"
 
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Shared so Slack API calls reuse pooled keep-alive connections.
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_keepalive_connections=50))
+    return _HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
 
 def build_install_url(redirect_uri: str) -> str:
     client_id = os.getenv("SLACK_CLIENT_ID", "")
@@ -31,17 +48,9 @@ async def exchange_code_for_token(code: str, redirect_uri: str, http_client: Opt
         "code": code,
         "redirect_uri": redirect_uri,
     }
-    close_client = False
-    if http_client is None:
-        http_client = httpx.AsyncClient(timeout=10)
-        close_client = True
-    try:
-        response = await http_client.post(SLACK_TOKEN_URL, data=payload)
-        response.raise_for_status()
-        data = response.json()
-    finally:
-        if close_client:
-            await http_client.aclose()
+    response = await (http_client or get_http_client()).post(SLACK_TOKEN_URL, data=payload)
+    response.raise_for_status()
+    data = response.json()
     if not data.get("ok"):
         raise ValueError("oauth_failed")
     return data
@@ -54,7 +63,7 @@ def store_workspace_token(oauth_payload: Dict) -> None:
     scopes = oauth_payload.get("scope", "")
     if not team_id or not access_token:
         raise ValueError("invalid_oauth_payload")
-    scopes_json = json.dumps(scopes.split(",") if scopes else [])
+    scopes_json = orjson.dumps(scopes.split(",") if scopes else []).decode()
     db.upsert_slack_workspace(team_id, access_token, bot_user_id or "", scopes_json)
 
 
@@ -64,7 +73,6 @@ async def slack_api_call(team_id: str, method: str, params: Optional[Dict] = Non
         raise ValueError("workspace_not_found")
     token = workspace["access_token"]
     headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post(f"https://slack.com/api/{method}", headers=headers, data=params or {})
-        response.raise_for_status()
-        return response.json()
+    response = await get_http_client().post(f"https://slack.com/api/{method}", headers=headers, data=params or {})
+    response.raise_for_status()
+    return response.json()
@@ -1,16 +1,23 @@
 import asyncio
-from typing import Callable
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from app import db
-from app.embedding import embed_and_store
+from app.embedding import compute_embeddings, embed_and_store, text_hash
 from app.enrichment import enrich_thread
 from app.models import SlackEventPayload
 from app.threading import store_message, update_thread_stats, get_thread_text
 
+logger = logging.getLogger(__name__)
 
-async def process_event(payload: SlackEventPayload) -> None:
+
+def _apply_event(payload: SlackEventPayload) -> Optional[Tuple[str, str, bool]]:
+    # Writes the event itself and returns (thread_ts, channel, text_changed)
+    # for the thread that needs refreshing, or None when nothing changed.
     event = payload.event
     channel = event.channel
+    text_changed = True
     if event.type == "message" and event.subtype in {"message_changed", "message_deleted"}:
         channel = channel or (event.message or {}).get("channel") or (event.previous_message or {}).get("channel")
         if event.subtype == "message_changed":
@@ -21,7 +28,7 @@ async def process_event(payload: SlackEventPayload) -> None:
             if channel and ts:
                 db.update_message_text(channel, ts, text)
             else:
-                return
+                return None
         else:
             message = event.previous_message or event.message or {}
             ts = message.get("ts") or getattr(event, "deleted_ts", None)
@@ -29,27 +36,30 @@ async def process_event(payload: SlackEventPayload) -> None:
             if channel and ts:
                 db.mark_message_deleted(channel, ts)
             else:
-                return
+                return None
     elif event.type in {"reaction_added", "reaction_removed"}:
         item = event.item or {}
         channel = item.get("channel") or channel
         ts = item.get("ts") or event.ts
         if not channel or not ts or not event.reaction:
-            return
+            return None
         delta = 1 if event.type == "reaction_added" else -1
-        db.update_message_reactions(channel, ts, event.reaction, delta)
-        message = db.fetch_message(channel, ts)
-        if message is None:
-            return
-        thread_ts = message["thread_ts"]
+        thread_ts = db.update_message_reactions(channel, ts, event.reaction, delta)
+        if thread_ts is None:
+            return None
+        text_changed = False
     else:
         if event.channel is None or event.ts is None:
-            return
+            return None
         inserted, thread_ts = store_message(event)
         if not inserted:
-            return
+            return None
     if not channel:
-        return
+        return None
+    return thread_ts, channel, text_changed
+
+
+def _refresh_digest(thread_ts: str, channel: str) -> None:
     update_thread_stats(thread_ts, channel)
     title, labels, entities, urgency, summary = enrich_thread(thread_ts)
     db.upsert_digest_item(
@@ -61,18 +71,120 @@ async def process_event(payload: SlackEventPayload) -> None:
         urgency=urgency,
         summary=summary,
     )
+
+
+def _stale_text(thread_ts: str) -> Optional[Tuple[str, bytes]]:
+    # Edits can leave the visible text unchanged, so the stored text hash is
+    # checked before re-embedding.
     thread_text, _ = get_thread_text(thread_ts)
-    embed_and_store(thread_ts, thread_text, db.upsert_embedding)
+    digest = text_hash(thread_text)
+    if db.fetch_embedding_text_hash(thread_ts) == digest:
+        return None
+    return thread_text, digest
+
+
+def _coalesce(pending: Dict[str, Tuple[str, bool]], applied: Optional[Tuple[str, str, bool]]) -> None:
+    # Keeps one entry per thread, moved to the end on each event, and
+    # remembers whether any of its events changed the text.
+    if applied is None:
+        return
+    thread_ts, channel, text_changed = applied
+    previous = pending.pop(thread_ts, None)
+    pending[thread_ts] = (channel, text_changed or (previous is not None and previous[1]))
+
+
+def _refresh_thread_digest(thread_ts: str, channel: str, text_changed: bool) -> Optional[Tuple[str, bytes]]:
+    # Refreshes the stats and digest item, and returns the text and hash to
+    # embed when the thread text changed since its last embedding.
+    _refresh_digest(thread_ts, channel)
+    if not text_changed:
+        return None
+    return _stale_text(thread_ts)
+
+
+def refresh_thread(thread_ts: str, channel: str, text_changed: bool) -> None:
+    stale = _refresh_thread_digest(thread_ts, channel, text_changed)
+    if stale is not None:
+        embed_and_store(thread_ts, stale[0], db.upsert_embedding, stale[1])
+
+
+def process_event_sync(payload: SlackEventPayload) -> None:
+    with db.write_transaction():
+        applied = _apply_event(payload)
+        if applied is not None:
+            refresh_thread(*applied)
+
+
+async def process_event(payload: SlackEventPayload) -> None:
+    process_event_sync(payload)
+
+
+def _apply_batch(
+    payloads: Iterable[SlackEventPayload],
+    on_applied: Optional[Callable[[SlackEventPayload], None]] = None,
+) -> None:
+    # Runs inside the caller's transaction. Each event and each thread refresh
+    # gets its own savepoint, so a failure only drops that one; every touched
+    # thread is refreshed once after all of its events, and the stale ones are
+    # embedded together.
+    pending: Dict[str, Tuple[str, bool]] = {}
+    for payload in payloads:
+        try:
+            with db.write_transaction():
+                applied = _apply_event(payload)
+        except Exception:
+            logger.exception("failed to apply event %s", payload.event_id)
+            continue
+        if on_applied is not None:
+            on_applied(payload)
+        _coalesce(pending, applied)
+    stale = []
+    for thread_ts, (channel, text_changed) in pending.items():
+        try:
+            with db.write_transaction():
+                stale_text = _refresh_thread_digest(thread_ts, channel, text_changed)
+        except Exception:
+            logger.exception("failed to refresh thread %s", thread_ts)
+            continue
+        if stale_text is not None:
+            stale.append((thread_ts, *stale_text))
+    vectors = compute_embeddings([text for _, text, _ in stale])
+    for (thread_ts, _, digest), vector in zip(stale, vectors):
+        db.upsert_embedding(thread_ts, len(vector), vector, digest)
+
+
+def process_event_batch_sync(payloads: Iterable[SlackEventPayload]) -> None:
+    with db.write_transaction():
+        _apply_batch(payloads)
+
+
+async def process_event_batch(payloads: Iterable[SlackEventPayload]) -> None:
+    process_event_batch_sync(payloads)
+
+
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "64"))
+
+
+def _drain(queue: asyncio.Queue, first: SlackEventPayload) -> List[SlackEventPayload]:
+    batch = [first]
+    while len(batch) < WORKER_BATCH_SIZE and not queue.empty():
+        batch.append(queue.get_nowait())
+    return batch
 
 
 async def worker_loop(queue: asyncio.Queue, queue_name: str) -> None:
     while True:
-        payload = await queue.get()
+        batch = _drain(queue, await queue.get())
         try:
-            await process_event(payload)
-            db.increment_metric(queue_name)
+            # Events already waiting are written in one transaction. Nothing
+            # here yields to the loop.
+            with db.write_transaction():
+                _apply_batch(batch, lambda _: db.increment_metric(queue_name))
+        except Exception:
+            logger.exception("failed to process %s batch", queue_name)
         finally:
-            queue.task_done()
+            for _ in batch:
+                queue.task_done()
 
 
 def start_workers(
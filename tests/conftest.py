@@ -1,6 +1,18 @@
 import sys
 from pathlib import Path
 
+import pytest
+from fastapi.testclient import TestClient
+
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+
+    # Not entered as a context manager: app startup would launch the queue
+    # workers and the scheduler loop against the per-test database.
+    return TestClient(app)
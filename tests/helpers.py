@@ -0,0 +1,10 @@
+import itertools
+import time
+
+_TS_COUNTER = itertools.count(time.time_ns() // 1000)
+
+
+def next_ts() -> str:
+    # Slack-style "seconds.micros" timestamps, strictly increasing per process.
+    micros = next(_TS_COUNTER)
+    return f"{micros // 1_000_000}.{micros % 1_000_000:06d}"
@@ -0,0 +1,332 @@
+import time
+
+import numpy as np
+import pytest
+
+from app import db
+
+
+@pytest.fixture(autouse=True)
+def setup_db(tmp_path, monkeypatch):
+    db.reset_db()
+    db_path = tmp_path / "test_db.db"
+    monkeypatch.setenv("DATABASE_PATH", str(db_path))
+    db.init_db()
+    yield
+    db.reset_db()
+
+
+def test_insert_messages_bulk_ignores_duplicates():
+    rows = [
+        ("C001", "1.000", "1.000", "U001", "Root", None),
+        ("C001", "1.001", "1.000", "U002", "Reply", None),
+        ("C001", "1.000", "1.000", "U001", "Root", None),
+    ]
+    assert db.insert_messages_bulk(rows) == 2
+    assert db.insert_message("C001", "1.001", "1.000", "U002", "Reply", None) is False
+    assert [row["ts"] for row in db.get_messages_for_thread("1.000")] == ["1.000", "1.001"]
+
+
+def test_get_messages_for_threads_groups_across_chunks(monkeypatch):
+    monkeypatch.setattr(db, "SQL_VARIABLE_CHUNK", 2)
+    db.insert_messages_bulk(
+        [
+            ("C001", "1.000", "1.000", "U001", "Root", None),
+            ("C001", "1.001", "1.000", "U002", "Reply", None),
+            ("C001", "2.000", "2.000", "U003", "Other", None),
+        ]
+    )
+    grouped = db.get_messages_for_threads(["1.000", "2.000", "3.000", "1.000"])
+    assert [row["user"] for row in grouped["1.000"]] == ["U001", "U002"]
+    assert [row["text"] for row in grouped["2.000"]] == ["Other"]
+    assert grouped["3.000"] == []
+
+
+def test_write_transaction_rolls_back_on_error():
+    with pytest.raises(RuntimeError):
+        with db.write_transaction():
+            db.insert_message("C001", "1.000", "1.000", "U001", "Root", None)
+            assert len(db.get_messages_for_thread("1.000")) == 1
+            raise RuntimeError("boom")
+    assert len(db.get_messages_for_thread("1.000")) == 0
+
+
+def test_summary_fetchers_project_only_requested_columns():
+    db.insert_raw_event("Ev1", {"event": {"text": "hello"}})
+    db.upsert_thread("1.000", "C001", "1.000", 1.0, 2.0, 0, 0, ["U001"])
+    ids = db.fetch_raw_event_ids(10)
+    assert [tuple(row) for row in ids] == [("Ev1", ids[0]["received_at"])]
+    assert db.unpack_payload(db.fetch_raw_event_payload("Ev1")["payload"]) == {"event": {"text": "hello"}}
+    summary = db.fetch_thread_summaries(10)[0]
+    assert summary.keys() == ["thread_ts", "channel", "last_activity", "reply_count", "reaction_count"]
+
+
+def test_insert_raw_event_stores_encoded_body_as_is():
+    db.insert_raw_event("Ev1", b'{"event":{"text":"raw"}}')
+    assert db.unpack_payload(db.fetch_raw_event_payload("Ev1")["payload"]) == {"event": {"text": "raw"}}
+
+
+def test_iter_messages_for_thread_streams_past_arraysize():
+    count = db.ITER_ARRAYSIZE + 10
+    db.insert_messages_bulk(
+        [("C001", f"{1 + i / 1000:.3f}", "1.000", "U001", "msg", None) for i in range(count)]
+    )
+    rows = db.iter_messages_for_thread("1.000")
+    assert not isinstance(rows, list)
+    assert sum(1 for _ in rows) == count
+
+
+def test_write_transaction_shares_one_timestamp():
+    with db.write_transaction():
+        db.insert_raw_event("Ev1", {})
+        db.insert_message("C001", "1.000", "1.000", "U001", "Root", None)
+    received_at = db.fetch_raw_event_payload("Ev1")["received_at"]
+    assert received_at is not None
+    assert db.fetch_message("C001", "1.000")["created_at"] == received_at
+
+
+def test_insert_dedupe_falls_back_to_db_after_eviction(monkeypatch):
+    monkeypatch.setattr(db, "DEDUPE_CACHE_SIZE", 1)
+    assert db.insert_dedupe("Ev1") is True
+    assert db.insert_dedupe("Ev1") is False
+    db.flush_dedupe()
+    assert db.insert_dedupe("Ev2") is True
+    assert db.insert_dedupe("Ev1") is False
+    db.flush_dedupe()
+    with db.read_cursor() as cur:
+        cur.execute("SELECT event_id FROM dedupe_events ORDER BY event_id")
+        assert [row["event_id"] for row in cur.fetchall()] == ["Ev1", "Ev2"]
+
+
+def test_fetch_metrics_includes_buffered_increments():
+    for _ in range(3):
+        db.increment_metric("hot")
+    metrics = {row["queue_name"]: row["processed_count"] for row in db.fetch_metrics()}
+    assert metrics == {"hot": 3}
+    db.increment_metric("hot")
+    assert db.fetch_metrics()[0]["processed_count"] == 4
+
+
+def test_raw_events_migrates_legacy_payload_json(tmp_path, monkeypatch):
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "legacy.db"))
+    with db.write_cursor() as cur:
+        cur.execute("CREATE TABLE raw_events (event_id TEXT PRIMARY KEY, received_at REAL, payload_json TEXT)")
+        cur.execute("INSERT INTO raw_events VALUES ('Ev1', 1.0, '{\"type\": \"message\"}')")
+    db.init_db()
+    row = db.fetch_raw_event_payload("Ev1")
+    assert db.unpack_payload(row["payload"]) == {"type": "message"}
+
+
+def test_upsert_embedding_accepts_ndarray():
+    vector = np.linspace(0.0, 1.0, 8, dtype=np.float32)
+    db.upsert_embedding("1.000", len(vector), vector)
+    stored = db.unpack_vector(db.fetch_embedding("1.000")["vector"])
+    assert stored.dtype == np.float32
+    assert np.array_equal(stored, vector)
+
+
+def test_expire_dedupe_drops_old_ids():
+    assert db.insert_dedupe("Ev1") is True
+    db.flush_dedupe()
+    db.expire_dedupe(time.time() + 1)
+    with db.read_cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM dedupe_events")
+        assert cur.fetchone()[0] == 0
+
+
+def test_init_db_records_schema_version():
+    db.init_db()
+    with db.read_cursor() as cur:
+        cur.execute("PRAGMA user_version")
+        assert cur.fetchone()[0] == db.SCHEMA_VERSION
+
+
+def test_nested_write_transaction_rolls_back_to_savepoint():
+    with db.write_transaction():
+        db.insert_message("C001", "1.000", "1.000", "U001", "Root", None)
+        with pytest.raises(RuntimeError):
+            with db.write_transaction():
+                db.insert_message("C001", "1.001", "1.000", "U002", "Reply", None)
+                raise RuntimeError("boom")
+    assert [row["ts"] for row in db.get_messages_for_thread("1.000")] == ["1.000"]
+
+
+def test_update_message_reactions_applies_delta_in_sql():
+    db.insert_message("C001", "1.000", "1.000", "U001", "Root", '[{"name": "eyes", "count": 1}]')
+    assert db.update_message_reactions("C001", "1.000", "tada", 1) == "1.000"
+    assert db.update_message_reactions("C002", "9.000", "tada", 1) is None
+    db.update_message_reactions("C001", "1.000", "eyes", -1)
+    db.update_message_reactions("C001", "1.000", "tada", 1)
+    assert db.fetch_message("C001", "1.000")["reactions_json"] == '[{"name":"tada","count":2}]'
+    db.refresh_thread_stats("1.000", "C001", "1.000", 1.0)
+    assert db.get_thread("1.000")["reaction_count"] == 2
+
+
+def test_fetch_role_is_cached_until_upsert():
+    db.upsert_role("role-1", "PM", "Owns timelines", "[]")
+    assert db.fetch_role("role-1")["name"] == "PM"
+    with db.write_cursor() as cur:
+        cur.execute("UPDATE roles SET name = 'Changed' WHERE role_id = 'role-1'")
+    assert db.fetch_role("role-1")["name"] == "PM"
+    db.upsert_role("role-1", "Lead", "Owns timelines", "[]")
+    assert db.fetch_role("role-1")["name"] == "Lead"
+
+
+def test_project_channels_are_cached_until_added():
+    db.upsert_project("proj-1", "Alpha", "EVT", "[]")
+    db.add_project_channel("proj-1", "C001")
+    assert [row["channel_id"] for row in db.fetch_project_channels("proj-1")] == ["C001"]
+    with db.write_cursor() as cur:
+        cur.execute("DELETE FROM project_channels")
+    assert [row["channel_id"] for row in db.fetch_project_channels("proj-1")] == ["C001"]
+    db.add_project_channel("proj-1", "C002")
+    assert [row["channel_id"] for row in db.fetch_project_channels("proj-1")] == ["C002"]
+    db.update_project_phase("proj-1", "DVT")
+    assert db.fetch_project("proj-1")["current_phase"] == "DVT"
+
+
+def test_profile_vectors_migrate_to_blobs(tmp_path, monkeypatch):
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "legacy_roles.db"))
+    with db.write_cursor() as cur:
+        cur.execute(
+            "CREATE TABLE roles (role_id TEXT PRIMARY KEY, name TEXT, description TEXT, "
+            "role_vector_json TEXT, updated_at REAL)"
+        )
+        cur.execute("INSERT INTO roles VALUES ('role-1', 'PM', 'Owns timelines', '[0.6, 0.8]', 1.0)")
+    db.init_db()
+    row = db.fetch_role("role-1")
+    assert db.unpack_vector(row["role_vector"]).tolist() == pytest.approx([0.6, 0.8])
+    db.upsert_role("role-1", "PM", "Owns timelines", "[1.0, 0.0]")
+    assert db.unpack_vector(db.fetch_role("role-1")["role_vector"]).tolist() == [1.0, 0.0]
+
+
+def test_legacy_embeddings_migrate_to_unit_float32(tmp_path, monkeypatch):
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "legacy_embeddings.db"))
+    with db.write_cursor() as cur:
+        cur.execute("CREATE TABLE embeddings (thread_ts TEXT PRIMARY KEY, dim INTEGER, vector_json TEXT, updated_at REAL)")
+        cur.execute("INSERT INTO embeddings VALUES ('1.000', 2, '[3.0, 4.0]', 1.0)")
+    db.init_db()
+    vector = db.unpack_vector(db.fetch_embedding("1.000")["vector"])
+    assert vector.dtype == np.float32
+    assert vector.tolist() == pytest.approx([0.6, 0.8])
+    with db.read_cursor() as cur:
+        cur.execute("SELECT vector_json FROM embeddings WHERE thread_ts = '1.000'")
+        assert cur.fetchone()[0] is None
+
+
+def test_digest_items_backfill_labels_mask(tmp_path, monkeypatch):
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "legacy_items.db"))
+    with db.write_cursor() as cur:
+        cur.execute(
+            "CREATE TABLE digest_items (thread_ts TEXT PRIMARY KEY, channel TEXT NOT NULL, title TEXT, "
+            "labels_json TEXT, entities_json TEXT, urgency REAL, summary TEXT, updated_at REAL)"
+        )
+        cur.execute("INSERT INTO digest_items VALUES ('1.000', 'C001', 'T', '[\"BLOCKER\", \"FYI\"]', '{}', 0.5, 'S', 1.0)")
+    db.init_db()
+    with db.read_cursor() as cur:
+        cur.execute("SELECT labels_mask FROM digest_items WHERE thread_ts = '1.000'")
+        assert cur.fetchone()[0] == db.LABEL_BITS["BLOCKER"] | db.LABEL_BITS["FYI"]
+
+
+def test_thread_stats_aggregate_visible_messages():
+    db.insert_messages_bulk(
+        [
+            ("C001", "1.000", "1.000", "U002", "Root", '[{"name":"tada","count":2}]'),
+            ("C001", "1.001", "1.000", "U001", "Reply", '[{"name":"eyes"}]'),
+            ("C001", "1.002", "1.000", "U003", "Gone", '[{"name":"tada","count":5}]'),
+            ("C001", "1.003", "1.000", None, "Bot", "not json"),
+        ]
+    )
+    db.mark_message_deleted("C001", "1.002")
+    db.refresh_thread_stats("1.000", "C001", "1.000", 1.0)
+    stats = db.get_thread("1.000")
+    assert stats["last_activity"] == 1.003
+    assert stats["reply_count"] == 2
+    assert stats["reaction_count"] == 3
+    assert stats["participants_json"] == '["U001","U002"]'
+
+
+def test_refresh_thread_stats_upserts_aggregates():
+    db.insert_messages_bulk(
+        [
+            ("C001", "1.000", "1.000", "U002", "Root", '[{"name":"tada","count":2}]'),
+            ("C001", "1.001", "1.000", "U001", "Reply", None),
+        ]
+    )
+    db.refresh_thread_stats("1.000", "C001", "1.000", 1.0)
+    db.insert_messages_bulk([("C001", "1.002", "1.000", "U003", "Late reply", None)])
+    db.refresh_thread_stats("1.000", "C001", "1.000", 1.0)
+    db.refresh_thread_stats("9.000", "C001", "9.000", 9.0)
+    threads = db.fetch_threads(10)
+    assert [row["thread_ts"] for row in threads] == ["1.000"]
+    assert threads[0]["reply_count"] == 2
+    assert threads[0]["reaction_count"] == 2
+    assert threads[0]["last_activity"] == 1.002
+    assert threads[0]["participants_json"] == '["U001","U002","U003"]'
+
+
+def test_messages_backfill_reaction_count(tmp_path, monkeypatch):
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "legacy_messages.db"))
+    with db.write_cursor() as cur:
+        cur.execute(
+            "CREATE TABLE messages (channel TEXT NOT NULL, ts TEXT NOT NULL, thread_ts TEXT NOT NULL, user TEXT, "
+            "text TEXT, reactions_json TEXT, created_at REAL, PRIMARY KEY (channel, ts))"
+        )
+        cur.execute("INSERT INTO messages VALUES ('C001', '1.000', '1.000', 'U001', 'Root', '[{\"name\": \"eyes\"}, {\"name\": \"tada\", \"count\": 3}]', 1.0)")
+        cur.execute("INSERT INTO messages VALUES ('C001', '1.001', '1.000', 'U002', 'Reply', 'broken', 1.0)")
+    db.init_db()
+    db.refresh_thread_stats("1.000", "C001", "1.000", 1.0)
+    assert db.get_thread("1.000")["reaction_count"] == 4
+
+
+def test_fetch_items_matching_filters_summary_case_sensitively():
+    db.upsert_digest_item("1.000", "C001", "A", ["FYI"], {}, 0.1, "Vendor A quoted 8 weeks")
+    db.upsert_digest_item("2.000", "C001", "B", ["FYI"], {}, 0.1, "vendor call moved")
+    db.upsert_digest_item("3.000", "C001", "C", ["FYI"], {}, 0.1, None)
+    assert [row["thread_ts"] for row in db.fetch_items_matching(10, "Vendor")] == ["1.000"]
+    assert db.fetch_items_matching(10, "missing") == []
+
+
+def test_flusher_survives_errors_and_stops_on_reset(monkeypatch):
+    monkeypatch.setattr(db, "FLUSH_INTERVAL", 0.0)
+    calls = []
+    flush_pending = db.flush_pending
+
+    def failing_flush():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(db, "flush_pending", failing_flush)
+    db.insert_dedupe("evt-flusher-1")
+    thread = db._FLUSH_THREAD[0]
+    deadline = time.time() + 2
+    while not calls and time.time() < deadline:
+        time.sleep(0.01)
+    assert calls
+    assert thread.is_alive()
+
+    monkeypatch.setattr(db, "flush_pending", flush_pending)
+    db.reset_db()
+    assert not thread.is_alive()
+    assert db._FLUSH_THREAD is None
+
+
+def test_role_cache_is_invalidated_after_the_outer_commit():
+    import threading
+
+    db.upsert_role("role-1", "PM", "Old", "[1.0]")
+    assert db.fetch_role("role-1")["description"] == "Old"
+    with db.write_transaction():
+        db.upsert_role("role-1", "PM", "New", "[1.0]")
+        # Another thread still sees (and may cache) the committed row.
+        seen = []
+        reader = threading.Thread(target=lambda: seen.append(db.fetch_role("role-1")["description"]))
+        reader.start()
+        reader.join()
+        assert seen == ["Old"]
+    assert db.fetch_role("role-1")["description"] == "New"
@@ -2,13 +2,13 @@ import time
 import uuid
 
 import pytest
-from fastapi.testclient import TestClient
 
 from app import db
-from app.main import app
 from app.models import SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user
-from app.workers import process_event
+from app.workers import process_event_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -39,8 +39,7 @@ def make_payload(text: str, thread_ts: str, ts: str, channel: str = "C001", user
     )
 
 
-@pytest.mark.asyncio
-async def test_digest_endpoint_and_storage():
+def test_digest_endpoint_and_storage(client):
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
@@ -48,8 +47,8 @@ async def test_digest_endpoint_and_storage():
     db.add_project_channel("proj-1", "C001")
     db.add_user_channel("user-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(
+    base_ts = next_ts()
+    process_event_sync(
         make_payload(
             "Decision needed by Friday; EVT is blocked and urgent.",
             thread_ts=base_ts,
@@ -57,7 +56,6 @@ async def test_digest_endpoint_and_storage():
         )
     )
 
-    client = TestClient(app)
     response = client.get("/digest", params={"user_id": "user-1", "project_id": "proj-1", "n": 1})
     assert response.status_code == 200
     payload = response.json()
@@ -67,3 +65,58 @@ async def test_digest_endpoint_and_storage():
 
     row = db.fetch_digest(payload["digest_id"])
     assert row is not None
+
+
+def test_build_digest_reuses_ranking_until_items_change(monkeypatch):
+    from app import digest
+
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+    db.add_project_channel("proj-1", "C001")
+    db.add_user_channel("user-1", "C001")
+
+    first_ts = next_ts()
+    process_event_sync(make_payload("Decision needed on the EVT build.", thread_ts=first_ts, ts=first_ts))
+
+    calls = []
+    rerank = digest.rerank_candidates
+
+    def counting_rerank(*args, **kwargs):
+        calls.append(1)
+        return rerank(*args, **kwargs)
+
+    monkeypatch.setattr(digest, "rerank_candidates", counting_rerank)
+
+    first = digest.build_digest("user-1", "proj-1", n=5)
+    second = digest.build_digest("user-1", "proj-1", n=5)
+    assert len(calls) == 1
+    assert second["items"] == first["items"]
+    assert second["digest_id"] != first["digest_id"]
+
+    second_ts = next_ts()
+    process_event_sync(make_payload("Vendor lead time slipped to six weeks.", thread_ts=second_ts, ts=second_ts))
+    third = digest.build_digest("user-1", "proj-1", n=5)
+    assert len(calls) == 2
+    assert {item["thread_ts"] for item in third["items"]} == {first_ts, second_ts}
+
+
+def test_cached_digest_items_are_not_shared_with_callers():
+    from app import digest
+
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+    db.add_project_channel("proj-1", "C001")
+    db.add_user_channel("user-1", "C001")
+    thread_ts = next_ts()
+    process_event_sync(make_payload("Decision needed: vendor lead time for EVT.", thread_ts=thread_ts, ts=thread_ts))
+
+    first = digest.build_digest("user-1", "proj-1", n=5)["items"]
+    expected = digest.build_digest("user-1", "proj-1", n=5)["items"]
+    first[0]["labels"].append("MUTATED")
+    first[0]["entities"].setdefault("vendors", []).append("MUTATED")
+    first[0]["score_breakdown"]["final_score"] = -1.0
+    assert digest.build_digest("user-1", "proj-1", n=5)["items"] == expected
@@ -1,11 +1,16 @@
+import asyncio
 import time
 import uuid
 
+import numpy as np
 import pytest
 
 from app import db
 from app.models import SlackEventPayload
-from app.workers import process_event
+from app import workers
+from app.workers import process_event_batch_sync, process_event_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -83,50 +88,137 @@ def make_reaction_payload(channel: str, ts: str, reaction: str, added: bool = Tr
     )
 
 
-@pytest.mark.asyncio
-async def test_edit_updates_summary_and_embedding():
+def test_edit_updates_summary_and_embedding():
     channel = "C001"
-    base_ts = str(time.time())
-    await process_event(make_message_payload("Original text", channel, base_ts, base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_message_payload("Original text", channel, base_ts, base_ts))
 
-    item_before = db.fetch_items(1)[0]
+    item_before = db.fetch_latest_item()
     emb_before = db.fetch_embedding(base_ts)
     summary_before = item_before["summary"]
     updated_at_before = emb_before["updated_at"]
 
     time.sleep(0.01)
-    await process_event(make_message_changed_payload(channel, base_ts, base_ts, "Edited text"))
+    process_event_sync(make_message_changed_payload(channel, base_ts, base_ts, "Edited text"))
 
-    item_after = db.fetch_items(1)[0]
+    item_after = db.fetch_latest_item()
     emb_after = db.fetch_embedding(base_ts)
     assert "Edited text" in item_after["summary"]
     assert item_after["summary"] != summary_before
     assert emb_after["updated_at"] > updated_at_before
 
 
-@pytest.mark.asyncio
-async def test_reaction_increases_urgency():
+def test_reaction_increases_urgency():
     channel = "C001"
-    base_ts = str(time.time())
-    await process_event(make_message_payload("FYI: update", channel, base_ts, base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_message_payload("FYI: update", channel, base_ts, base_ts))
 
-    urgency_before = db.fetch_items(1)[0]["urgency"]
-    await process_event(make_reaction_payload(channel, base_ts, "rotating_light", added=True))
-    urgency_after = db.fetch_items(1)[0]["urgency"]
+    urgency_before = db.fetch_latest_item()["urgency"]
+    process_event_sync(make_reaction_payload(channel, base_ts, "rotating_light", added=True))
+    urgency_after = db.fetch_latest_item()["urgency"]
     assert urgency_after > urgency_before
 
 
-@pytest.mark.asyncio
-async def test_delete_removes_from_summary():
+def test_delete_removes_from_summary():
     channel = "C001"
-    base_ts = str(time.time())
-    reply_ts = str(float(base_ts) + 0.001)
-    await process_event(make_message_payload("Root", channel, base_ts, base_ts))
-    await process_event(make_message_payload("Reply to remove", channel, reply_ts, base_ts))
+    base_ts = next_ts()
+    reply_ts = next_ts()
+    process_event_sync(make_message_payload("Root", channel, base_ts, base_ts))
+    process_event_sync(make_message_payload("Reply to remove", channel, reply_ts, base_ts))
 
-    summary_before = db.fetch_items(1)[0]["summary"]
+    summary_before = db.fetch_latest_item()["summary"]
     assert "Reply to remove" in summary_before
 
-    await process_event(make_message_deleted_payload(channel, reply_ts, base_ts))
-    summary_after = db.fetch_items(1)[0]["summary"]
+    process_event_sync(make_message_deleted_payload(channel, reply_ts, base_ts))
+    summary_after = db.fetch_latest_item()["summary"]
     assert "Reply to remove" not in summary_after
+
+
+def test_unchanged_text_skips_reembedding():
+    channel = "C001"
+    base_ts = next_ts()
+    process_event_sync(make_message_payload("Original text", channel, base_ts, base_ts))
+    updated_at_before = db.fetch_embedding(base_ts)["updated_at"]
+
+    time.sleep(0.01)
+    process_event_sync(make_reaction_payload(channel, base_ts, "eyes", added=True))
+    process_event_sync(make_message_changed_payload(channel, base_ts, base_ts, "Original text"))
+    assert db.fetch_embedding(base_ts)["updated_at"] == updated_at_before
+
+
+@pytest.mark.asyncio
+async def test_worker_batch_refreshes_each_thread_once(monkeypatch):
+    channel = "C001"
+    base_ts = next_ts()
+    queue: asyncio.Queue = asyncio.Queue()
+    queue.put_nowait(make_message_payload("Root message", channel, base_ts, base_ts))
+    for offset in (1, 2, 3):
+        reply_ts = next_ts()
+        queue.put_nowait(make_message_payload(f"Reply {offset}", channel, reply_ts, base_ts))
+
+    refreshed = []
+    refresh_thread_digest = workers._refresh_thread_digest
+
+    def counting_refresh(thread_ts, channel, text_changed):
+        refreshed.append(thread_ts)
+        return refresh_thread_digest(thread_ts, channel, text_changed)
+
+    monkeypatch.setattr(workers, "_refresh_thread_digest", counting_refresh)
+    task = asyncio.create_task(workers.worker_loop(queue, "standard"))
+    await asyncio.wait_for(queue.join(), timeout=1)
+    task.cancel()
+
+    assert refreshed == [base_ts]
+    assert len(db.get_messages_for_thread(base_ts)) == 4
+    assert db.get_thread(base_ts)["reply_count"] == 3
+    assert "Reply 3" in db.fetch_latest_item()["summary"]
+
+
+def test_event_batch_matches_sequential_processing(tmp_path, monkeypatch):
+    base_ts = next_ts()
+    payloads = [make_message_payload("Decision needed on the hinge", "C001", base_ts, base_ts)]
+    for offset in (1, 2):
+        reply_ts = next_ts()
+        payloads.append(make_message_payload(f"Reply {offset} blocked", "C001", reply_ts, base_ts))
+    other_ts = next_ts()
+    payloads.append(make_message_payload("FYI status", "C002", other_ts, other_ts))
+
+    process_event_batch_sync(payloads)
+    batched = {row["thread_ts"]: row for row in db.fetch_items(10)}
+    batched_vectors = {ts: db.unpack_vector(db.fetch_embedding(ts)["vector"]).copy() for ts in batched}
+
+    db.reset_db()
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "sequential.db"))
+    db.init_db()
+    for payload in payloads:
+        process_event_sync(payload)
+    sequential = {row["thread_ts"]: row for row in db.fetch_items(10)}
+
+    assert set(batched) == set(sequential) == {base_ts, other_ts}
+    for ts, row in sequential.items():
+        assert batched[ts]["summary"] == row["summary"]
+        assert batched[ts]["labels_json"] == row["labels_json"]
+        assert np.array_equal(batched_vectors[ts], db.unpack_vector(db.fetch_embedding(ts)["vector"]))
+
+
+def test_event_batch_drops_only_the_failing_event(monkeypatch):
+    first_ts = next_ts()
+    bad_ts = next_ts()
+    last_ts = next_ts()
+    apply_event = workers._apply_event
+
+    def flaky_apply(payload):
+        if payload.event.ts == bad_ts:
+            raise RuntimeError("boom")
+        return apply_event(payload)
+
+    monkeypatch.setattr(workers, "_apply_event", flaky_apply)
+    process_event_batch_sync(
+        [
+            make_message_payload("First", "C001", first_ts, first_ts),
+            make_message_payload("Broken", "C001", bad_ts, bad_ts),
+            make_message_payload("Last", "C001", last_ts, last_ts),
+        ]
+    )
+    assert sorted(row["thread_ts"] for row in db.fetch_items(10)) == [first_ts, last_ts]
+    assert db.fetch_embedding(last_ts) is not None
@@ -1,15 +1,18 @@
-import json
 import math
 import time
 import uuid
 
+import numpy as np
+import orjson
 import pytest
 
 from app import db
-from app.feedback import apply_feedback
+from app.feedback import _decay_user_vector, apply_feedback
 from app.models import SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user, get_query_vector
-from app.workers import process_event
+from app.workers import process_event_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -41,29 +44,28 @@ def make_payload(text: str, thread_ts: str, ts: str, channel: str = "C001", user
 
 
 def dot(a, b):
-    return sum(x * y for x, y in zip(a, b))
+    return float(np.dot(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)))
 
 
 def get_user_vector(user_id: str):
     user = db.fetch_user(user_id)
-    return json.loads(user["user_vector_json"])
+    return orjson.loads(user["user_vector_json"])
 
 
 def get_item_vector(thread_ts: str):
     emb = db.fetch_embedding(thread_ts)
-    return json.loads(emb["vector_json"])
+    return db.unpack_vector(emb["vector"])
 
 
-@pytest.mark.asyncio
-async def test_positive_feedback_moves_closer():
+def test_positive_feedback_moves_closer():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
 
     u_old = get_user_vector("user-1")
     v = get_item_vector(base_ts)
@@ -75,16 +77,15 @@ async def test_positive_feedback_moves_closer():
     assert after > before
 
 
-@pytest.mark.asyncio
-async def test_negative_feedback_moves_away():
+def test_negative_feedback_moves_away():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
 
     u_old = get_user_vector("user-1")
     v = get_item_vector(base_ts)
@@ -96,19 +97,61 @@ async def test_negative_feedback_moves_away():
     assert after < before
 
 
-@pytest.mark.asyncio
-async def test_query_vector_changes_after_feedback():
+def test_query_vector_changes_after_feedback():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_payload("Decision needed", thread_ts=base_ts, ts=base_ts))
 
     q_before = get_query_vector("user-1", "proj-1")["q_vector"]
     apply_feedback("user-1", "proj-1", base_ts, "click")
     q_after = get_query_vector("user-1", "proj-1")["q_vector"]
 
     assert q_before != q_after
+
+
+def test_decay_blends_stale_user_vector_toward_role():
+    user_vec = np.array([1.0, 0.0], dtype=np.float32)
+    role_vec = np.array([0.0, 1.0], dtype=np.float32)
+    assert _decay_user_vector(user_vec, role_vec, time.time()) is user_vec
+    decayed = _decay_user_vector(user_vec, role_vec, time.time() - 30 * 86400)
+    assert decayed[1] > 0
+    assert math.isclose(float(np.linalg.norm(decayed)), 1.0, rel_tol=1e-9)
+
+
+def test_reembed_rebuilds_vectors_from_text_and_feedback():
+    from app.embedding import EMBEDDING_VERSION, compute_embedding
+    from app.reembed import reembed_stale_vectors
+
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+    thread_ts = next_ts()
+    process_event_sync(make_payload("Vendor lead time slipped", thread_ts=thread_ts, ts=thread_ts))
+    apply_feedback("user-1", "proj-1", thread_ts, "thumbs_up")
+    expected_user = db.fetch_user("user-1")["user_vector_json"]
+
+    # Simulate vectors written by an older bucketing.
+    stale = orjson.dumps([1.0] + [0.0] * 63).decode()
+    db.upsert_role("role-1", "PM", "Owns delivery timelines and decisions", stale)
+    db.upsert_phase("EVT", "Engineering validation testing phase", stale)
+    db.update_user_vector("user-1", stale)
+    db.upsert_embedding(thread_ts, 64, np.eye(64)[0], b"")
+
+    assert reembed_stale_vectors() is True
+    assert db.fetch_embedding_version() == EMBEDDING_VERSION
+    role_vec = np.asarray(orjson.loads(db.fetch_role("role-1")["role_vector_json"]))
+    assert np.allclose(role_vec, compute_embedding("Owns delivery timelines and decisions"))
+    phase_vec = np.asarray(orjson.loads(db.fetch_phase("EVT")["phase_vector_json"]))
+    assert np.allclose(phase_vec, compute_embedding("Engineering validation testing phase"))
+    item_vec = db.unpack_vector(db.fetch_embedding(thread_ts)["vector"])
+    assert np.allclose(item_vec, compute_embedding("Vendor lead time slipped"), atol=1e-6)
+    user_vec = orjson.loads(db.fetch_user("user-1")["user_vector_json"])
+    assert np.allclose(user_vec, orjson.loads(expected_user), atol=1e-6)
+
+    assert reembed_stale_vectors() is False
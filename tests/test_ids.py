@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from app.ids import new_id
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_forked_child_does_not_reuse_pooled_ids():
+    new_id("warm")
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        os.write(write_fd, new_id("x").encode())
+        os._exit(0)
+    os.close(write_fd)
+    child_id = os.read(read_fd, 64).decode()
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    assert child_id.startswith("x-")
+    assert child_id != new_id("x")
@@ -1,15 +1,20 @@
-import json
+import asyncio
 import time
 import uuid
 
+import numpy as np
+import orjson
 import pytest
 
 from app import db
-from app.enrichment import build_title
+from app.embedding import EMBEDDING_VERSION, compute_embedding
+from app.enrichment import LABEL_KEYWORDS, build_title, classify_labels, compute_urgency, extract_entities, scan
 from app.ingest import ingest_payload
 from app.models import SlackEventPayload
 from app.queueing import QUEUES
-from app.workers import process_event
+from app.workers import process_event_batch_sync, process_event_sync, worker_loop
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -30,7 +35,7 @@ def setup_db(tmp_path, monkeypatch):
 
 def make_payload(text: str, channel: str = "C001", user: str = "U001", ts: str = None, thread_ts: str = None):
     if ts is None:
-        ts = str(time.time())
+        ts = next_ts()
     if thread_ts is None:
         thread_ts = ts
     return SlackEventPayload(
@@ -62,25 +67,23 @@ async def test_dedupe_behavior():
     assert QUEUES.standard.qsize() == initial_size + 1
 
 
-@pytest.mark.asyncio
-async def test_thread_aggregation():
+def test_thread_aggregation():
     root = make_payload("Root message")
-    reply = make_payload("Reply", ts=str(float(root.event.ts) + 0.001), thread_ts=root.event.ts, user="U002")
+    reply = make_payload("Reply", ts=next_ts(), thread_ts=root.event.ts, user="U002")
 
-    await process_event(root)
-    await process_event(reply)
+    process_event_sync(root)
+    process_event_sync(reply)
 
     thread = db.get_thread(root.event.ts)
     assert thread is not None
     assert thread["reply_count"] == 1
-    participants = json.loads(thread["participants_json"])
+    participants = orjson.loads(thread["participants_json"])
     assert "U001" in participants
     assert "U002" in participants
 
 
-@pytest.mark.asyncio
-async def test_enrichment_carbon_fiber():
-    base_ts = str(time.time())
+def test_enrichment_carbon_fiber():
+    base_ts = next_ts()
     messages = [
         (
             "We need a decision needed on switching from aluminum to carbon fiber for the chassis. EVT build is blocked.",
@@ -98,8 +101,9 @@ async def test_enrichment_carbon_fiber():
             None,
         ),
     ]
+    payloads = []
     for idx, (text, user, reactions) in enumerate(messages):
-        ts = str(float(base_ts) + idx * 0.001)
+        ts = base_ts if idx == 0 else next_ts()
         payload = SlackEventPayload(
             event_id=f"evt-{uuid.uuid4().hex}",
             event_time=int(time.time()),
@@ -116,25 +120,115 @@ async def test_enrichment_carbon_fiber():
                 "reactions": reactions,
             },
         )
-        await process_event(payload)
+        payloads.append(payload)
+    process_event_batch_sync(payloads)
 
-    row = db.fetch_items(1)[0]
-    labels = json.loads(row["labels_json"])
-    entities = json.loads(row["entities_json"])
+    row = db.fetch_latest_item()
+    labels = orjson.loads(row["labels_json"])
+    entities = orjson.loads(row["entities_json"])
     assert "DECISION" in labels
     assert "RISK" in labels
     assert "carbon fiber" in entities.get("materials", [])
     assert "aluminum" in entities.get("materials", [])
-    assert row["title"] == build_title(entities)
+    thread_text = "\n".join(text for text, _, _ in messages)
+    assert row["title"] == build_title(entities, thread_text)
     assert row["urgency"] > 0.7
 
 
-@pytest.mark.asyncio
-async def test_embedding_created():
+def test_embedding_created():
     payload = make_payload("Embedding test message")
-    await process_event(payload)
+    process_event_sync(payload)
     row = db.fetch_embedding(payload.event.ts)
     assert row is not None
     assert row["dim"] == 64
-    vector = json.loads(row["vector_json"])
+    vector = db.unpack_vector(row["vector"])
     assert len(vector) == 64
+    assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-6
+
+
+def test_embedding_endpoint_serves_raw_vector_bytes(client):
+    payload = make_payload("Embedding bytes message")
+    process_event_sync(payload)
+    expected = db.unpack_vector(db.fetch_embedding(payload.event.ts)["vector"])
+
+    response = client.get(
+        f"/embeddings/{payload.event.ts}", headers={"Accept": "application/octet-stream, */*;q=0.1"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert np.array_equal(db.unpack_vector(response.content), expected)
+
+    response = client.get(f"/embeddings/{payload.event.ts}", headers={"Accept": "application/json"})
+    assert response.json()["vector"] == pytest.approx(expected.tolist())
+
+
+@pytest.mark.asyncio
+async def test_worker_loop_drains_queued_events_in_one_batch():
+    queue = asyncio.Queue()
+    for idx in range(3):
+        queue.put_nowait(make_payload(f"batch message {idx}", ts=f"{100 + idx}.000"))
+    task = asyncio.create_task(worker_loop(queue, "standard"))
+    await asyncio.wait_for(queue.join(), timeout=5)
+    task.cancel()
+    assert len(db.fetch_items(10)) == 3
+    assert db.fetch_metrics()[0]["processed_count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_worker_loop_skips_a_failing_event_and_keeps_running(monkeypatch):
+    from app import workers
+
+    apply_event = workers._apply_event
+
+    def flaky_apply(payload):
+        if payload.event.text == "batch message 1":
+            raise RuntimeError("boom")
+        return apply_event(payload)
+
+    monkeypatch.setattr(workers, "_apply_event", flaky_apply)
+    queue = asyncio.Queue()
+    for idx in range(3):
+        queue.put_nowait(make_payload(f"batch message {idx}", ts=f"{100 + idx}.000"))
+    task = asyncio.create_task(worker_loop(queue, "standard"))
+    await asyncio.wait_for(queue.join(), timeout=5)
+    assert not task.done()
+    assert sorted(row["thread_ts"] for row in db.fetch_items(10)) == ["100.000", "102.000"]
+
+    queue.put_nowait(make_payload("batch message 3", ts="103.000"))
+    await asyncio.wait_for(queue.join(), timeout=5)
+    task.cancel()
+    assert len(db.fetch_items(10)) == 3
+    assert db.fetch_metrics()[0]["processed_count"] == 3
+
+
+def test_keyword_scan_keeps_substring_semantics():
+    text = "Disapproved: the EVT rig is blocked by eod, vendor aluminum issue."
+    assert classify_labels(text) == ["DECISION", "RISK", "BLOCKER"]
+    entities = extract_entities(text)
+    assert entities["phases"] == ["EVT"]
+    assert entities["vendors"] == ["Vendor A"]
+    assert entities["materials"] == ["aluminum"]
+    assert compute_urgency("prevtest", []) == 0.15
+
+
+def test_scan_matches_individual_helpers():
+    text = "Decision: move EVT to carbon fiber by Friday, 6 weeks lead time. Blocked on Vendor B."
+    result = scan(text)
+    assert result.labels == classify_labels(text)
+    assert result.entities == extract_entities(text)
+    assert min(result.keyword_urgency, 1.0) == compute_urgency(text, [])
+
+
+def test_label_bits_cover_every_classified_label():
+    assert set(db.LABEL_BITS) == set(LABEL_KEYWORDS)
+    assert len(set(db.LABEL_BITS.values())) == len(db.LABEL_BITS)
+
+
+def test_embedding_buckets_are_pinned_to_the_embedding_version():
+    # Stored vectors are only re-embedded when EMBEDDING_VERSION changes, so
+    # a different token hash must come with a version bump.
+    assert EMBEDDING_VERSION == 1
+    vector = compute_embedding("Decision vendor decision")
+    assert np.flatnonzero(vector).tolist() == [8, 54]
+    assert vector[8] == pytest.approx(2 / 5 ** 0.5)
+    assert vector[54] == pytest.approx(1 / 5 ** 0.5)
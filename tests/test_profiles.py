@@ -1,10 +1,9 @@
-import json
-import math
-
+import numpy as np
+import orjson
 import pytest
 
 from app import db
-from app.profiles import create_phase, create_project, create_role, create_user, update_project_phase
+from app.profiles import bulk_create_roles, cached_vector, create_phase, create_project, create_role, create_user, update_project_phase
 
 
 @pytest.fixture(autouse=True)
@@ -18,14 +17,14 @@ def setup_db(tmp_path, monkeypatch):
 
 
 def is_normalized(vec):
-    norm = math.sqrt(sum(v * v for v in vec))
+    norm = float(np.linalg.norm(np.asarray(vec, dtype=np.float64)))
     return abs(norm - 1.0) < 1e-6
 
 
 def test_role_vector_normalized():
     vector = create_role("role-1", "PM", "Owns delivery timelines and decisions")
     row = db.fetch_role("role-1")
-    stored = json.loads(row["role_vector_json"])
+    stored = orjson.loads(row["role_vector_json"])
     assert len(vector) == 64
     assert stored == vector
     assert is_normalized(stored)
@@ -34,7 +33,7 @@ def test_role_vector_normalized():
 def test_phase_vector_normalized():
     vector = create_phase("EVT", "Engineering validation testing phase")
     row = db.fetch_phase("EVT")
-    stored = json.loads(row["phase_vector_json"])
+    stored = orjson.loads(row["phase_vector_json"])
     assert len(vector) == 64
     assert stored == vector
     assert is_normalized(stored)
@@ -54,3 +53,27 @@ def test_project_phase_update():
     update_project_phase("proj-1", "PVT")
     project = db.fetch_project("proj-1")
     assert project["current_phase"] == "PVT"
+
+
+def test_cached_vector_reuses_parsed_array():
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    raw = db.fetch_role("role-1")["role_vector_json"]
+    vector = cached_vector(raw)
+    assert cached_vector(raw) is vector
+    assert vector.tolist() == orjson.loads(raw)
+    assert not vector.flags.writeable
+
+
+def test_bulk_create_roles_matches_single_create():
+    vectors = bulk_create_roles(
+        [("role-1", "PM", "Owns delivery timelines and decisions"), ("role-2", "Ops", "")]
+    )
+    assert vectors[1] == [0.0] * 64
+    assert orjson.loads(db.fetch_role("role-1")["role_vector_json"]) == vectors[0]
+    assert vectors[0] == pytest.approx(create_role("role-3", "PM", "Owns delivery timelines and decisions"))
+
+
+def test_project_channels_keep_input_order():
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT", ["C002", "C001", "C002"])
+    assert orjson.loads(db.fetch_project("proj-1")["channels_json"]) == ["C002", "C001", "C002"]
@@ -1,9 +1,8 @@
-import json
-import math
-
+import numpy as np
+import orjson
 import pytest
 
-from app import db
+from app import db, profiles
 from app.profiles import (
     create_phase,
     create_project,
@@ -25,7 +24,7 @@ def setup_db(tmp_path, monkeypatch):
 
 
 def vector_norm(vec):
-    return math.sqrt(sum(v * v for v in vec))
+    return float(np.linalg.norm(np.asarray(vec, dtype=np.float64)))
 
 
 def test_query_vector_normalized():
@@ -60,7 +59,7 @@ def test_query_vector_fallback_role_only():
 
     with db.db_cursor() as cur:
         cur.execute(
-            "UPDATE users SET user_vector_json = NULL WHERE user_id = ?",
+            "UPDATE users SET user_vector_json = NULL, user_vector = NULL WHERE user_id = ?",
             ("user-1",),
         )
         cur.execute(
@@ -68,6 +67,63 @@ def test_query_vector_fallback_role_only():
             ("proj-1",),
         )
 
-    role_vec = json.loads(db.fetch_role("role-1")["role_vector_json"])
+    role_vec = orjson.loads(db.fetch_role("role-1")["role_vector_json"])
     result = get_query_vector("user-1", "proj-1")
-    assert result["q_vector"] == role_vec
+    assert result["q_vector"] == pytest.approx(role_vec)
+
+
+def test_query_vector_reused_until_inputs_change(monkeypatch):
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+
+    calls = []
+    weighted_query_vector = profiles.weighted_query_vector
+
+    def counting(*args):
+        calls.append(args)
+        return weighted_query_vector(*args)
+
+    monkeypatch.setattr(profiles, "weighted_query_vector", counting)
+    profiles._query_vector_for.cache_clear()
+    first = get_query_vector("user-1", "proj-1")
+    second = get_query_vector("user-1", "proj-1")
+    assert len(calls) == 1
+    assert first == second
+
+    user_vec = np.zeros(len(first["q_vector"]))
+    user_vec[0] = 1.0
+    db.update_user_vector("user-1", orjson.dumps(user_vec.tolist()).decode())
+    third = get_query_vector("user-1", "proj-1")
+    assert len(calls) == 2
+    assert third["q_vector"] != first["q_vector"]
+
+
+def test_cached_query_vector_is_not_shared_with_callers():
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+
+    first = get_query_vector("user-1", "proj-1")
+    expected = get_query_vector("user-1", "proj-1")
+    first["q_vector"][0] = 42.0
+    first["weights"]["role"] = 0.0
+    first["component_top_indices"]["role"].append(-1)
+    assert get_query_vector("user-1", "proj-1") == expected
+
+
+def test_query_vector_cache_follows_weight_overrides(monkeypatch):
+    create_role("role-1", "PM", "Owns delivery timelines and decisions")
+    create_phase("EVT", "Engineering validation testing phase")
+    create_project("proj-1", "Alpha", "EVT")
+    create_user("user-1", "Ari", "role-1")
+
+    before = get_query_vector("user-1", "proj-1")
+    monkeypatch.setattr(profiles, "QUERY_WEIGHT_ROLE", 0.0)
+    monkeypatch.setattr(profiles, "QUERY_WEIGHT_USER", 0.0)
+    monkeypatch.setattr(profiles, "QUERY_WEIGHT_PHASE", 1.0)
+    after = get_query_vector("user-1", "proj-1")
+    assert after["weights"] == {"role": 0.0, "user": 0.0, "phase": 1.0}
+    assert after["q_vector"] != before["q_vector"]
@@ -8,8 +8,10 @@ from app import db
 from app.models import SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user, get_query_vector
 from app.rerank import rerank_candidates
-from app.retrieval import load_candidate_items, cosine_sim
-from app.workers import process_event
+from app.retrieval import load_candidate_items, score_candidates
+from app.workers import process_event_batch_sync, process_event_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -40,63 +42,62 @@ def make_payload(text: str, thread_ts: str, ts: str, channel: str = "C001", user
     )
 
 
-@pytest.mark.asyncio
-async def test_rerank_must_include_blocker():
+def test_rerank_must_include_blocker():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
+    base_ts = next_ts()
     urgent_payload = make_payload(
         "Decision needed by Friday; EVT is blocked and urgent.",
         thread_ts=base_ts,
         ts=base_ts,
     )
-    await process_event(urgent_payload)
+    process_event_sync(urgent_payload)
 
-    other_ts = str(float(base_ts) + 1.0)
+    other_ts = next_ts()
     other_payload = make_payload(
         "FYI: status update.",
         thread_ts=other_ts,
         ts=other_ts,
     )
-    await process_event(other_payload)
+    process_event_sync(other_payload)
 
     q_result = get_query_vector("user-1", "proj-1")
     candidates = load_candidate_items(project_id="proj-1")
-    scored = []
-    q_vec = np.array(q_result["q_vector"], dtype=float)
-    for c in candidates:
-        scored.append({**c, "sim_score": cosine_sim(q_vec, c["vector"])})
-    results = rerank_candidates(scored, "user-1", n=1)
+    sims = score_candidates(np.asarray(q_result["q_vector"], dtype=np.float32), candidates)
+    for c, sim in zip(candidates, sims.tolist()):
+        c["sim_score"] = sim
+    results = rerank_candidates(candidates, "user-1", n=1)
     assert results[0]["thread_ts"] == base_ts
     assert results[0]["force_included"] is True
 
 
-@pytest.mark.asyncio
-async def test_rerank_deterministic_order():
+def test_rerank_deterministic_order():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
-    first_ts = str(float(base_ts) + 0.01)
-    second_ts = str(float(base_ts) + 0.02)
-    await process_event(make_payload("Decision needed", thread_ts=first_ts, ts=first_ts))
-    await process_event(make_payload("Decision needed", thread_ts=second_ts, ts=second_ts))
+    first_ts = next_ts()
+    second_ts = next_ts()
+    process_event_batch_sync(
+        [
+            make_payload("Decision needed", thread_ts=first_ts, ts=first_ts),
+            make_payload("Decision needed", thread_ts=second_ts, ts=second_ts),
+        ]
+    )
 
     q_result = get_query_vector("user-1", "proj-1")
     candidates = load_candidate_items(project_id="proj-1")
-    q_vec = np.array(q_result["q_vector"], dtype=float)
-    scored = []
-    for c in candidates:
-        scored.append({**c, "sim_score": cosine_sim(q_vec, c["vector"])})
+    sims = score_candidates(np.asarray(q_result["q_vector"], dtype=np.float32), candidates)
+    for c, sim in zip(candidates, sims.tolist()):
+        c["sim_score"] = sim
 
-    results = rerank_candidates(scored, "user-1", n=2)
+    results = rerank_candidates(candidates, "user-1", n=2)
     assert results == sorted(
         results,
         key=lambda item: (
@@ -107,3 +108,51 @@ async def test_rerank_deterministic_order():
             item["thread_ts"],
         ),
     )
+
+
+def test_rerank_penalises_duplicates_and_breaks_near_ties():
+    now = time.time()
+
+    def candidate(thread_ts, vector, sim):
+        return {
+            "thread_ts": thread_ts,
+            "vector": np.array(vector, dtype=np.float32),
+            "sim_score": sim,
+            "urgency": 0.0,
+            "labels": [],
+            "updated_at": now,
+        }
+
+    candidates = [
+        candidate("3.000", [1.0, 0.0], 0.9),
+        candidate("2.000", [1.0, 0.0], 0.9),
+        candidate("1.000", [0.0, 1.0], 0.8),
+    ]
+    results = rerank_candidates(candidates, "user-1", n=3, lambda_diversity=0.5)
+    assert [r["thread_ts"] for r in results] == ["2.000", "1.000", "3.000"]
+    assert results[2]["diversity_penalty"] == pytest.approx(0.5)
+
+
+def test_rerank_masks_labels_when_candidates_have_no_stored_mask():
+    now = time.time()
+    candidates = [
+        {
+            "thread_ts": "1.000",
+            "vector": np.array([1.0, 0.0], dtype=np.float32),
+            "sim_score": 0.1,
+            "urgency": 0.9,
+            "labels": ["BLOCKER"],
+            "updated_at": now,
+        },
+        {
+            "thread_ts": "2.000",
+            "vector": np.array([0.0, 1.0], dtype=np.float32),
+            "sim_score": 0.9,
+            "urgency": 0.0,
+            "labels": [],
+            "updated_at": now,
+        },
+    ]
+    results = rerank_candidates(candidates, "user-1", n=1)
+    assert results[0]["thread_ts"] == "1.000"
+    assert results[0]["force_included"] is True
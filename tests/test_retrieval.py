@@ -8,7 +8,9 @@ from app import db
 from app.models import SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user, get_query_vector
 from app.retrieval import load_candidate_items, retrieve_top_k
-from app.workers import process_event
+from app.workers import process_event_batch_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -22,7 +24,7 @@ def setup_db(tmp_path, monkeypatch):
 
 
 def seed_carbon_thread():
-    base_ts = str(time.time())
+    base_ts = next_ts()
     messages = [
         (
             "Decision needed: switch from aluminum to carbon fiber for EVT build.",
@@ -34,7 +36,7 @@ def seed_carbon_thread():
         ),
     ]
     for idx, (text, user) in enumerate(messages):
-        ts = str(float(base_ts) + idx * 0.001)
+        ts = base_ts if idx == 0 else next_ts()
         payload = SlackEventPayload(
             event_id=f"evt-{uuid.uuid4().hex}",
             event_time=int(time.time()),
@@ -53,39 +55,36 @@ def seed_carbon_thread():
         yield payload
 
 
-@pytest.mark.asyncio
-async def test_retrieval_returns_thread():
+def test_retrieval_returns_thread():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    for payload in seed_carbon_thread():
-        await process_event(payload)
+    process_event_batch_sync(seed_carbon_thread())
 
     q_result = get_query_vector("user-1", "proj-1")
     candidates = load_candidate_items(project_id="proj-1")
-    results = retrieve_top_k(np.array(q_result["q_vector"]), candidates, k=10)
+    results = retrieve_top_k(np.asarray(q_result["q_vector"], dtype=np.float32), candidates, k=10)
     assert any(r["thread_ts"] == candidates[0]["thread_ts"] for r in results)
 
 
-@pytest.mark.asyncio
-async def test_retrieval_tiebreaks_deterministically():
+def test_retrieval_tiebreaks_deterministically():
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
     create_user("user-1", "Ari", "role-1")
     db.add_project_channel("proj-1", "C001")
 
-    base_ts = str(time.time())
     messages = [
         ("Decision needed", "U001"),
         ("Decision needed", "U002"),
     ]
     thread_ids = []
-    for idx, (text, user) in enumerate(messages):
-        ts = str(float(base_ts) + idx * 0.01)
+    payloads = []
+    for text, user in messages:
+        ts = next_ts()
         payload = SlackEventPayload(
             event_id=f"evt-{uuid.uuid4().hex}",
             event_time=int(time.time()),
@@ -102,13 +101,37 @@ async def test_retrieval_tiebreaks_deterministically():
             },
         )
         thread_ids.append(ts)
-        await process_event(payload)
+        payloads.append(payload)
+    process_event_batch_sync(payloads)
 
     q_result = get_query_vector("user-1", "proj-1")
     candidates = load_candidate_items(project_id="proj-1")
-    results = retrieve_top_k(np.array(q_result["q_vector"]), candidates, k=2)
+    results = retrieve_top_k(np.asarray(q_result["q_vector"], dtype=np.float32), candidates, k=2)
     assert results[0]["thread_ts"] != results[1]["thread_ts"]
     assert results == sorted(
         results,
         key=lambda item: (-item["score"], -item["urgency"], -item["updated_at"], item["thread_ts"]),
     )
+
+
+def test_retrieve_top_k_partition_keeps_tiebreakers():
+    vector = np.array([1.0, 0.0], dtype=np.float32)
+    candidates = [
+        {"thread_ts": f"{i}.000", "vector": vector, "urgency": 0.1 * (i % 3), "updated_at": float(i)}
+        for i in range(6)
+    ]
+    candidates.append({"thread_ts": "9.000", "vector": np.zeros(2, dtype=np.float32), "urgency": 1.0, "updated_at": 9.0})
+    results = retrieve_top_k(np.array([1.0, 0.0]), candidates, k=2)
+    assert [r["thread_ts"] for r in results] == ["5.000", "2.000"]
+    assert results[0]["score"] == 1.0
+
+
+def test_load_candidate_items_filters_labels_in_sql():
+    now = time.time()
+    for ts, labels in (("1.000", ["DECISION", "RISK"]), ("2.000", ["FYI"]), ("3.000", None)):
+        db.upsert_digest_item(ts, "C001", "Title", labels or [], {}, 0.5, "Summary")
+        db.upsert_embedding(ts, 2, [1.0, 0.0])
+    results = load_candidate_items(channels=["C001"], since_ts=now - 60, label_filter=["risk"])
+    assert [c["thread_ts"] for c in results] == ["1.000"]
+    assert results[0]["labels"] == ["DECISION", "RISK"]
+    assert len(load_candidate_items(channels=["C001"], since_ts=now - 60)) == 3
@@ -1,14 +1,19 @@
+import asyncio
 import time
 import uuid
+from datetime import datetime, timezone
 
+import orjson
 import pytest
-from fastapi.testclient import TestClient
 
 from app import db
-from app.main import app
+from app.delivery import deliver_digest, deliver_digests_bulk
 from app.models import SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user
-from app.workers import process_event
+from app.scheduling import _next_fire, notify_schedule_changed, scheduler_loop
+from app.workers import process_event_sync
+
+from helpers import next_ts
 
 
 @pytest.fixture(autouse=True)
@@ -39,8 +44,7 @@ def make_payload(text: str, channel: str, ts: str, thread_ts: str, user: str = "
     )
 
 
-@pytest.mark.asyncio
-async def test_run_now_creates_delivery(monkeypatch):
+def test_run_now_creates_delivery(client, monkeypatch):
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
@@ -48,8 +52,8 @@ async def test_run_now_creates_delivery(monkeypatch):
     db.add_project_channel("proj-1", "C001")
     db.add_user_channel("user-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(make_payload("Decision needed", "C001", base_ts, base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_payload("Decision needed", "C001", base_ts, base_ts))
 
     def fake_slack_api_call(team_id, method, params=None):
         if method == "conversations.open":
@@ -61,7 +65,6 @@ async def test_run_now_creates_delivery(monkeypatch):
 
     monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
 
-    client = TestClient(app)
     resp = client.post(
         "/schedules",
         json={
@@ -81,8 +84,7 @@ async def test_run_now_creates_delivery(monkeypatch):
     assert deliveries is not None
 
 
-@pytest.mark.asyncio
-async def test_run_now_idempotent(monkeypatch):
+def test_run_now_idempotent(client, monkeypatch):
     create_role("role-1", "PM", "Owns delivery timelines and decisions")
     create_phase("EVT", "Engineering validation testing phase")
     create_project("proj-1", "Alpha", "EVT")
@@ -90,8 +92,8 @@ async def test_run_now_idempotent(monkeypatch):
     db.add_project_channel("proj-1", "C001")
     db.add_user_channel("user-1", "C001")
 
-    base_ts = str(time.time())
-    await process_event(make_payload("Decision needed", "C001", base_ts, base_ts))
+    base_ts = next_ts()
+    process_event_sync(make_payload("Decision needed", "C001", base_ts, base_ts))
 
     async def fake_call(team_id, method, params=None):
         if method == "conversations.open":
@@ -100,7 +102,6 @@ async def test_run_now_idempotent(monkeypatch):
 
     monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
 
-    client = TestClient(app)
     resp = client.post(
         "/schedules",
         json={
@@ -117,3 +118,194 @@ async def test_run_now_idempotent(monkeypatch):
     second = client.post(f"/schedules/{schedule_id}/run_now")
     assert first.json()["status"] == "delivered"
     assert second.json()["status"] in {"already_delivered", "duplicate"}
+
+
+@pytest.mark.asyncio
+async def test_deliver_digests_bulk_fans_out(monkeypatch):
+    calls = []
+
+    async def fake_call(team_id, method, params=None):
+        calls.append(method)
+        if method == "conversations.open":
+            return {"channel": {"id": f"D-{params['users']}"}}
+        return {"ok": True, "ts": "123.456"}
+
+    monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
+    results = await deliver_digests_bulk(
+        [
+            ("dig-1", "T001", "user-1", [{"title": "A", "why_shown": "High urgency"}]),
+            ("dig-2", "T001", "user-2", [{"title": "B", "why_shown": "Semantic similarity"}]),
+        ]
+    )
+    assert [result["status"] for result in results] == ["delivered", "delivered"]
+    assert calls.count("chat.postMessage") == 2
+    assert db.fetch_delivery_by_digest("dig-2") is not None
+
+
+@pytest.mark.asyncio
+async def test_dm_channel_is_opened_once_per_user(monkeypatch):
+    calls = []
+
+    async def fake_call(team_id, method, params=None):
+        calls.append(method)
+        if method == "conversations.open":
+            return {"channel": {"id": "D999"}}
+        return {"ok": True, "ts": "123.456"}
+
+    monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
+    monkeypatch.setattr("app.delivery._DM_CHANNELS", {})
+    await deliver_digests_bulk([("dig-1", "T009", "user-9", []), ("dig-2", "T009", "user-9", [])])
+    assert calls.count("conversations.open") == 1
+    assert calls.count("chat.postMessage") == 2
+
+
+def freeze_mid_minute(monkeypatch) -> str:
+    # The loop reads the clock itself; pinning it to the middle of a minute
+    # keeps that minute's schedule due however long the test takes.
+    frozen = (int(time.time()) // 60) * 60 + 30.0
+    monkeypatch.setattr("app.scheduling.time.time", lambda: frozen)
+    now = datetime.fromtimestamp(frozen, tz=timezone.utc)
+    return orjson.dumps({"time_of_day": now.strftime("%H:%M"), "timezone": "UTC"}).decode()
+
+
+def test_next_fire_rolls_over_after_the_due_minute():
+    schedule = {"cron_json": '{"time_of_day": "09:00", "timezone": "UTC"}'}
+    nine = datetime(2024, 3, 1, 9, 0, tzinfo=timezone.utc).timestamp()
+    assert _next_fire(schedule, nine - 3600) == nine
+    assert _next_fire(schedule, nine + 30) == nine
+    assert _next_fire(schedule, nine + 60) == nine + 86400
+
+
+@pytest.mark.asyncio
+async def test_scheduler_loop_delivers_schedule_added_while_running(monkeypatch):
+    delivered = asyncio.Event()
+    calls = []
+
+    async def fake_deliver(due):
+        calls.extend(due)
+        delivered.set()
+        return []
+
+    monkeypatch.setattr("app.scheduling.build_digest", lambda user_id, project_id, n: {"digest_id": "dig-1", "items": []})
+    monkeypatch.setattr("app.scheduling.deliver_digests_bulk", fake_deliver)
+    stop = asyncio.Event()
+    task = asyncio.create_task(scheduler_loop(stop))
+    await asyncio.sleep(0)
+
+    cron_json = freeze_mid_minute(monkeypatch)
+    db.insert_schedule("sched-1", "T001", "proj-1", "user-1", cron_json, 1)
+    notify_schedule_changed("sched-1")
+    await asyncio.wait_for(delivered.wait(), timeout=5)
+    stop.set()
+    await asyncio.wait_for(task, timeout=5)
+    assert calls == [("dig-1", "T001", "user-1", [])]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_loop_delivers_once_for_duplicate_schedules(monkeypatch):
+    posted = []
+    digest_ids = iter(["dig-1", "dig-2"])
+
+    async def fake_call(team_id, method, params=None):
+        if method == "conversations.open":
+            return {"channel": {"id": "D123"}}
+        posted.append(params["channel"])
+        return {"ok": True, "ts": "123.456"}
+
+    deliver = deliver_digests_bulk
+    delivered = asyncio.Event()
+
+    async def tracking_deliver(due):
+        results = await deliver(due)
+        delivered.set()
+        return results
+
+    monkeypatch.setattr("app.scheduling.build_digest", lambda user_id, project_id, n: {"digest_id": next(digest_ids), "items": []})
+    monkeypatch.setattr("app.scheduling.deliver_digests_bulk", tracking_deliver)
+    monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
+    monkeypatch.setattr("app.delivery._DM_CHANNELS", {})
+    cron_json = freeze_mid_minute(monkeypatch)
+    db.insert_schedule("sched-1", "T001", "proj-1", "user-1", cron_json, 1)
+    db.insert_schedule("sched-2", "T001", "proj-1", "user-1", cron_json, 1)
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(scheduler_loop(stop))
+    await asyncio.wait_for(delivered.wait(), timeout=5)
+    stop.set()
+    await asyncio.wait_for(task, timeout=5)
+    assert posted == ["D123"]
+
+
+def test_create_schedule_rejects_malformed_time_of_day(client):
+    resp = client.post(
+        "/schedules",
+        json={
+            "team_id": "T001",
+            "project_id": "proj-1",
+            "user_id": "user-1",
+            "time_of_day": "9am",
+            "timezone": "UTC",
+        },
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_scheduler_loop_skips_schedules_with_bad_cron(monkeypatch):
+    delivered = asyncio.Event()
+    calls = []
+
+    async def fake_deliver(due):
+        calls.extend(due)
+        delivered.set()
+        return []
+
+    monkeypatch.setattr("app.scheduling.build_digest", lambda user_id, project_id, n: {"digest_id": "dig-1", "items": []})
+    monkeypatch.setattr("app.scheduling.deliver_digests_bulk", fake_deliver)
+    db.insert_schedule("sched-bad", "T001", "proj-1", "user-0", '{"time_of_day": "9", "timezone": "UTC"}', 1)
+    cron_json = freeze_mid_minute(monkeypatch)
+    db.insert_schedule("sched-1", "T001", "proj-1", "user-1", cron_json, 1)
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(scheduler_loop(stop))
+    await asyncio.wait_for(delivered.wait(), timeout=5)
+    stop.set()
+    await asyncio.wait_for(task, timeout=5)
+    assert calls == [("dig-1", "T001", "user-1", [])]
+
+
+@pytest.mark.asyncio
+async def test_deliver_digest_reopens_stale_dm_channel(monkeypatch):
+    calls = []
+    opened = iter(["D-old", "D-new"])
+
+    async def fake_call(team_id, method, params=None):
+        calls.append((method, params.get("channel")))
+        if method == "conversations.open":
+            return {"channel": {"id": next(opened)}}
+        if params["channel"] == "D-old":
+            return {"ok": False, "error": "channel_not_found"}
+        return {"ok": True, "ts": "123.456"}
+
+    monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
+    monkeypatch.setattr("app.delivery._DM_CHANNELS", {})
+    result = await deliver_digest("dig-1", "T001", "user-1", [])
+    assert result["status"] == "delivered"
+    assert result["slack_ts"] == "123.456"
+    assert [c for c in calls if c[0] == "chat.postMessage"] == [("chat.postMessage", "D-old"), ("chat.postMessage", "D-new")]
+
+
+@pytest.mark.asyncio
+async def test_deliver_digest_records_slack_errors_as_failed(monkeypatch):
+    async def fake_call(team_id, method, params=None):
+        if method == "conversations.open":
+            return {"channel": {"id": "D123"}}
+        return {"ok": False, "error": "not_authed"}
+
+    monkeypatch.setattr("app.delivery.slack_api_call", fake_call)
+    monkeypatch.setattr("app.delivery._DM_CHANNELS", {})
+    result = await deliver_digest("dig-2", "T001", "user-1", [])
+    assert result["status"] == "failed"
+    row = db.fetch_delivery_by_digest("dig-2")
+    assert row["status"] == "failed"
+    assert row["error"] == "not_authed"
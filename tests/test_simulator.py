@@ -1,15 +1,18 @@
-import json
+import asyncio
+import functools
 import time
+from typing import Tuple
 
+import numpy as np
 import pytest
-from fastapi.testclient import TestClient
 
 from app import db
-from app.main import app
-from app.models import SlackEventPayload
+from app.models import SLACK_EVENT_PAYLOADS, SlackEventPayload
 from app.profiles import create_phase, create_project, create_role, create_user
+from app.queueing import QueueManager
 from app.sim.dataset import SimClock, get_scenario_events
-from app.workers import process_event
+from app.sim.streamer import wait_until_idle
+from app.workers import process_event_batch_sync
 from app.digest import build_digest
 
 
@@ -23,34 +26,31 @@ def setup_db(tmp_path, monkeypatch):
     db.reset_db()
 
 
-def ingest_events(events):
-    for event in events:
-        payload = SlackEventPayload.model_validate(event)
-        yield payload
+@functools.lru_cache(maxsize=8)
+def scenario_payloads(scenario_id: str) -> Tuple[SlackEventPayload, ...]:
+    # SimClock and run_id are fixed, so every test sees the same events;
+    # they are validated once and shared read-only.
+    events = get_scenario_events(scenario_id, SimClock(), "test")
+    return tuple(SLACK_EVENT_PAYLOADS.validate_python(events))
 
 
 @pytest.mark.asyncio
-async def test_sim_events_endpoint_accepts_payload():
-    client = TestClient(app)
+async def test_sim_events_endpoint_accepts_payload(client):
     events = get_scenario_events("carbon_fiber_demo", SimClock(), "test")
     response = client.post("/sim/events", json=events[0])
     assert response.status_code == 200
     assert response.json()["status"] in {"queued", "duplicate"}
 
 
-@pytest.mark.asyncio
-async def test_streaming_builds_threads_and_items():
-    events = get_scenario_events("carbon_fiber_demo", SimClock(), "test")
-    for payload in ingest_events(events):
-        await process_event(payload)
+def test_streaming_builds_threads_and_items():
+    process_event_batch_sync(scenario_payloads("carbon_fiber_demo"))
     threads = db.fetch_threads(10)
     items = db.fetch_items(10)
     assert len(threads) >= 4
     assert len(items) >= 4
 
 
-@pytest.mark.asyncio
-async def test_digest_differs_by_role_and_phase():
+def test_digest_differs_by_role_and_phase():
     create_role("role-me", "ME", "materials structures weight manufacturability")
     create_role("role-supply", "Supply", "vendors lead times MOQ sourcing risk")
     create_role("role-pm", "PM", "timeline decisions owners milestones")
@@ -67,9 +67,7 @@ async def test_digest_differs_by_role_and_phase():
         db.add_user_channel(user_id, "C_DRONE_STRUCT")
         db.add_user_channel(user_id, "C_DRONE_SUPPLY")
 
-    events = get_scenario_events("carbon_fiber_demo", SimClock(), "test")
-    for payload in ingest_events(events):
-        await process_event(payload)
+    process_event_batch_sync(scenario_payloads("carbon_fiber_demo"))
 
     digest_me = build_digest("U_MAYA", "proj-1", n=5)["items"]
     digest_supply = build_digest("U_SAM", "proj-1", n=5)["items"]
@@ -85,8 +83,7 @@ async def test_digest_differs_by_role_and_phase():
     assert [item["title"] for item in digest_me_dvt] != [item["title"] for item in digest_me]
 
 
-@pytest.mark.asyncio
-async def test_feedback_changes_user_vector():
+def test_feedback_changes_user_vector():
     create_role("role-supply", "Supply", "vendors lead times MOQ sourcing risk")
     create_phase("EVT", "early prototype build, unblock near-term decisions")
     create_project("proj-1", "DroneV2", "EVT")
@@ -94,21 +91,37 @@ async def test_feedback_changes_user_vector():
     create_user("U_SAM", "Sam", "role-supply")
     db.add_user_channel("U_SAM", "C_DRONE_SUPPLY")
 
-    events = get_scenario_events("carbon_fiber_demo", SimClock(), "test")
-    for payload in ingest_events(events):
-        await process_event(payload)
+    process_event_batch_sync(scenario_payloads("carbon_fiber_demo"))
 
-    items = db.fetch_items(10)
-    supply_item = next(item for item in items if "Vendor" in (item["summary"] or ""))
-    thread_ts = supply_item["thread_ts"]
+    thread_ts = db.fetch_items_matching(1, "Vendor")[0]["thread_ts"]
     emb = db.fetch_embedding(thread_ts)
-    v = json.loads(emb["vector_json"])
-    user_before = json.loads(db.fetch_user("U_SAM")["user_vector_json"])
-    dot_before = sum(a * b for a, b in zip(user_before, v))
+    v = db.unpack_vector(emb["vector"])
+    user_before = db.unpack_vector(db.fetch_user("U_SAM")["user_vector"])
+    dot_before = float(np.dot(user_before, v))
 
     from app.feedback import apply_feedback
 
     apply_feedback("U_SAM", "proj-1", thread_ts, "thumbs_up")
-    user_after = json.loads(db.fetch_user("U_SAM")["user_vector_json"])
-    dot_after = sum(a * b for a, b in zip(user_after, v))
+    user_after = db.unpack_vector(db.fetch_user("U_SAM")["user_vector"])
+    dot_after = float(np.dot(user_after, v))
     assert dot_after > dot_before
+
+
+@pytest.mark.asyncio
+async def test_wait_until_idle_waits_for_processed_events(monkeypatch):
+    queues = QueueManager()
+    monkeypatch.setattr("app.sim.streamer.QUEUES", queues)
+    queues.standard.put_nowait("event")
+    assert await wait_until_idle(0.05) is False
+
+    async def finish():
+        await queues.standard.get()
+        queues.standard.task_done()
+
+    asyncio.get_running_loop().call_later(0.01, lambda: asyncio.ensure_future(finish()))
+    assert await wait_until_idle(1.0) is True
+
+
+def test_sim_events_rejects_invalid_payload(client):
+    assert client.post("/sim/events", content=b"{not json").status_code == 400
+    assert client.post("/sim/events", json={"type": "event_callback"}).status_code == 400
@@ -3,13 +3,12 @@ import hashlib
 import json
 import time
 
+import orjson
 import pytest
 import httpx
-from fastapi.testclient import TestClient
 
 from app import db
 from app.ingest import verify_slack_signature
-from app.main import app
 from app.slack import exchange_code_for_token, store_workspace_token
 
 
@@ -24,7 +23,7 @@ def setup_db(tmp_path, monkeypatch):
 
 
 def _sign(secret: str, timestamp: str, body: bytes) -> str:
-    base = f"v0:{timestamp}:{body.decode('utf-8')}".encode("utf-8")
+    base = b"v0:" + timestamp.encode("utf-8") + b":" + body
     digest = hmac.new(secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
     return f"v0={digest}"
 
@@ -36,6 +35,9 @@ def test_signature_verification():
     signature = _sign(secret, timestamp, body)
     assert verify_slack_signature(body, timestamp, signature, secret) is True
     assert verify_slack_signature(body, timestamp, "v0=bad", secret) is False
+    assert verify_slack_signature(body, timestamp, "v0=" + "0" * 64, secret) is False
+    assert verify_slack_signature(body, timestamp, "v1=" + signature[3:], secret) is False
+    assert verify_slack_signature(body, timestamp, "v0=" + "z" * 64, secret) is False
 
 
 @pytest.mark.asyncio
@@ -61,15 +63,15 @@ async def test_oauth_token_storage(monkeypatch):
     row = db.fetch_slack_workspace("T123")
     assert row is not None
     assert row["access_token"] == "xoxb-test"
+    assert orjson.loads(row["scopes_json"]) == ["chat:write", "channels:read"]
 
 
-def test_url_verification_challenge(monkeypatch):
+def test_url_verification_challenge(client, monkeypatch):
     monkeypatch.setenv("SLACK_SIGNING_SECRET", "secret")
     payload = {"type": "url_verification", "challenge": "abc"}
     body = json.dumps(payload).encode("utf-8")
     timestamp = str(int(time.time()))
     signature = _sign("secret", timestamp, body)
-    client = TestClient(app)
     response = client.post(
         "/slack/events",
         data=body,